@@ -1,7 +1,21 @@
-from pydantic import Field
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class LLMCallPolicy(BaseModel):
+    # Overall budget for a call, including queueing, retries and backoff
+    deadline_seconds: float = 60.0
+    # Budget for a single provider request
+    attempt_timeout_seconds: float = 30.0
+    max_retries: int = 2
+    backoff_base_seconds: float = 0.5
+    backoff_max_seconds: float = 8.0
+    # Race a duplicate request once an attempt runs longer than hedge_after_seconds
+    # (or the observed p95 latency for this prompt when unset)
+    hedge: bool = False
+    hedge_after_seconds: float | None = None
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -10,6 +24,104 @@ class Settings(BaseSettings):
     gemini_model: str = "gemini-3-flash-preview"
     gemini_sim_model: str = "gemini-3-flash-preview"
     gemini_quiz_model: str = "gemini-3-flash-preview"
+    # Max in-flight Gemini requests per model; overrides keyed by model name (JSON in env)
+    gemini_max_concurrency: int = 8
+    gemini_model_concurrency: dict[str, int] = {}
+    # "genai" talks to Gemini; "record" also appends responses to llm_replay_path;
+    # "replay" answers offline from that file with llm_replay_latency
+    # ("none", "fixed:<s>", "uniform:<min>:<max>", "lognormal:<median>:<sigma>")
+    llm_backend: str = "genai"
+    llm_replay_path: str = "llm_recordings.jsonl"
+    llm_replay_latency: str = "none"
+    llm_replay_seed: int = 0
+    llm_replay_miss_text: str | None = None
+    # Response cache for identical prompts; llm_cache_backend is "memory", "mongo" or "disk"
+    llm_cache_enabled: bool = True
+    llm_cache_max_entries: int = 512
+    llm_cache_ttl_seconds: float = 6 * 60 * 60
+    llm_cache_backend: str = "memory"
+    llm_cache_dir: str = ".llm_cache"
+    # Per-prompt call policies keyed by prompt name; unlisted prompts use llm_default_policy
+    llm_default_policy: LLMCallPolicy = LLMCallPolicy()
+    llm_policies: dict[str, LLMCallPolicy] = {
+        "pipeline_decision": LLMCallPolicy(deadline_seconds=30, attempt_timeout_seconds=15, hedge=True),
+        "flashcard_generation": LLMCallPolicy(deadline_seconds=30, attempt_timeout_seconds=15, hedge=True),
+        # A batch answers up to flashcard_batch_size cards; missed cards fall back to single calls
+        "flashcard_batch_generation": LLMCallPolicy(deadline_seconds=45, attempt_timeout_seconds=25),
+        "quiz_generation": LLMCallPolicy(deadline_seconds=45, attempt_timeout_seconds=20),
+        "simulation": LLMCallPolicy(deadline_seconds=240, attempt_timeout_seconds=180, max_retries=1),
+        "simulation_concept": LLMCallPolicy(deadline_seconds=30, attempt_timeout_seconds=15, hedge=True),
+    }
+    # USD per million tokens by model, e.g. {"gemini-3-flash-preview": {"input": 0.5, "output": 3.0, "cached_input": 0.05}}
+    llm_pricing: dict[str, dict[str, float]] = {}
+    # Minimum trigram similarity for a cached simulation to be reused for a different concept name
+    simulation_cache_match_threshold: float = 0.75
+    # Bounds for simulation_cache (0 = unbounded); unliked entries are evicted by "lfu" or "lru"
+    simulation_cache_max_entries: int = 2000
+    simulation_cache_max_bytes: int = 256 * 1024 * 1024
+    simulation_cache_eviction: str = "lfu"
+    # In-memory LRU budget for compressed simulation HTML served from /simulations/{hash}
+    simulation_artifact_memory_bytes: int = 32 * 1024 * 1024
+    # Warm the simulation cache from a class's earlier lectures when a lecture is created
+    simulation_prefetch_enabled: bool = False
+    simulation_prefetch_max_concepts: int = 5
+    simulation_prefetch_half_life_days: float = 14.0
+    simulation_prefetch_related_weight: float = 0.5
+    # Bulk cache warming (warm_simulation_cache.py and /admin/simulations/warm)
+    simulation_warm_workers: int = 4
+    simulation_warm_rate_per_minute: float = 20.0
+    # Users allowed to call /admin endpoints
+    admin_user_ids: list[str] = []
+    # Minify generated simulation HTML and link the shared runtime stylesheet
+    simulation_postprocess: bool = True
+    # Public origin of this API; simulations render in srcdoc iframes and need absolute asset URLs
+    public_api_url: str = "http://127.0.0.1:8000"
+    # Lectures whose simulations are kept in memory for per-lecture dedupe
+    simulation_registry_max_lectures: int = 256
+    # Recent transcript chunks given to pipeline stages as context, bounded by count and characters (~4 per token)
+    lecture_context_max_chunks: int = 4
+    lecture_context_max_chars: int = 6000
+    # Lectures whose recent chunks are kept in memory
+    lecture_context_max_lectures: int = 256
+    # Merge transcript commits until a window holds this many characters and ends a sentence (0 = no merging)
+    transcript_window_min_chars: int = 160
+    # Flush a window at this size even mid-sentence
+    transcript_window_max_chars: int = 1200
+    # Longest a commit waits in a window before the pipeline sees it
+    transcript_window_max_latency_seconds: float = 3.0
+    # Background pipeline tasks (searches, quizzes, flashcards, simulations) running at once, overall and per websocket
+    background_max_concurrency: int = 64
+    background_max_per_connection: int = 16
+    # Tasks waiting for a slot, overall and per websocket
+    background_max_queue: int = 512
+    background_max_queue_per_connection: int = 128
+    # Per-websocket slots only critical and high tasks (transcripts, quizzes, flashcards) may use
+    background_reserved_per_connection: int = 4
+    # Running-task caps per priority class, so long simulations can't take every slot
+    background_priority_limits: dict[str, int] = {"low": 32}
+    # What a full queue does with a new task of each priority: "reject" it or "drop_lowest" queued work
+    background_overflow: dict[str, str] = {
+        "critical": "drop_lowest",
+        "high": "drop_lowest",
+        "normal": "drop_lowest",
+        "low": "reject",
+    }
+    # Websocket results produced within this window are merged into one frame
+    ws_coalesce_seconds: float = 0.05
+    # Sequence-numbered results kept per lecture for clients resuming after a reconnect
+    ws_replay_max_frames: int = 500
+    ws_replay_max_lectures: int = 256
+    # Stream simulation HTML to the client as simulation_progress frames while it is generated
+    simulation_streaming: bool = True
+    simulation_progress_interval_seconds: float = 0.25
+    # Stream the pipeline_decision response and dispatch each action as soon as it is parsed
+    pipeline_streaming: bool = True
+    # Re-read prompt files when they change on disk (useful while iterating on prompts)
+    prompt_hot_reload: bool = False
+    # TTL for provider-side cached content holding static prompt prefixes; 0 disables it
+    gemini_context_cache_ttl_seconds: int = 3600
+    # Max flashcards requested from the model in one batched call
+    flashcard_batch_size: int = 8
     google_api_key: str = ""
     google_search_cx: str = ""
     elevenlabs_api_key: str | None = None
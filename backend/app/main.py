@@ -1,11 +1,11 @@
 import asyncio
+import gzip
 import json
 import time
 import uuid
-from pathlib import Path
 from typing import Any
 
-from fastapi import Depends, FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
@@ -44,6 +44,7 @@ from .schemas import (
     VideoSearchResponse,
     WalkthroughRequest,
     WalkthroughResponse,
+    WarmSimulationsRequest,
     Flashcard,
     Question,
     Quiz,
@@ -58,9 +59,25 @@ from .services.auth import (
 from .services.elevenlabs import ElevenLabsClient
 from .services.gemini import GeminiClient
 from .services.google_search import GoogleSearchService
+from .services.lecture_context import LectureContextStore
+from .services.lecture_sequencer import LectureSequencer
+from .services.llm_cache import DiskCacheStore, MongoCacheStore, ResponseCache
+from .services.llm_gateway import LLMGateway
+from .services.llm_metrics import LLMMetrics
+from .services.llm_replay import LatencyModel, RecordingClient, RecordingStore, ReplayClient
+from .services.outbound import OutboundChannel
 from .services.pipeline import PipelineService
+from .services.prompts import prompts
 from .services.quiz import QuizService
-from .services.simulation import SimulationService
+from .services.result_replay import ResultReplayBuffer
+from .services.simulation import SimulationService, is_generation_error, normalize_concept
+from .services.simulation_artifacts import SimulationArtifactStore
+from .services.simulation_html import RUNTIME_CSS_NAME, runtime_css
+from .services.simulation_prefetch import SimulationPrefetcher
+from .services.simulation_registry import LectureSimulationRegistry
+from .services.simulation_warmer import SimulationWarmJob, concept_entries, concepts_from_query
+from .services.task_scheduler import BackgroundScheduler
+from .services.transcript_window import TranscriptWindow
 from .services.youtube import YouTubeClient
 
 app = FastAPI(title="Interactable API", version="0.1.0")
@@ -122,29 +139,104 @@ CREDITS: dict[str, int] = {}
 SHARES: dict[str, ShareResponse] = {}
 USERS: dict[str, dict[str, str]] = {}
 SESSIONS: dict[str, str] = {}
+WARM_JOBS: dict[str, SimulationWarmJob] = {}
+
+llm_backend_client = None
+if settings.llm_backend == "replay":
+    llm_backend_client = ReplayClient(
+        RecordingStore(settings.llm_replay_path),
+        latency=LatencyModel(settings.llm_replay_latency),
+        seed=settings.llm_replay_seed,
+        miss_text=settings.llm_replay_miss_text,
+    )
+elif settings.llm_backend == "record":
+    from google import genai
+
+    llm_backend_client = RecordingClient(
+        genai.Client(api_key=settings.gemini_api_key or "", http_options={'api_version': 'v1beta'}),
+        RecordingStore(settings.llm_replay_path),
+    )
 
-gemini_client = GeminiClient(settings.gemini_api_key or "", settings.gemini_model)
-simulation_client = GeminiClient(settings.gemini_api_key or "", settings.gemini_sim_model)
-quiz_client = GeminiClient(settings.gemini_api_key or "", settings.gemini_quiz_model)
+llm_gateway = LLMGateway(
+    settings.gemini_api_key or "",
+    default_limit=settings.gemini_max_concurrency,
+    model_limits=settings.gemini_model_concurrency,
+    client=llm_backend_client,
+)
+llm_cache = None
+if settings.llm_cache_enabled:
+    llm_cache_store = None
+    if settings.llm_cache_backend == "mongo" and db is not None:
+        llm_cache_store = MongoCacheStore(db.llm_response_cache)
+    elif settings.llm_cache_backend == "disk":
+        llm_cache_store = DiskCacheStore(settings.llm_cache_dir)
+    llm_cache = ResponseCache(
+        max_entries=settings.llm_cache_max_entries,
+        ttl_seconds=settings.llm_cache_ttl_seconds,
+        store=llm_cache_store,
+    )
+llm_metrics = LLMMetrics(pricing=settings.llm_pricing)
+llm_client_options = {
+    "gateway": llm_gateway,
+    "cache": llm_cache,
+    "policies": settings.llm_policies,
+    "default_policy": settings.llm_default_policy,
+    "context_cache_ttl_seconds": settings.gemini_context_cache_ttl_seconds or None,
+    "metrics": llm_metrics,
+}
+gemini_client = GeminiClient(settings.gemini_api_key or "", settings.gemini_model, **llm_client_options)
+simulation_client = GeminiClient(settings.gemini_api_key or "", settings.gemini_sim_model, **llm_client_options)
+quiz_client = GeminiClient(settings.gemini_api_key or "", settings.gemini_quiz_model, **llm_client_options)
 elevenlabs_client = ElevenLabsClient(settings.elevenlabs_api_key or "")
 youtube_client = YouTubeClient()
 google_search_service = GoogleSearchService(gemini_client)
-simulation_service = SimulationService(simulation_client)
+simulation_artifacts = SimulationArtifactStore(
+    db.simulation_artifacts if db is not None else None,
+    max_memory_bytes=settings.simulation_artifact_memory_bytes,
+)
+simulation_service = SimulationService(
+    simulation_client,
+    match_threshold=settings.simulation_cache_match_threshold,
+    concept_client=gemini_client,
+    artifacts=simulation_artifacts,
+    max_entries=settings.simulation_cache_max_entries,
+    max_bytes=settings.simulation_cache_max_bytes,
+    eviction_policy=settings.simulation_cache_eviction,
+    postprocess=settings.simulation_postprocess,
+    runtime_url=f"{settings.public_api_url.rstrip('/')}/static/{RUNTIME_CSS_NAME}",
+)
 quiz_service = QuizService(quiz_client)
-pipeline_service = PipelineService(gemini_client, youtube_client, simulation_service)
-
-PROMPT_DIR = Path(__file__).parent / "prompts"
-PROMPT_CACHE: dict[str, str] = {}
-
-
-def load_prompt(name: str) -> str:
-    if name in PROMPT_CACHE:
-        return PROMPT_CACHE[name]
-    path = PROMPT_DIR / f"{name}.md"
-    text = path.read_text(encoding="utf-8")
-    PROMPT_CACHE[name] = text
-    return text
+simulation_registry = LectureSimulationRegistry(max_lectures=settings.simulation_registry_max_lectures)
+simulation_prefetcher = SimulationPrefetcher(
+    simulation_service,
+    max_concepts=settings.simulation_prefetch_max_concepts,
+    half_life_days=settings.simulation_prefetch_half_life_days,
+    related_weight=settings.simulation_prefetch_related_weight,
+)
+pipeline_service = PipelineService(gemini_client, youtube_client, simulation_service, streaming=settings.pipeline_streaming)
+lecture_sequencer = LectureSequencer(stages=("transcript", "commit"))
+result_replay = ResultReplayBuffer(
+    max_frames=settings.ws_replay_max_frames,
+    max_lectures=settings.ws_replay_max_lectures,
+)
+lecture_context = LectureContextStore(
+    max_chunks=settings.lecture_context_max_chunks,
+    max_chars=settings.lecture_context_max_chars,
+    max_lectures=settings.lecture_context_max_lectures,
+)
+background_scheduler = BackgroundScheduler(
+    max_concurrency=settings.background_max_concurrency,
+    max_per_owner=settings.background_max_per_connection,
+    max_queue=settings.background_max_queue,
+    max_queue_per_owner=settings.background_max_queue_per_connection,
+    reserved_per_owner=settings.background_reserved_per_connection,
+    priority_limits=settings.background_priority_limits,
+    overflow=settings.background_overflow,
+)
 
+@app.on_event("startup")
+async def load_simulation_cache_index():
+    await simulation_service.load_cache_index(db)
 
 # Auth Dependency
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
@@ -172,11 +264,39 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     return user
 
 
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user.get("user_id") not in settings.admin_user_ids:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
 @app.get("/health")
 def health() -> dict[str, str]:
     return {"status": "ok", "environment": settings.environment}
 
 
+@app.get("/metrics")
+def metrics() -> dict[str, Any]:
+    """
+    Per-prompt Gemini latency, queueing, token and cost histograms.
+    """
+    return {"llm": llm_metrics.snapshot()}
+
+
+@app.get("/llm/stats")
+def llm_stats() -> dict[str, Any]:
+    return {
+        "gateway": llm_gateway.stats(),
+        "cache": llm_cache.stats() if llm_cache else None,
+        "simulation_cache": simulation_service.cache_stats(),
+        "lecture_simulations": simulation_registry.stats(),
+        "background_tasks": background_scheduler.stats(),
+        "lecture_sequencer": lecture_sequencer.stats(),
+        "lecture_context": lecture_context.stats(),
+        "result_replay": result_replay.stats(),
+    }
+
+
 @app.get("/users/me")
 async def read_users_me(current_user: dict = Depends(get_current_user)):
     return {
@@ -228,49 +348,147 @@ def login(payload: AuthLoginRequest) -> AuthLoginResponse:
     return AuthLoginResponse(user_id=user["user_id"], token=token)
 
 
+async def simulation_asset(code: str) -> dict:
+    """
+    Stores simulation HTML in the artifact store and returns the fields that reference it,
+    or the HTML itself to keep inline if the store could not take it.
+    """
+    try:
+        digest = await simulation_artifacts.put_async(code)
+    except Exception as e:
+        print(f"Error storing simulation artifact, keeping the HTML inline: {e}")
+        return {"code": code}
+    return {"code_hash": digest, "asset_url": SimulationArtifactStore.asset_url(digest)}
+
+
+async def load_lecture_simulations(lecture_id: str):
+    """
+    Seeds the per-lecture simulation registry with the lecture's stored ready simulations.
+    """
+    if db is None or simulation_registry.is_loaded(lecture_id):
+        return
+    try:
+        docs = await asyncio.to_thread(
+            lambda: list(db.simulations.find(
+                {"lecture_id": lecture_id, "status": "ready"},
+                {"_id": 0, "concept": 1, "description": 1, "code_hash": 1, "asset_url": 1, "code": 1}
+            ))
+        )
+        simulation_registry.load(lecture_id, docs)
+    except Exception as e:
+        print(f"Error loading simulations for lecture {lecture_id}: {e}")
+
+
+def persist_simulation(lecture_id: str, sim: dict, origin: str | None = None):
+    """
+    Upserts the lecture's single db.simulations document for a concept.
+    """
+    # The HTML lives in the artifact store, unless it could not be stored there
+    fields = {k: v for k, v in sim.items() if k != "code" or not sim.get("code_hash")}
+    fields.update({"lecture_id": lecture_id, "concept_key": normalize_concept(sim["concept"]), "updated_at": time.time()})
+    if origin:
+        fields["origin"] = origin
+    update = {"$set": fields, "$setOnInsert": {"timestamp": time.time()}}
+    if sim.get("code_hash"):
+        update["$unset"] = {"code": ""}
+    db.simulations.update_one(
+        {"lecture_id": lecture_id, "concept_key": fields["concept_key"]},
+        update,
+        upsert=True
+    )
+
+
+async def run_lecture_simulation(websocket: WebSocket, lecture_id: str, sim_request: dict, generate, origin: str | None = None):
+    """
+    Runs `generate` unless the lecture already has (or is generating) a simulation for
+    the concept, then sends the result under this request's concept_id. Only the request
+    that generated the simulation persists it, and it does so inside the registry's job,
+    so the simulation is still saved if this caller is cancelled by a disconnect.
+    """
+    concept = sim_request["concept"]
+
+    async def generate_and_persist():
+        result = await generate()
+        if result is not None and db is not None:
+            ready = {**sim_request, **{k: v for k, v in result.items() if k != "concept"}, "status": "ready"}
+            await asyncio.to_thread(persist_simulation, lecture_id, ready, origin)
+        return result
+
+    result, owner = await simulation_registry.run(lecture_id, concept, generate_and_persist)
+    if result is None:
+        sim_obj = {**sim_request, "status": "error"}
+    else:
+        sim_obj = {**sim_request, **{k: v for k, v in result.items() if k != "concept"}, "status": "ready"}
+        if not owner:
+            print(f"DEBUG: Reusing lecture simulation for {concept}")
+
+    try:
+        await websocket.send_json({
+            "type": "pipeline_result",
+            "lecture_id": lecture_id,
+            "results": {
+                "concepts": [],
+                "videos": [],
+                "simulations": [sim_obj],
+                "quizzes": [],
+                "flashcards": []
+            }
+        })
+        print(f"DEBUG: Background simulation for {concept} completed and sent.")
+    except Exception as e:
+        print(f"Could not send background simulation result (client likely disconnected): {e}")
+
+
+async def generated_simulation(code: str, description: str | None) -> dict | None:
+    if is_generation_error(code):
+        return None
+    return {"description": description, **(await simulation_asset(code))}
+
+
 async def run_simulation_background(websocket: WebSocket, simulation_service: SimulationService, sim_request: dict, lecture_id: str, previous_context: str, text: str):
     try:
         concept = sim_request["concept"]
         print(f"DEBUG: Starting background simulation for {concept}")
-        
-        # Invisibility: generate_simulation handles cache internally
-        code = await simulation_service.generate_simulation(
-            db=db,
-            concept=concept,
-            description=sim_request["description"],
-            context=f"{previous_context}\n\nRecent Transcript: {text}"
-        )
-        
-        # Send update to client
-        try:
-            await websocket.send_json({
-                "type": "pipeline_result",
-                "lecture_id": lecture_id,
-                "results": {
-                    "concepts": [],
-                    "videos": [],
-                    "simulations": [{
-                        **sim_request,
-                        "status": "ready",
-                        "code": code
-                    }]
-                }
-            })
-            print(f"DEBUG: Background simulation for {concept} completed and sent.")
 
-            # Persist simulation
-            if db is not None:
-                sim_doc = {
+        sent_chars = 0
+        last_sent_at = 0.0
+
+        streaming = settings.simulation_streaming
+
+        async def send_progress(partial_code: str):
+            # Forward only the newly generated slice, at most once per interval
+            nonlocal sent_chars, last_sent_at, streaming
+            now = time.monotonic()
+            if not streaming or now - last_sent_at < settings.simulation_progress_interval_seconds or len(partial_code) <= sent_chars:
+                return
+            try:
+                await websocket.send_json({
+                    "type": "simulation_progress",
                     "lecture_id": lecture_id,
                     "concept": concept,
-                    "description": sim_request.get("description"),
-                    "code": code,
-                    "status": "ready",
-                    "timestamp": time.time()
-                }
-                db.simulations.insert_one(sim_doc)
-        except Exception as e:
-            print(f"Could not send background simulation result (client likely disconnected): {e}")
+                    "concept_id": sim_request.get("concept_id"),
+                    "offset": sent_chars,
+                    "delta": partial_code[sent_chars:]
+                })
+                sent_chars = len(partial_code)
+                last_sent_at = now
+            except Exception as e:
+                # The generation carries on for the cache; stop streaming to a closed socket
+                streaming = False
+                print(f"Could not send simulation progress for {concept}: {e}")
+
+        async def generate():
+            # Invisibility: generate_simulation handles cache internally
+            code = await simulation_service.generate_simulation(
+                db=db,
+                concept=concept,
+                description=sim_request["description"],
+                context=f"{previous_context}\n\nRecent Transcript: {text}",
+                on_progress=send_progress if streaming else None
+            )
+            return await generated_simulation(code, sim_request.get("description"))
+
+        await run_lecture_simulation(websocket, lecture_id, sim_request, generate)
     except Exception as e:
         print(f"Error in background simulation task: {e}")
 
@@ -306,19 +524,27 @@ async def run_quiz_background(websocket: WebSocket, quiz_service: QuizService, q
     except Exception as e:
         print(f"Error in background quiz task: {e}")
 
-async def run_flashcard_background(websocket: WebSocket, quiz_service: QuizService, fc_request: dict, lecture_id: str, previous_context: str, text: str):
+async def run_flashcard_batch_background(websocket: WebSocket, quiz_service: QuizService, fc_requests: list[dict], lecture_id: str, previous_context: str, text: str):
     try:
-        concept = fc_request.get("concept") or fc_request.get("topic")
-        print(f"DEBUG: Starting background flashcard generation for: {concept}")
+        print(f"DEBUG: Starting batched flashcard generation for {len(fc_requests)} cards")
         
-        cards = await quiz_service.generate_flashcards(
-            concept=concept,
-            context=f"{previous_context}\n\nRecent Transcript: {text}",
-            count=1
+        cards = await quiz_service.generate_flashcards_batch(
+            fc_requests,
+            context=f"{previous_context}\n\nRecent Transcript: {text}"
         )
         
-        if cards:
-            card = cards[0]
+        ready_cards = [
+            {
+                **fc_request,
+                "status": "ready",
+                "front": cards[fc_request["id"]].get("front"),
+                "back": cards[fc_request["id"]].get("back")
+            }
+            for fc_request in fc_requests
+            if fc_request["id"] in cards
+        ]
+        
+        if ready_cards:
             # Send update to client
             try:
                 await websocket.send_json({
@@ -329,15 +555,10 @@ async def run_flashcard_background(websocket: WebSocket, quiz_service: QuizServi
                         "videos": [],
                         "simulations": [],
                         "quizzes": [],
-                        "flashcards": [{
-                            **fc_request,
-                            "status": "ready",
-                            "front": card.get("front"),
-                            "back": card.get("back")
-                        }]
+                        "flashcards": ready_cards
                     }
                 })
-                print(f"DEBUG: Background flashcard for {concept} completed and sent.")
+                print(f"DEBUG: Background flashcards ({len(ready_cards)}) completed and sent.")
             except Exception as e:
                 print(f"Could not send background flashcard result: {e}")
     except Exception as e:
@@ -481,99 +702,230 @@ async def run_chunk_simulation_background(websocket: WebSocket, simulation_servi
 
     try:
         print(f"DEBUG: Starting background chunk simulation for chunk {chunk_id}.")
-        
-        # Invisibility: generate_simulation_from_chunk handles cache internally
-        result = await simulation_service.generate_simulation_from_chunk(
-            db=db,
-            chunk_text=chunk_text,
-            context=previous_context
-        )
-        
-        if result:
-            concept = result["concept"]
-            print(f"DEBUG: Chunk simulation completed for concept: {concept}")
-            
-            # Construct simulation object
-            sim_obj = {
-                "concept": concept,
-                "concept_id": f"sim_chunk_{chunk_id}", 
-                "chunk_id": chunk_id,
-                "description": result["description"],
-                "code": result["code"],
-                "status": "ready"
-            }
-            
-            # Send to client
-            try:
-                await websocket.send_json({
-                    "type": "pipeline_result",
-                    "lecture_id": lecture_id,
-                    "results": {
-                        "concepts": [],
-                        "videos": [],
-                        "simulations": [sim_obj],
-                        "quizzes": [],
-                        "flashcards": []
-                    }
-                })
 
-                # Persist
-                if db is not None:
-                    sim_doc = sim_obj.copy()
-                    sim_doc["lecture_id"] = lecture_id
-                    sim_doc["timestamp"] = time.time()
-                    sim_doc["origin"] = "chunk_auto"
-                    db.simulations.insert_one(sim_doc)
+        # Name the concept first so the lecture registry can dedupe before any HTML is generated
+        identified = await simulation_service.identify_concept(chunk_text, previous_context)
+        if identified is None:
+            print("DEBUG: Chunk simulation returned None (possibly no concept found)")
+            return
 
-            except Exception as e:
-                print(f"Could not send background chunk simulation result: {e}")
-        else:
-             print("DEBUG: Chunk simulation returned None (possibly no concept found)")
+        concept = identified.concept.strip()
+        description = identified.description or "Simulation generated from transcript."
+        print(f"DEBUG: Chunk simulation identified concept: {concept}")
+
+        async def generate():
+            # Invisibility: generate_simulation handles cache internally
+            code = await simulation_service.generate_simulation(
+                db,
+                concept,
+                description,
+                context=f"{previous_context}\n\n{chunk_text}".strip()
+            )
+            return await generated_simulation(code, description)
+
+        await run_lecture_simulation(
+            websocket,
+            lecture_id,
+            {
+                "concept": concept,
+                "concept_id": f"sim_chunk_{chunk_id}",
+                "chunk_id": chunk_id,
+                "description": description
+            },
+            generate,
+            origin="chunk_auto"
+        )
 
     except Exception as e:
         print(f"Error in background chunk simulation task: {e}")
 
 
+async def load_lecture_context(lecture_id: str):
+    """
+    Fills the rolling context of a lecture this process has not seen yet (or has
+    forgotten, or was told to refresh on reconnect) from its stored transcripts.
+    """
+    if lecture_context.is_loaded(lecture_id):
+        return
+    texts = []
+    if db is not None:
+        try:
+            docs = await asyncio.to_thread(
+                lambda: list(db.transcripts.find(
+                    {"lecture_id": lecture_id},
+                    {"text": 1, "_id": 0}
+                ).sort("timestamp", -1).limit(lecture_context.max_chunks))
+            )
+            # Reverse to maintain chronological order in context string
+            texts = [t["text"] for t in reversed(docs)]
+        except Exception as e:
+            print(f"Error fetching rich context from DB: {e}")
+    lecture_context.load(lecture_id, texts)
+
+
+def persist_transcript(lecture_id: str, message: dict) -> bool:
+    # Deduplication check: see if chunk_id already exists for this lecture
+    existing_transcript = db.transcripts.find_one({"lecture_id": lecture_id, "chunk_id": message.get("chunk_id")})
+    if existing_transcript:
+        print(f"DEBUG: Skipping duplicate transcript chunk persistence: {message.get('chunk_id')}")
+        return False
+    transcript_doc = {
+        "lecture_id": lecture_id,
+        "chunk_id": message.get("chunk_id"),
+        "text": message.get("text", ""),
+        "time": time.strftime("%H:%M:%S"), # Approximate server time, ideally client sends it
+        "type": "committed",
+        "timestamp": time.time()
+    }
+    if message.get("chunk_ids"):
+        # Commits merged into one window by TranscriptWindow
+        transcript_doc["chunk_ids"] = message["chunk_ids"]
+    db.transcripts.insert_one(transcript_doc)
+    # Update lecture last updated time
+    db.lectures.update_one({"id": lecture_id}, {"$set": {"updated_at": time.time()}})
+    return True
+
+
+def known_concepts(lecture_id: str) -> dict[str, str]:
+    """
+    Concept ids registered for a lecture, by lowercased keyword.
+    """
+    return {c.keyword.lower(): c.id for c in CONCEPTS.get(lecture_id, [])}
+
+
+def drop_known_concepts(result: dict, known: dict[str, str]) -> dict[str, str]:
+    """
+    Removes concepts an earlier chunk already registered from a pipeline result, along
+    with the simulations, flashcards and searches hung off them; quizzes are pointed at
+    the earlier concept instead. Returns {dropped concept id: existing concept id}.
+    """
+    duplicates = {c["id"]: known[c["keyword"].lower()] for c in result.get("concepts", []) if c["keyword"].lower() in known}
+    if not duplicates:
+        return duplicates
+    result["concepts"] = [c for c in result["concepts"] if c["id"] not in duplicates]
+    for key, id_field in (
+        ("simulations", "concept_id"),
+        ("flashcards", "concept_id"),
+        ("video_requests", "context_concept_id"),
+        ("text_reference_requests", "context_concept_id"),
+    ):
+        if key in result:
+            result[key] = [item for item in result[key] if item.get(id_field) not in duplicates]
+    for quiz in result.get("quizzes", []):
+        if quiz.get("concept_id") in duplicates:
+            quiz["concept_id"] = duplicates[quiz["concept_id"]]
+    print(f"DEBUG: Dropped {len(duplicates)} concepts already registered by an earlier chunk")
+    return duplicates
+
+
 async def process_transcript_message(websocket: WebSocket, message: dict):
+    lecture_id = message.get("lecture_id", "default_lecture")
+    # Chunks of a lecture overlap their LLM calls but register and persist in arrival order
+    ticket = lecture_sequencer.enter(lecture_id)
+    try:
+        await process_transcript_chunk(websocket, message, ticket)
+    finally:
+        lecture_sequencer.leave(lecture_id, ticket)
+
+
+async def process_transcript_chunk(websocket: WebSocket, message: dict, ticket: int):
     text = message.get("text", "")
     previous_context = message.get("previous_context", "")
     lecture_id = message.get("lecture_id", "default_lecture")
     chunk_id = message.get("chunk_id", f"chunk_{int(time.time()*1000)}")
     is_final = message.get("is_final", False)
-    
-    # Enhance context with last 4 chunks from DB for better simulation/pipeline decisions
-    if db is not None and lecture_id:
-        try:
-            # Fetch last 4 transcripts (excluding the current one which isn't saved yet)
-            last_4_cursor = db.transcripts.find(
-                {"lecture_id": lecture_id},
-                {"text": 1, "_id": 0}
-            ).sort("timestamp", -1).limit(4)
-            last_4 = list(last_4_cursor)
-            if last_4:
-                # Reverse to maintain chronological order in context string
-                rich_context = "\n".join([t["text"] for t in reversed(last_4)])
-                previous_context = rich_context
-        except Exception as e:
-            print(f"Error fetching rich context from DB: {e}")
+    await load_lecture_simulations(lecture_id)
 
     if text or is_final:
+        # Read the lecture's recent chunks and record this one in arrival order; the text is
+        # persisted before any LLM work, so a disconnect mid-pipeline keeps it
+        await lecture_sequencer.wait_turn(lecture_id, ticket, "transcript")
+        await load_lecture_context(lecture_id)
+        # Earlier chunks give every pipeline stage (decision, simulations, quizzes) its context
+        previous_context = lecture_context.context(lecture_id) or previous_context
+        stored = True
+        if db is not None:
+            stored = await asyncio.to_thread(persist_transcript, lecture_id, message)
+        if stored:
+            lecture_context.append(lecture_id, text)
+        lecture_sequencer.release(lecture_id, ticket, "transcript")
+
         # Trigger immediate chunk-based simulation (latency hiding)
-        if text and not is_final:
-             asyncio.create_task(run_chunk_simulation_background(
+        if text and not is_final and not websocket.closed:
+            background_scheduler.submit(
+                run_chunk_simulation_background,
                 websocket,
                 simulation_service,
                 text,
                 lecture_id,
                 chunk_id,
-                previous_context
-             ))
+                previous_context,
+                priority="low",
+                owner=websocket,
+            )
 
         # Get existing concepts for this lecture
         existing_concepts_map = {c.keyword: c.id for c in CONCEPTS.get(lecture_id, [])}
         
+        # Concepts and reference searches are dispatched as soon as their action is parsed;
+        # remember them so the final pass below does not send or start them twice
+        dispatched_early: set[int] = set()
+        duplicate_ids: set[str] = set()
+
+        async def dispatch_partial(partial: dict):
+            # Only the oldest uncommitted chunk streams; later ones could still be
+            # duplicating concepts an earlier chunk is about to register
+            if not lecture_sequencer.is_turn(lecture_id, ticket, "commit"):
+                return
+            if websocket.closed:
+                # Nobody to stream to; the concepts go out with the final result (and replay)
+                return
+            known = known_concepts(lecture_id)
+            concepts = []
+            for c in partial.get("concepts", []):
+                if c["keyword"].lower() in known:
+                    duplicate_ids.add(c["id"])
+                else:
+                    concepts.append(c)
+            if concepts:
+                try:
+                    await websocket.send_json({
+                        "type": "pipeline_result",
+                        "lecture_id": lecture_id,
+                        "results": {
+                            "concepts": concepts,
+                            "videos": [],
+                            "simulations": [],
+                            "quizzes": [],
+                            "flashcards": []
+                        }
+                    })
+                    dispatched_early.update(id(c) for c in concepts)
+                except Exception as e:
+                    print(f"Error sending streamed concepts: {e}")
+            for vr in partial.get("video_requests", []):
+                if vr.get("context_concept_id") in duplicate_ids:
+                    continue
+                dispatched_early.add(id(vr))
+                background_scheduler.submit(
+                    run_video_search_background, websocket, youtube_client, vr, lecture_id, priority="normal", owner=websocket
+                )
+            for tr in partial.get("text_reference_requests", []):
+                if tr.get("context_concept_id") in duplicate_ids:
+                    continue
+                dispatched_early.add(id(tr))
+                background_scheduler.submit(
+                    run_google_search_background, websocket, google_search_service, tr, lecture_id, priority="normal", owner=websocket
+                )
+
         # Run the pipeline (now returns concepts immediately, simulations are pending)
-        result = await pipeline_service.process_chunk(text, previous_context, lecture_id, existing_concepts_map)
+        result = await pipeline_service.process_chunk(
+            text, previous_context, lecture_id, existing_concepts_map, on_partial=dispatch_partial
+        )
+
+        # From here on, chunks of the lecture take turns in arrival order
+        await lecture_sequencer.wait_turn(lecture_id, ticket, "commit")
+        drop_known_concepts(result, known_concepts(lecture_id))
         
         # Logic: If this is the final commit, check if we have any quizzes.
         # If not, force one.
@@ -594,13 +946,59 @@ async def process_transcript_message(websocket: WebSocket, message: dict):
                 }
                 result.setdefault("quizzes", []).append(forced_quiz)
 
+        # Concepts this lecture already has a simulation for are answered from the registry
+        for sim in result.get("simulations", []):
+            existing = simulation_registry.get(lecture_id, sim["concept"])
+            if sim.get("status") == "pending" and existing:
+                sim.update({k: v for k, v in existing.items() if k != "concept"}, status="ready")
+
+        # Also update local store if needed (e.g., CONCEPTS)
+        new_concepts_data = result.get("concepts", [])
+        if new_concepts_data:
+            new_concepts_objs = [
+                Concept(
+                    id=c["id"],
+                    keyword=c["keyword"], 
+                    definition=c.get("definition"),
+                    stem_concept=c["stem_concept"], 
+                    source_chunk_id=message.get("chunk_id")
+                ) 
+                for c in new_concepts_data
+            ]
+            CONCEPTS.setdefault(lecture_id, []).extend(new_concepts_objs)
+        
+            # Persist concepts
+            if db is not None:
+                concept_docs = []
+                for c in new_concepts_data:
+                    c_doc = c.copy()
+                    c_doc["lecture_id"] = lecture_id
+                    c_doc["timestamp"] = time.time()
+                    concept_docs.append(c_doc)
+                if concept_docs:
+                    db.concepts.insert_many(concept_docs)
+        
+        # Persist simulation requests (pending state), one document per lecture concept
+        if db is not None:
+            for s in result.get("simulations", []):
+                if s.get("status") != "pending":
+                    continue
+                key = normalize_concept(s["concept"])
+                s_doc = {k: v for k, v in s.items() if k not in ("code", "status")}
+                db.simulations.update_one(
+                    {"lecture_id": lecture_id, "concept_key": key},
+                    {"$setOnInsert": {**s_doc, "status": "pending", "timestamp": time.time()}},
+                    upsert=True
+                )
+
         # Send back the initial results
+        delivered = True
         try:
             await websocket.send_json({
                 "type": "pipeline_result",
                 "lecture_id": lecture_id,
                 "results": {
-                    "concepts": result.get("concepts", []),
+                    "concepts": [c for c in result.get("concepts", []) if id(c) not in dispatched_early],
                     "videos": [], # Video requests handled separately
                     "simulations": result.get("simulations", []),
                     "quizzes": result.get("quizzes", []),
@@ -609,120 +1007,87 @@ async def process_transcript_message(websocket: WebSocket, message: dict):
             })
         except Exception as e:
             print(f"Error sending initial pipeline results: {e}")
-            return
+            delivered = False
 
         # Handle background simulation generation
         for sim in result.get("simulations", []):
             if sim.get("status") == "pending":
-                asyncio.create_task(run_simulation_background(
-                    websocket, 
-                    simulation_service, 
-                    sim, 
-                    lecture_id, 
-                    previous_context, 
-                    text
-                ))
-        
+                background_scheduler.submit(
+                    run_simulation_background,
+                    websocket,
+                    simulation_service,
+                    sim,
+                    lecture_id,
+                    previous_context,
+                    text,
+                    priority="low",
+                    owner=websocket,
+                    # Pending simulations are stored with the lecture; finish them for the next visit
+                    keep_on_close=True,
+                )
+        if not delivered or websocket.closed:
+            # The client is gone; the rest is only ever sent, never stored
+            return
+
         # Handle background quiz generation
         for quiz in result.get("quizzes", []):
             if quiz.get("status") == "pending":
                 QUIZZES.setdefault(lecture_id, []).append(quiz)
-                asyncio.create_task(run_quiz_background(
+                background_scheduler.submit(
+                    run_quiz_background,
                     websocket,
                     quiz_service,
                     quiz,
                     lecture_id,
                     previous_context,
-                    text
-                ))
+                    text,
+                    priority="high",
+                    owner=websocket,
+                )
         
-        # Handle background flashcard generation
-        for fc in result.get("flashcards", []):
-            if fc.get("status") == "pending":
-                asyncio.create_task(run_flashcard_background(
-                    websocket,
-                    quiz_service,
-                    fc,
-                    lecture_id,
-                    previous_context,
-                    text
-                ))
+        # Handle background flashcard generation (one batched call per chunk of cards)
+        pending_flashcards = [fc for fc in result.get("flashcards", []) if fc.get("status") == "pending"]
+        batch_size = max(1, settings.flashcard_batch_size)
+        for i in range(0, len(pending_flashcards), batch_size):
+            background_scheduler.submit(
+                run_flashcard_batch_background,
+                websocket,
+                quiz_service,
+                pending_flashcards[i:i + batch_size],
+                lecture_id,
+                previous_context,
+                text,
+                priority="high",
+                owner=websocket,
+            )
 
         # Handle background video search
         for vr in result.get("video_requests", []):
-            asyncio.create_task(run_video_search_background(
+            if id(vr) in dispatched_early:
+                continue
+            background_scheduler.submit(
+                run_video_search_background,
                 websocket,
                 youtube_client,
                 vr,
-                lecture_id
-            ))
+                lecture_id,
+                priority="normal",
+                owner=websocket,
+            )
 
         # Handle background google search
         for tr in result.get("text_reference_requests", []):
-            asyncio.create_task(run_google_search_background(
+            if id(tr) in dispatched_early:
+                continue
+            background_scheduler.submit(
+                run_google_search_background,
                 websocket,
                 google_search_service,
                 tr,
-                lecture_id
-            ))
-        
-        # Also update local store if needed (e.g., CONCEPTS)
-        # Persist transcripts
-        if db is not None:
-            # Deduplication check: see if chunk_id already exists for this lecture
-            existing_transcript = db.transcripts.find_one({"lecture_id": lecture_id, "chunk_id": message.get("chunk_id")})
-            if existing_transcript:
-                print(f"DEBUG: Skipping duplicate transcript chunk persistence: {message.get('chunk_id')}")
-            else:
-                transcript_doc = {
-                    "lecture_id": lecture_id,
-                    "chunk_id": message.get("chunk_id"), # Use message.get("chunk_id")
-                    "text": text, # Use the 'text' variable already defined
-                    "time": time.strftime("%H:%M:%S"), # Approximate server time, ideally client sends it
-                    "type": "committed",
-                    "timestamp": time.time()
-                }
-                db.transcripts.insert_one(transcript_doc)
-                # Update lecture last updated time
-                db.lectures.update_one({"id": lecture_id}, {"$set": {"updated_at": time.time()}})
-
-        new_concepts_data = result.get("concepts", [])
-        if new_concepts_data:
-            new_concepts_objs = [
-                Concept(
-                    id=c["id"],
-                    keyword=c["keyword"], 
-                    definition=c.get("definition"),
-                    stem_concept=c["stem_concept"], 
-                    source_chunk_id=message.get("chunk_id")
-                ) 
-                for c in new_concepts_data
-            ]
-            CONCEPTS.setdefault(lecture_id, []).extend(new_concepts_objs)
-        
-            # Persist concepts
-            if db is not None:
-                concept_docs = []
-                for c in new_concepts_data:
-                    c_doc = c.copy()
-                    c_doc["lecture_id"] = lecture_id
-                    c_doc["timestamp"] = time.time()
-                    concept_docs.append(c_doc)
-                if concept_docs:
-                    db.concepts.insert_many(concept_docs)
-        
-        # Persist simulation requests (pending state)
-        new_sims = result.get("simulations", [])
-        if new_sims and db is not None:
-            sim_docs = []
-            for s in new_sims:
-                s_doc = s.copy()
-                s_doc["lecture_id"] = lecture_id
-                s_doc["status"] = "pending" # Initial state
-                s_doc["timestamp"] = time.time()
-                sim_docs.append(s_doc)
-            if sim_docs:
-                db.simulations.insert_many(sim_docs)
+                lecture_id,
+                priority="normal",
+                owner=websocket,
+            )
 
 
 @app.websocket("/ws/{client_id}")
@@ -745,6 +1110,47 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         return
 
     await websocket.accept()
+    # Results are coalesced per tick; "?encoding=msgpack" asks for binary frames
+    channel = OutboundChannel(
+        websocket,
+        tick_seconds=settings.ws_coalesce_seconds,
+        encoding=websocket.query_params.get("encoding", "json"),
+        replay=result_replay,
+    )
+
+    async def keep_transcript_text(message: dict):
+        # The pipeline could not take the chunk: at least store its text
+        if db is None:
+            return
+        lecture_id = message.get("lecture_id", "default_lecture")
+        try:
+            await asyncio.to_thread(persist_transcript, lecture_id, message)
+            lecture_context.invalidate(lecture_id)
+        except Exception as e:
+            print(f"Error persisting transcript chunk for client {client_id}: {e}")
+
+    async def submit_transcript(message: dict):
+        # Process the committed transcript in background; concept extraction goes first.
+        # Kept on disconnect like the buffered tail below: the chunk stores its transcript,
+        # concepts and pending simulations, and skips the work that is only ever sent
+        if background_scheduler.submit(
+            process_transcript_message, channel, message, priority="critical", owner=channel, keep_on_close=True
+        ) is None:
+            await keep_transcript_text(message)
+            try:
+                await channel.send_json({"type": "error", "message": "Server busy, transcript chunk not analyzed"})
+            except Exception:
+                pass
+
+    # Small commits are merged before they cost a pipeline decision each
+    window = TranscriptWindow(
+        submit_transcript,
+        min_chars=settings.transcript_window_min_chars,
+        max_chars=settings.transcript_window_max_chars,
+        max_latency_seconds=settings.transcript_window_max_latency_seconds,
+    )
+    # Lectures this connection has committed to; the first commit refreshes their context
+    seen_lectures: set[str] = set()
     try:
         while True:
             data = await websocket.receive_text()
@@ -753,8 +1159,19 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 msg_type = message.get("type")
                 
                 if msg_type == "transcript_commit":
-                    # Process the committed transcript in background
-                    asyncio.create_task(process_transcript_message(websocket, message))
+                    lecture_id = message.get("lecture_id", "default_lecture")
+                    if lecture_id not in seen_lectures:
+                        # A reconnecting client may have committed through another connection or process
+                        seen_lectures.add(lecture_id)
+                        lecture_context.invalidate(lecture_id)
+                    await window.add(message)
+                elif msg_type == "resume":
+                    # Reconnected client: send the lecture's results after the last seq it saw
+                    await channel.resume(
+                        message.get("lecture_id", "default_lecture"),
+                        message.get("epoch"),
+                        int(message.get("resume_from") or 0),
+                    )
 
             except json.JSONDecodeError:
                 pass
@@ -762,7 +1179,7 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 print(f"Error processing message: {e}")
                 # Only try to send error if we're not dealing with a disconnect
                 try:
-                    await websocket.send_json({"type": "error", "message": str(e)})
+                    await channel.send_json({"type": "error", "message": str(e)})
                 except Exception:
                     pass
 
@@ -770,6 +1187,20 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         print(f"Client {client_id} disconnected")
     except Exception as e:
         print(f"WebSocket session error: {e}")
+    finally:
+        # Text still waiting in a window is the end of the lecture: run it through the
+        # pipeline anyway so its transcript, concepts and simulations are stored
+        for message in window.close():
+            if background_scheduler.submit(
+                process_transcript_message, channel, message, priority="critical", owner=channel, keep_on_close=True
+            ) is None:
+                await keep_transcript_text(message)
+        # Stop spending LLM quota and worker slots on results nobody will receive
+        cancelled = background_scheduler.close_owner(channel)
+        channel.close()
+        if cancelled:
+            print(f"DEBUG: Cancelled {cancelled} background tasks for client {client_id}")
+        print(f"DEBUG: Client {client_id} outbound: {channel.stats()}")
 
 
 @app.post("/concepts/extract", response_model=ConceptExtractionResponse)
@@ -780,17 +1211,17 @@ def extract_concepts(payload: TranscriptChunk) -> ConceptExtractionResponse:
     if not payload.text.strip():
         raise HTTPException(status_code=400, detail="Transcript chunk is empty")
 
-    if not settings.gemini_api_key:
+    if not settings.gemini_api_key and settings.llm_backend != "replay":
         raise HTTPException(status_code=500, detail="Gemini API key is not configured")
 
-    prompt_template = load_prompt("concept_extraction")
-    prompt = (
-        prompt_template.replace("{{previous_context}}", payload.previous_context or "")
-        .replace("{{transcript_chunk}}", payload.text)
+    prompt = prompts.render(
+        "concept_extraction",
+        previous_context=payload.previous_context or "",
+        transcript_chunk=payload.text
     )
 
     try:
-        data = gemini_client.generate_json(prompt)
+        data = gemini_client.generate_json(prompt, prompt_name="concept_extraction")
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=502, detail=f"Gemini error: {exc}") from exc
 
@@ -827,12 +1258,12 @@ def extract_concepts(payload: TranscriptChunk) -> ConceptExtractionResponse:
 
 @app.post("/concepts/{lecture_id}/walkthrough", response_model=WalkthroughResponse)
 def create_walkthrough(lecture_id: str, payload: WalkthroughRequest) -> WalkthroughResponse:
-    if not settings.gemini_api_key:
+    if not settings.gemini_api_key and settings.llm_backend != "replay":
         raise HTTPException(status_code=500, detail="Gemini API key is not configured")
 
-    prompt = load_prompt("walkthrough").replace("{{concept}}", payload.concept)
+    prompt = prompts.render("walkthrough", concept=payload.concept)
     try:
-        data = gemini_client.generate_json(prompt)
+        data = gemini_client.generate_json(prompt, prompt_name="walkthrough")
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=502, detail=f"Gemini error: {exc}") from exc
 
@@ -844,7 +1275,7 @@ def create_walkthrough(lecture_id: str, payload: WalkthroughRequest) -> Walkthro
 
 @app.post("/animations/generate", response_model=AnimationResponse)
 async def generate_animation(payload: AnimationRequest) -> AnimationResponse:
-    if not settings.gemini_api_key:
+    if not settings.gemini_api_key and settings.llm_backend != "replay":
         raise HTTPException(status_code=500, detail="Gemini API key is not configured")
 
     # Invisibility: generate_simulation handles cache internally
@@ -855,9 +1286,10 @@ async def generate_animation(payload: AnimationRequest) -> AnimationResponse:
         context=f"Manual request for animation on: {payload.concept}"
     )
 
-    if not code:
-        raise HTTPException(status_code=502, detail="Gemini returned empty code")
-    return AnimationResponse(concept=payload.concept, status="ready", asset_url=None, code=code)
+    if is_generation_error(code):
+        raise HTTPException(status_code=502, detail="Gemini did not return a simulation")
+    asset = await simulation_asset(code)
+    return AnimationResponse(concept=payload.concept, status="ready", **{"code": code, **asset})
 
 
 @app.post("/simulations/like")
@@ -872,12 +1304,103 @@ async def like_simulation(payload: LikeSimulationRequest, current_user: dict = D
         db, 
         concept=payload.concept, 
         description=payload.description or f"User liked simulation for {payload.concept}", 
-        code=payload.code
+        code=payload.code,
+        liked=True
     )
     
     return {"status": "success", "message": f"Simulation for {payload.concept} cached."}
 
 
+@app.get("/simulations/{code_hash}")
+async def get_simulation_artifact(code_hash: str, request: Request) -> Response:
+    """
+    Serves simulation HTML by content hash. Bodies never change, so they are cacheable forever.
+    """
+    if len(code_hash) != 64 or any(ch not in "0123456789abcdef" for ch in code_hash):
+        raise HTTPException(status_code=404, detail="Simulation not found")
+    etag = f'"{code_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable", "Vary": "Accept-Encoding"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        body = await simulation_artifacts.get_compressed_async(code_hash)
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(status_code=503, detail=f"Simulation store unavailable: {exc}") from exc
+    if body is None:
+        raise HTTPException(status_code=404, detail="Simulation not found")
+
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
+
+
+@app.get("/static/{filename}")
+def get_static_asset(filename: str) -> Response:
+    """
+    Shared simulation runtime stylesheet. The file name carries its content hash;
+    earlier versions stay available for the simulations that link them.
+    """
+    css = runtime_css(filename)
+    if css is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return Response(
+        content=css,
+        media_type="text/css; charset=utf-8",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+@app.post("/admin/simulations/warm")
+async def warm_simulations(payload: WarmSimulationsRequest, admin_user: dict = Depends(get_admin_user)):
+    """
+    Starts a background job that generates and caches simulations for a list of concepts.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    if payload.concepts:
+        concepts = concept_entries(payload.concepts)
+    elif payload.query:
+        try:
+            concepts = await asyncio.to_thread(
+                concepts_from_query, db, payload.query.collection, payload.query.filter, payload.query.limit
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+    else:
+        raise HTTPException(status_code=400, detail="Provide concepts or query")
+    if not concepts:
+        raise HTTPException(status_code=400, detail="No concepts to warm")
+
+    job = SimulationWarmJob(
+        simulation_service,
+        db,
+        concepts,
+        job_id=payload.job_id,
+        workers=payload.workers or settings.simulation_warm_workers,
+        rate_per_minute=payload.rate_per_minute or settings.simulation_warm_rate_per_minute,
+    )
+    running = WARM_JOBS.get(job.job_id)
+    if running is not None and running.status == "running":
+        return running.progress()
+
+    if background_scheduler.submit(job.run, priority="low", name=f"warm_job_{job.job_id}") is None:
+        raise HTTPException(status_code=503, detail="Background queue full, try again later")
+    WARM_JOBS[job.job_id] = job
+    return job.progress()
+
+
+@app.get("/admin/simulations/warm/{job_id}")
+async def get_warm_job(job_id: str, admin_user: dict = Depends(get_admin_user)):
+    job = WARM_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Warm job not found")
+    return job.progress()
+
+
 @app.post("/videos/search", response_model=VideoSearchResponse)
 def search_videos(payload: VideoSearchRequest) -> VideoSearchResponse:
     try:
@@ -920,8 +1443,13 @@ def onboarding(payload: OnboardingRequest) -> OnboardingResponse:
     return OnboardingResponse(user_id=payload.user_id, status="saved")
 
 
+async def start_simulation_prefetch(class_doc: dict, lecture_id: str):
+    # Runs on the event loop so the prefetch task outlives the request
+    simulation_prefetcher.schedule(db, class_doc, lecture_id)
+
+
 @app.post("/lectures/create", response_model=Lecture)
-def create_lecture(payload: CreateLectureRequest, current_user: dict = Depends(get_current_user)) -> Lecture:
+def create_lecture(payload: CreateLectureRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)) -> Lecture:
     if db is None:
         raise HTTPException(status_code=503, detail="Database unavailable")
 
@@ -947,6 +1475,9 @@ def create_lecture(payload: CreateLectureRequest, current_user: dict = Depends(g
     
     # Update class last updated time
     db.classes.update_one({"id": payload.class_id}, {"$set": {"updated_at": now}})
+
+    if settings.simulation_prefetch_enabled:
+        background_tasks.add_task(start_simulation_prefetch, class_doc, lecture_id)
     
     return Lecture(
         **new_lecture,
@@ -1105,7 +1636,11 @@ def get_lecture_details(lecture_id: str) -> LectureDetailsResponse:
 
     # 4. Get Simulations
     sims_cursor = db.simulations.find({"lecture_id": lecture_id, "status": "ready"})
-    simulations = [AnimationResponse(**s) for s in sims_cursor]
+    simulations = []
+    for s in sims_cursor:
+        if s.get("code_hash") and not s.get("asset_url"):
+            s["asset_url"] = SimulationArtifactStore.asset_url(s["code_hash"])
+        simulations.append(AnimationResponse(**s))
 
     # 5. Get Transcripts
     transcripts_cursor = db.transcripts.find({"lecture_id": lecture_id}).sort("timestamp", 1)
@@ -1,3 +1,5 @@
+from typing import Any
+
 from pydantic import BaseModel, Field
 
 
@@ -47,6 +49,7 @@ class AnimationResponse(BaseModel):
     concept: str
     status: str
     asset_url: str | None = None
+    code_hash: str | None = None
     code: str | None = None
 
 
@@ -178,6 +181,20 @@ class LikeSimulationRequest(BaseModel):
     description: str | None = None
 
 
+class WarmSimulationsQuery(BaseModel):
+    collection: str = "concepts"
+    filter: dict[str, Any] = Field(default_factory=dict)
+    limit: int = 0
+
+
+class WarmSimulationsRequest(BaseModel):
+    concepts: list[str | dict[str, str | None]] | None = None
+    query: WarmSimulationsQuery | None = None
+    job_id: str | None = None
+    workers: int | None = None
+    rate_per_minute: float | None = None
+
+
 class Flashcard(BaseModel):
     id: str | None = None
     concept_id: str | None = None
@@ -1,119 +1,391 @@
+import asyncio
+import copy
+import hashlib
 import json
 import re
-from typing import Any
-from google import genai
+import time
+from typing import Any, AsyncIterator
+from google.genai import errors as genai_errors
 from google.genai import types
+from app.config import LLMCallPolicy
+from app.services.llm_cache import ResponseCache
+from app.services.llm_gateway import LLMGateway
+from app.services.llm_metrics import LLMCall, LLMMetrics
+from app.services.llm_retry import LatencyTracker, call_with_policy, call_with_policy_sync, is_retryable, backoff_delay
+from app.services.prompts import prompts
+from app.services.singleflight import SingleFlight
+
+SAFETY_SETTINGS = [
+    types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
+    types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
+    types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
+    types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
+]
+
+
+class LLMError(RuntimeError):
+    """
+    A text generation that failed after its retries, hedges and deadline were used up.
+    """
+
+
+class ContextCachingUnsupported(RuntimeError):
+    """
+    Raised by a client backend without context caching; static prefixes are sent inline.
+    """
 
 
 class GeminiClient:
-    def __init__(self, api_key: str, model: str) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        gateway: LLMGateway | None = None,
+        cache: ResponseCache | None = None,
+        policies: dict[str, LLMCallPolicy] | None = None,
+        default_policy: LLMCallPolicy | None = None,
+        context_cache_ttl_seconds: int | None = None,
+        metrics: LLMMetrics | None = None,
+    ) -> None:
         self.api_key = api_key
         self.model = model
-        self.client = genai.Client(
-            api_key=self.api_key, 
-            http_options={'api_version': 'v1beta'}
-        )
+        # Clients built on the same gateway share its connection pool and concurrency limits
+        self.gateway = gateway or LLMGateway(api_key)
+        self.client = self.gateway.client
+        self.cache = cache
+        # Identical prompts issued while one is already in flight wait for that response
+        self.inflight = SingleFlight()
+        # Deadlines, retries and hedging are configured per prompt name
+        self.policies = policies or {}
+        self.default_policy = default_policy or LLMCallPolicy()
+        self.latency: dict[str, LatencyTracker] = {}
+        # Provider-side cached content for static prompt prefixes (None disables it)
+        self.context_cache_ttl_seconds = context_cache_ttl_seconds
+        self._context_caches: dict[str, tuple[str, float]] = {}
+        self._context_cache_failures: set[str] = set()
+        self.metrics = metrics
 
-    def generate_json(self, prompt: str, schema: Any = None) -> Any:
-        try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    response_schema=schema,
-                    safety_settings=[
-                        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-                    ]
+    def _call(self, prompt_name: str | None) -> LLMCall:
+        return LLMCall(self.metrics, prompt_name, self.model)
+
+    def _cache_hit(self, prompt_name: str | None) -> None:
+        self._call(prompt_name).finish("cache_hit")
+
+    @staticmethod
+    def _outcome(exc: BaseException) -> str:
+        if isinstance(exc, TimeoutError):
+            return "timeout"
+        if isinstance(exc, genai_errors.APIError) and exc.code == 429:
+            return "rate_limited"
+        return "error"
+
+    def _policy(self, prompt_name: str | None) -> LLMCallPolicy:
+        return self.policies.get(prompt_name or "", self.default_policy)
+
+    def _latency(self, prompt_name: str | None) -> LatencyTracker:
+        return self.latency.setdefault(prompt_name or "default", LatencyTracker())
+
+    def _hedge_after(self, prompt_name: str | None, policy: LLMCallPolicy) -> float | None:
+        if not policy.hedge:
+            return None
+        # Don't add duplicate load while requests are already queueing for this model
+        if self.gateway.is_saturated(self.model):
+            return None
+        return policy.hedge_after_seconds or self._latency(prompt_name).p95()
+
+    def _config(self, **kwargs) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(safety_settings=SAFETY_SETTINGS, **kwargs)
+
+    async def _context_cache(self, prefix_name: str, prefix_text: str) -> str | None:
+        """
+        Returns the provider cached-content name holding `prefix_text`, creating it on
+        first use and shortly before it expires. Returns None if caching is disabled or
+        the provider refused (e.g. the prefix is below the minimum cacheable size).
+        """
+        if not self.context_cache_ttl_seconds:
+            return None
+        key = f"{prefix_name}:{hashlib.sha256(prefix_text.encode('utf-8')).hexdigest()[:16]}"
+        if key in self._context_cache_failures:
+            return None
+        entry = self._context_caches.get(key)
+        if entry and entry[1] - time.monotonic() > 60:
+            return entry[0]
+
+        async def create() -> str | None:
+            try:
+                cache = await self.client.aio.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=prefix_name,
+                        system_instruction=prefix_text,
+                        ttl=f"{self.context_cache_ttl_seconds}s"
+                    )
                 )
+            except ContextCachingUnsupported:
+                # Not a failure: this backend (e.g. record/replay) always takes the prefix inline
+                self._context_cache_failures.add(key)
+                return None
+            except Exception as e:
+                print(f"DEBUG: Context caching unavailable for '{prefix_name}', sending it inline: {e}")
+                self._context_cache_failures.add(key)
+                return None
+            self._context_caches[key] = (cache.name, time.monotonic() + self.context_cache_ttl_seconds)
+            return cache.name
+
+        return await self.inflight.do(f"context_cache:{key}", create)
+
+    def _prefixed_key(self, kind: str, prompt: str, static_prefix: str | None) -> str:
+        if static_prefix:
+            prompt = f"{prompts.text(static_prefix)}\n\n---\n\n{prompt}"
+        return ResponseCache.make_key(self.model, kind, prompt)
+
+    async def _prefixed(self, prompt: str, static_prefix: str | None, **config_kwargs) -> tuple[str, types.GenerateContentConfig]:
+        """
+        Builds contents and config for a prompt preceded by a registered static prefix:
+        through the provider's context cache when possible, inline otherwise.
+        """
+        if not static_prefix:
+            return prompt, self._config(**config_kwargs)
+        prefix_text = prompts.text(static_prefix)
+        cached_content = await self._context_cache(static_prefix, prefix_text)
+        if cached_content:
+            return prompt, self._config(cached_content=cached_content, **config_kwargs)
+        return f"{prefix_text}\n\n---\n\n{prompt}", self._config(**config_kwargs)
+
+    def _finish(self, call: LLMCall, response: Any) -> Any:
+        call.usage(response)
+        call.finish("ok" if response.text else "empty")
+        return response
+
+    def _generate(self, prompt_name: str | None, contents: Any, config: types.GenerateContentConfig) -> Any:
+        call = self._call(prompt_name)
+
+        def attempt():
+            with self.gateway.slot_sync(self.model) as waited:
+                call.waited(waited)
+                response = self.client.models.generate_content(model=self.model, contents=contents, config=config)
+                call.first_byte()
+                return response
+
+        try:
+            response = call_with_policy_sync(attempt, self._policy(prompt_name))
+        except Exception as e:
+            call.finish(self._outcome(e))
+            raise
+        return self._finish(call, response)
+
+    async def _generate_async(self, prompt_name: str | None, contents: Any, config: types.GenerateContentConfig) -> Any:
+        latency = self._latency(prompt_name)
+        call = self._call(prompt_name)
+
+        async def attempt():
+            async with self.gateway.slot(self.model) as waited:
+                call.waited(waited)
+                started = time.monotonic()
+                response = await self.client.aio.models.generate_content(model=self.model, contents=contents, config=config)
+                call.first_byte()
+                latency.observe(time.monotonic() - started)
+                return response
+
+        policy = self._policy(prompt_name)
+        try:
+            response = await call_with_policy(attempt, policy, hedge_after=self._hedge_after(prompt_name, policy))
+        except asyncio.CancelledError:
+            call.finish("cancelled")
+            raise
+        except Exception as e:
+            call.finish(self._outcome(e))
+            raise
+        return self._finish(call, response)
+
+    def generate_json(self, prompt: str, schema: Any = None, prompt_name: str | None = None) -> Any:
+        key = ResponseCache.make_key(self.model, "json", prompt, schema) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._cache_hit(prompt_name)
+                return cached
+        try:
+            response = self._generate(
+                prompt_name,
+                prompt,
+                self._config(response_mime_type="application/json", response_schema=schema)
             )
-            return parse_json_from_text(response.text)
+            data = parse_json_from_text(response.text)
+            if key and data is not None:
+                self.cache.set(key, data)
+            return data
         except Exception as e:
             print(f"Gemini JSON Error: {e}")
             return None
 
-    async def generate_json_async(self, prompt: str, schema: Any = None) -> Any:
+    async def generate_json_async(self, prompt: str, schema: Any = None, prompt_name: str | None = None) -> Any:
+        key = ResponseCache.make_key(self.model, "json", prompt, schema)
+        if self.cache:
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                self._cache_hit(prompt_name)
+                return cached
+        data = await self.inflight.do(key, self._generate_json_async, prompt, schema, key, prompt_name)
+        # Coalesced callers share one parsed object; give each its own copy
+        return copy.deepcopy(data)
+
+    async def _generate_json_async(self, prompt: str, schema: Any, key: str, prompt_name: str | None) -> Any:
         try:
-            response = await self.client.aio.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    response_schema=schema,
-                    safety_settings=[
-                        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-                    ]
-                )
+            response = await self._generate_async(
+                prompt_name,
+                prompt,
+                self._config(response_mime_type="application/json", response_schema=schema)
             )
-            return parse_json_from_text(response.text)
+            data = parse_json_from_text(response.text)
+            if self.cache and data is not None:
+                await self.cache.set_async(key, data)
+            return data
         except Exception as e:
             print(f"Gemini Async JSON Error: {e}")
             return None
 
-    def generate_text(self, prompt: str) -> str:
+    def generate_text(self, prompt: str, prompt_name: str | None = None) -> str:
+        """
+        Raises LLMError if the model could not be reached; "" means it answered with no text.
+        """
+        key = ResponseCache.make_key(self.model, "text", prompt) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._cache_hit(prompt_name)
+                return cached
         try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    safety_settings=[
-                        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-                    ]
-                )
-            )
+            response = self._generate(prompt_name, prompt, self._config())
             if not response.text:
                 print(f"DEBUG: Gemini returned no text. Candidates: {response.candidates}")
+            elif key:
+                self.cache.set(key, response.text)
             return response.text or ""
         except Exception as e:
             print(f"Gemini Text Error: {e}")
-            return f"Error: {str(e)}"
+            raise LLMError(str(e)) from e
+
+    async def generate_text_async(self, prompt: str, prompt_name: str | None = None, static_prefix: str | None = None) -> str:
+        """
+        `static_prefix` names a registered prompt (e.g. "system_animation") that precedes
+        `prompt`; it is served from the provider's context cache when available.
+        Raises LLMError if the model could not be reached, like stream_text_async.
+        """
+        key = self._prefixed_key("text", prompt, static_prefix)
+        if self.cache:
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                self._cache_hit(prompt_name)
+                return cached
+        return await self.inflight.do(key, self._generate_text_async, prompt, key, prompt_name, static_prefix)
 
-    async def generate_text_async(self, prompt: str) -> str:
+    async def _generate_text_async(self, prompt: str, key: str, prompt_name: str | None, static_prefix: str | None = None) -> str:
         try:
-            response = await self.client.aio.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    safety_settings=[
-                        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-                    ]
-                )
-            )
+            contents, config = await self._prefixed(prompt, static_prefix)
+            response = await self._generate_async(prompt_name, contents, config)
             if not response.text:
                 print(f"DEBUG: Gemini Async returned no text. Candidates: {response.candidates}")
+            elif self.cache:
+                await self.cache.set_async(key, response.text)
             return response.text or ""
         except Exception as e:
             print(f"Gemini Async Text Error: {e}")
-            return f"Error: {str(e)}"
+            raise LLMError(str(e)) from e
+
+    async def stream_text_async(self, prompt: str, prompt_name: str | None = None, json_mode: bool = False, static_prefix: str | None = None) -> AsyncIterator[str]:
+        """
+        Yields the response text incrementally as the model produces it.
+        With `json_mode` the model is asked for a JSON response (raw text is still yielded);
+        `static_prefix` works as in generate_text_async.
+        Errors are raised to the consumer so a failed stream is noticed immediately.
+        Retries only happen before the first chunk; after that each chunk must arrive
+        within the attempt timeout and the whole stream within the deadline.
+        """
+        key = self._prefixed_key("json_text" if json_mode else "text", prompt, static_prefix)
+        if self.cache:
+            cached = await self.cache.get_async(key)
+            if cached is not None:
+                self._cache_hit(prompt_name)
+                yield cached
+                return
 
-    async def search_google_async(self, prompt: str) -> Any:
+        if json_mode:
+            contents, config = await self._prefixed(prompt, static_prefix, response_mime_type="application/json")
+        else:
+            contents, config = await self._prefixed(prompt, static_prefix)
+        policy = self._policy(prompt_name)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline_seconds
+        parts: list[str] = []
+        call = self._call(prompt_name)
+        outcome = "cancelled"
         try:
-            response = await self.client.aio.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    tools=[types.Tool(google_search=types.GoogleSearchRetrieval())],
-                    safety_settings=[
-                        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-                    ]
-                )
+            async for text in self._stream_attempts(contents, config, policy, deadline, parts, call):
+                yield text
+            outcome = "ok" if parts else "empty"
+        except Exception as e:
+            outcome = self._outcome(e)
+            raise
+        finally:
+            call.finish(outcome)
+
+        if self.cache and parts:
+            await self.cache.set_async(key, "".join(parts))
+
+    async def _stream_attempts(
+        self,
+        contents: Any,
+        config: types.GenerateContentConfig,
+        policy: LLMCallPolicy,
+        deadline: float,
+        parts: list[str],
+        call: LLMCall,
+    ) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        retries = 0
+        while True:
+            try:
+                async with self.gateway.slot(self.model) as waited:
+                    call.waited(waited)
+                    stream = await asyncio.wait_for(
+                        self.client.aio.models.generate_content_stream(
+                            model=self.model, contents=contents, config=config
+                        ),
+                        min(policy.attempt_timeout_seconds, deadline - loop.time())
+                    )
+                    iterator = aiter(stream)
+                    while True:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise TimeoutError("LLM stream exceeded its deadline")
+                        try:
+                            chunk = await asyncio.wait_for(anext(iterator), min(policy.attempt_timeout_seconds, remaining))
+                        except StopAsyncIteration:
+                            break
+                        call.usage(chunk)
+                        if chunk.text:
+                            call.first_byte()
+                            parts.append(chunk.text)
+                            yield chunk.text
+                break
+            except Exception as e:
+                if parts or retries >= policy.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(policy, retries)
+                if loop.time() + delay >= deadline:
+                    raise
+                retries += 1
+                print(f"DEBUG: Retrying LLM stream ({retries}/{policy.max_retries}) in {delay:.2f}s after: {e}")
+                await asyncio.sleep(delay)
+
+    async def search_google_async(self, prompt: str, prompt_name: str | None = "google_search") -> Any:
+        try:
+            return await self._generate_async(
+                prompt_name,
+                prompt,
+                self._config(tools=[types.Tool(google_search=types.GoogleSearchRetrieval())])
             )
-            return response
         except Exception as e:
             print(f"Gemini Search Error: {e}")
             return None
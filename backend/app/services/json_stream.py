@@ -0,0 +1,77 @@
+import json
+import re
+from typing import Any
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally extracts the elements of one JSON array from a streamed response.
+
+    Feed it text as it arrives; each call returns the array elements (objects) whose
+    closing brace has been seen since the previous call. The array is either the value
+    of `key` in the top-level object (e.g. {"actions": [...]}) or a bare top-level array.
+    Text before the array, such as a ```json fence, is ignored.
+    """
+
+    def __init__(self, key: str) -> None:
+        self._key_pattern = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self.buffer = ""
+        self._pos = -1  # scan position inside the array; -1 until the array is found
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element_start = -1
+        self.done = False
+
+    def _find_array(self) -> None:
+        match = self._key_pattern.search(self.buffer)
+        if match:
+            self._pos = match.end()
+            return
+        stripped = self.buffer.lstrip()
+        if stripped.startswith("["):
+            self._pos = len(self.buffer) - len(stripped) + 1
+
+    def feed(self, text: str) -> list[Any]:
+        if self.done:
+            return []
+        self.buffer += text
+        if self._pos < 0:
+            self._find_array()
+            if self._pos < 0:
+                return []
+
+        elements: list[Any] = []
+        buf = self.buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._element_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Closing bracket of the array itself
+                    self.done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._element_start >= 0:
+                    try:
+                        elements.append(json.loads(buf[self._element_start:i + 1]))
+                    except json.JSONDecodeError:
+                        print(f"DEBUG: Skipping unparseable streamed element: {buf[self._element_start:i + 1][:200]}")
+                    self._element_start = -1
+            i += 1
+        self._pos = i
+        return elements
@@ -0,0 +1,74 @@
+from collections import OrderedDict, deque
+
+
+class LectureContextStore:
+    """
+    The most recent transcript chunks of each active lecture, kept in process so the
+    pipeline does not query the database for them on every chunk.
+
+    A lecture is loaded from the database once (`load`) on a cold start, after it was
+    evicted, or after `invalidate`; from then on chunks are appended as they are
+    committed. `context` joins the newest chunks that fit both the chunk and character
+    budgets (roughly 4 characters per token), oldest first. Only the most recently used
+    `max_lectures` lectures are kept.
+    """
+
+    def __init__(self, max_chunks: int = 4, max_chars: int = 6000, max_lectures: int = 256) -> None:
+        self.max_chunks = max_chunks
+        self.max_chars = max_chars
+        self.max_lectures = max_lectures
+        self._lectures: OrderedDict[str, deque[str]] = OrderedDict()
+        self.loads = 0
+
+    def is_loaded(self, lecture_id: str) -> bool:
+        return lecture_id in self._lectures
+
+    def load(self, lecture_id: str, texts: list[str]) -> None:
+        """
+        Replaces a lecture's chunks with `texts`, oldest first.
+        """
+        self.loads += 1
+        self._lectures[lecture_id] = deque((t for t in texts if t), maxlen=self.max_chunks)
+        self._touch(lecture_id)
+
+    def append(self, lecture_id: str, text: str) -> None:
+        chunks = self._lectures.get(lecture_id)
+        if chunks is None:
+            chunks = self._lectures[lecture_id] = deque(maxlen=self.max_chunks)
+        if text:
+            chunks.append(text)
+        self._touch(lecture_id)
+
+    def invalidate(self, lecture_id: str) -> None:
+        self._lectures.pop(lecture_id, None)
+
+    def _touch(self, lecture_id: str) -> None:
+        self._lectures.move_to_end(lecture_id)
+        while len(self._lectures) > self.max_lectures:
+            self._lectures.popitem(last=False)
+
+    def chunks(self, lecture_id: str, max_chunks: int | None = None, max_chars: int | None = None) -> list[str]:
+        """
+        The newest chunks within the budgets, oldest first. The newest chunk is always
+        included (truncated to its tail) if anything is.
+        """
+        max_chunks = self.max_chunks if max_chunks is None else max_chunks
+        max_chars = self.max_chars if max_chars is None else max_chars
+        selected: list[str] = []
+        used = 0
+        for text in reversed(self._lectures.get(lecture_id, ())):
+            if len(selected) >= max_chunks:
+                break
+            if used + len(text) > max_chars:
+                if not selected and max_chars > 0:
+                    selected.append(text[-max_chars:])
+                break
+            selected.append(text)
+            used += len(text) + 1
+        return selected[::-1]
+
+    def context(self, lecture_id: str, max_chunks: int | None = None, max_chars: int | None = None) -> str:
+        return "\n".join(self.chunks(lecture_id, max_chunks, max_chars))
+
+    def stats(self) -> dict:
+        return {"lectures": len(self._lectures), "loads": self.loads}
@@ -0,0 +1,91 @@
+import asyncio
+
+
+class _Stage:
+    __slots__ = ("head", "released", "waiters")
+
+    def __init__(self) -> None:
+        # Lowest ticket that has not released this stage yet
+        self.head = 0
+        self.released: set[int] = set()
+        self.waiters: dict[int, asyncio.Future] = {}
+
+
+class LectureSequencer:
+    """
+    Orders the commit stages of a lecture's transcript chunks.
+
+    Each chunk takes a ticket on arrival (`enter`). Work outside a stage, like the LLM
+    calls, runs concurrently across chunks; `wait_turn(lecture_id, ticket, stage)`
+    returns once every earlier ticket has released that stage, so whatever a chunk does
+    between its turn and its `release` (registering concepts, writing to the database)
+    is applied in arrival order. `leave` releases every stage still held and must always
+    be called, so chunks that fail or are cancelled skip their turns instead of
+    blocking the chunks behind them.
+    """
+
+    def __init__(self, stages: tuple[str, ...]) -> None:
+        self.stages = stages
+        self._lectures: dict[str, dict] = {}
+
+    def enter(self, lecture_id: str) -> int:
+        lecture = self._lectures.get(lecture_id)
+        if lecture is None:
+            lecture = self._lectures[lecture_id] = {"next": 0, "stages": {stage: _Stage() for stage in self.stages}}
+        ticket = lecture["next"]
+        lecture["next"] += 1
+        return ticket
+
+    def is_turn(self, lecture_id: str, ticket: int, stage: str) -> bool:
+        """
+        True when every earlier chunk has released `stage`.
+        """
+        lecture = self._lectures.get(lecture_id)
+        return lecture is not None and lecture["stages"][stage].head == ticket
+
+    async def wait_turn(self, lecture_id: str, ticket: int, stage: str) -> None:
+        """
+        Waits until every earlier ticket has released `stage`.
+        """
+        state = self._lectures[lecture_id]["stages"][stage]
+        if state.head == ticket:
+            return
+        future = state.waiters[ticket] = asyncio.get_running_loop().create_future()
+        try:
+            await future
+        finally:
+            state.waiters.pop(ticket, None)
+
+    def release(self, lecture_id: str, ticket: int, stage: str) -> None:
+        lecture = self._lectures.get(lecture_id)
+        if lecture is None:
+            return
+        state = lecture["stages"][stage]
+        if ticket < state.head or ticket in state.released:
+            return
+        state.released.add(ticket)
+        while state.head in state.released:
+            state.released.discard(state.head)
+            state.head += 1
+        waiter = state.waiters.get(state.head)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        # Forget lectures with nothing in flight; the next chunk starts a fresh sequence
+        if all(s.head == lecture["next"] for s in lecture["stages"].values()):
+            del self._lectures[lecture_id]
+
+    def leave(self, lecture_id: str, ticket: int) -> None:
+        """
+        Releases every stage the ticket has not released yet.
+        """
+        for stage in self.stages:
+            self.release(lecture_id, ticket, stage)
+
+    def stats(self) -> dict:
+        return {
+            "lectures": len(self._lectures),
+            "chunks_in_flight": sum(
+                lecture["next"] - min(s.head for s in lecture["stages"].values())
+                for lecture in self._lectures.values()
+            ),
+        }
@@ -0,0 +1,186 @@
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+
+class DiskCacheStore:
+    """
+    Persistent cache tier that keeps one JSON file per key under `root`.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return entry.get("value")
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"value": value, "expires_at": expires_at}), encoding="utf-8")
+        tmp.replace(path)
+
+
+class MongoCacheStore:
+    """
+    Persistent cache tier backed by a Mongo collection keyed by the cache key.
+    """
+
+    def __init__(self, collection) -> None:
+        self.collection = collection
+
+    def get(self, key: str) -> Any:
+        doc = self.collection.find_one({"_id": key})
+        if not doc:
+            return None
+        if doc.get("expires_at", 0) < time.time():
+            self.collection.delete_one({"_id": key})
+            return None
+        return doc.get("value")
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": expires_at}},
+            upsert=True
+        )
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for Gemini responses.
+
+    Keys are a hash of (model, response kind, schema, prompt). Lookups hit an in-memory
+    LRU with a TTL first and fall through to an optional persistent store (disk or Mongo),
+    promoting persistent hits back into memory.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600, store: DiskCacheStore | MongoCacheStore | None = None) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, kind: str, prompt: str, schema: Any = None) -> str:
+        if schema is None:
+            schema_id = ""
+        elif hasattr(schema, "model_json_schema"):
+            schema_id = json.dumps(schema.model_json_schema(), sort_keys=True)
+        else:
+            schema_id = json.dumps(schema, sort_keys=True, default=str)
+        digest = hashlib.sha256()
+        for part in (model, kind, schema_id, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _get_memory(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+        # Callers may mutate parsed JSON; never hand out the cached object itself
+        return copy.deepcopy(value)
+
+    def _set_memory(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_store(self, key: str) -> Any:
+        if self.store is None:
+            return None
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            print(f"LLM cache store read error: {e}")
+            return None
+        if value is not None:
+            with self._lock:
+                self.store_hits += 1
+            self._set_memory(key, value, time.time() + self.ttl_seconds)
+        return value
+
+    def _set_store(self, key: str, value: Any, expires_at: float) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, value, expires_at)
+        except Exception as e:
+            print(f"LLM cache store write error: {e}")
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def get(self, key: str) -> Any:
+        value = self._get_memory(key)
+        if value is None:
+            value = self._get_store(key)
+        if value is None:
+            self._miss()
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._set_memory(key, value, expires_at)
+        self._set_store(key, value, expires_at)
+
+    async def get_async(self, key: str) -> Any:
+        value = self._get_memory(key)
+        if value is None and self.store is not None:
+            value = await asyncio.to_thread(self._get_store, key)
+        if value is None:
+            self._miss()
+        return value
+
+    async def set_async(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._set_memory(key, value, expires_at)
+        if self.store is not None:
+            await asyncio.to_thread(self._set_store, key, value, expires_at)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.store_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+            }
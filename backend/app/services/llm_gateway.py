@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any
+from google import genai
+
+
+class _ModelSlots:
+    """
+    In-flight budget for one model, shared by coroutines on the event loop and blocking
+    calls in worker threads. Waiters of both kinds are served in arrival order; a
+    released slot is handed straight to the next waiter.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters: deque[asyncio.Future | threading.Event] = deque()
+
+    def _try_take(self) -> bool:
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        with self._lock:
+            if self._try_take():
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                handed_over = future not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(future)
+            # A slot handed to a cancelled future is passed on by _grant
+            if handed_over and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def acquire_sync(self) -> None:
+        with self._lock:
+            if self._try_take():
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self.in_use -= 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        try:
+            waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+        except RuntimeError:
+            # The waiter's event loop is closed; pass the slot on
+            self.release()
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class LLMGateway:
+    """
+    Shared entry point to the Gemini API.
+
+    Every GeminiClient built on the same gateway reuses one genai.Client (and so one
+    HTTP connection pool). Calls are admitted through a per-model slot so that only a
+    bounded number of requests are in flight for each model; the rest queue here
+    instead of piling onto the provider and tripping rate limits.
+    """
+
+    def __init__(self, api_key: str, default_limit: int = 8, model_limits: dict[str, int] | None = None, client: Any = None) -> None:
+        self.api_key = api_key
+        self.default_limit = max(1, default_limit)
+        self.model_limits = model_limits or {}
+        # `client` swaps in another backend with the genai.Client surface (see llm_replay)
+        self.client = client or genai.Client(
+            api_key=self.api_key,
+            http_options={'api_version': 'v1beta'}
+        )
+        # One budget per model for both the async and the blocking client methods
+        self._slots: dict[str, _ModelSlots] = {}
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, int] = {}
+        self._waiting: dict[str, int] = {}
+
+    def limit_for(self, model: str) -> int:
+        return max(1, self.model_limits.get(model, self.default_limit))
+
+    def _slots_for(self, model: str) -> _ModelSlots:
+        with self._lock:
+            slots = self._slots.get(model)
+            if slots is None:
+                slots = self._slots[model] = _ModelSlots(self.limit_for(model))
+            return slots
+
+    def _bump(self, counter: dict[str, int], model: str, delta: int) -> None:
+        with self._lock:
+            counter[model] = counter.get(model, 0) + delta
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        """
+        Waits for a free request slot for `model` (FIFO) and holds it for the block.
+        Yields the time spent waiting in the queue, in seconds.
+        """
+        slots = self._slots_for(model)
+        self._bump(self._waiting, model, 1)
+        queued_at = time.monotonic()
+        try:
+            await slots.acquire()
+        finally:
+            self._bump(self._waiting, model, -1)
+        self._bump(self._in_flight, model, 1)
+        try:
+            yield time.monotonic() - queued_at
+        finally:
+            self._bump(self._in_flight, model, -1)
+            slots.release()
+
+    @contextmanager
+    def slot_sync(self, model: str):
+        """
+        Blocking variant of `slot` for the synchronous client methods, which run in
+        FastAPI's threadpool. Draws on the same per-model budget as `slot`.
+        """
+        slots = self._slots_for(model)
+        self._bump(self._waiting, model, 1)
+        queued_at = time.monotonic()
+        try:
+            slots.acquire_sync()
+        finally:
+            self._bump(self._waiting, model, -1)
+        self._bump(self._in_flight, model, 1)
+        try:
+            yield time.monotonic() - queued_at
+        finally:
+            self._bump(self._in_flight, model, -1)
+            slots.release()
+
+    def is_saturated(self, model: str) -> bool:
+        with self._lock:
+            return self._waiting.get(model, 0) > 0 or self._in_flight.get(model, 0) >= self.limit_for(model)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            models = set(self._in_flight) | set(self._waiting) | set(self.model_limits)
+            return {
+                model: {
+                    "limit": self.limit_for(model),
+                    "in_flight": self._in_flight.get(model, 0),
+                    "waiting": self._waiting.get(model, 0),
+                }
+                for model in sorted(models)
+            }
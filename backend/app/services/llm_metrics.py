@@ -0,0 +1,167 @@
+import threading
+import time
+from typing import Any
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (cumulative counts per upper bound, Prometheus style).
+    """
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Upper bound of the bucket containing the q-th observation.
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict[str, Any]:
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative.append([bound, running])
+        cumulative.append(["+Inf", self.count])
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": cumulative,
+        }
+
+
+class _PromptStats:
+    def __init__(self) -> None:
+        self.outcomes: dict[str, int] = {}
+        self.queue_wait = Histogram(LATENCY_BUCKETS)
+        self.ttfb = Histogram(LATENCY_BUCKETS)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.input_tokens = Histogram(TOKEN_BUCKETS)
+        self.output_tokens = Histogram(TOKEN_BUCKETS)
+        self.cached_tokens = 0
+        self.cost_usd = 0.0
+
+
+class LLMCall:
+    """
+    Measurements for one GeminiClient call, across any retries or hedged attempts.
+    """
+
+    def __init__(self, metrics: "LLMMetrics | None", prompt_name: str | None, model: str) -> None:
+        self.metrics = metrics
+        self.prompt_name = prompt_name or "unnamed"
+        self.model = model
+        self.started = time.monotonic()
+        self.queue_wait: float | None = None
+        self.ttfb: float | None = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+
+    def waited(self, seconds: float) -> None:
+        # Only the first slot counts; retries and hedged attempts would count the call twice
+        if self.queue_wait is None:
+            self.queue_wait = seconds
+
+    def first_byte(self) -> None:
+        if self.ttfb is None:
+            self.ttfb = time.monotonic() - self.started
+
+    def usage(self, response: Any) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        self.input_tokens = usage.prompt_token_count or 0
+        self.output_tokens = usage.candidates_token_count or 0
+        self.cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+
+    def finish(self, outcome: str) -> None:
+        if self.metrics is not None:
+            self.metrics.record(self, outcome, time.monotonic() - self.started)
+
+
+class LLMMetrics:
+    """
+    Per (prompt name, model) aggregation of Gemini call measurements.
+
+    `pricing` maps a model to USD per million tokens, e.g.
+    {"gemini-3-flash-preview": {"input": 0.5, "output": 3.0, "cached_input": 0.05}}.
+    """
+
+    def __init__(self, pricing: dict[str, dict[str, float]] | None = None) -> None:
+        self.pricing = pricing or {}
+        self._stats: dict[tuple[str, str], _PromptStats] = {}
+        self._lock = threading.Lock()
+
+    def _cost(self, call: LLMCall) -> float:
+        price = self.pricing.get(call.model)
+        if not price:
+            return 0.0
+        uncached = max(0, call.input_tokens - call.cached_tokens)
+        cached_rate = price.get("cached_input", price.get("input", 0.0))
+        return (
+            uncached * price.get("input", 0.0)
+            + call.cached_tokens * cached_rate
+            + call.output_tokens * price.get("output", 0.0)
+        ) / 1_000_000
+
+    def record(self, call: LLMCall, outcome: str, latency: float) -> None:
+        with self._lock:
+            stats = self._stats.setdefault((call.prompt_name, call.model), _PromptStats())
+            stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+            stats.latency.observe(latency)
+            if outcome == "cache_hit":
+                return
+            if call.queue_wait is not None:
+                stats.queue_wait.observe(call.queue_wait)
+            if call.ttfb is not None:
+                stats.ttfb.observe(call.ttfb)
+            if call.input_tokens or call.output_tokens:
+                stats.input_tokens.observe(call.input_tokens)
+                stats.output_tokens.observe(call.output_tokens)
+                stats.cached_tokens += call.cached_tokens
+                stats.cost_usd += self._cost(call)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            prompts: dict[str, dict[str, Any]] = {}
+            for (prompt_name, model), stats in sorted(self._stats.items()):
+                prompts.setdefault(prompt_name, {})[model] = {
+                    "calls": sum(stats.outcomes.values()),
+                    "outcomes": dict(stats.outcomes),
+                    "queue_wait_seconds": stats.queue_wait.snapshot(),
+                    "ttfb_seconds": stats.ttfb.snapshot(),
+                    "latency_seconds": stats.latency.snapshot(),
+                    "input_tokens": stats.input_tokens.snapshot(),
+                    "output_tokens": stats.output_tokens.snapshot(),
+                    "cached_input_tokens": stats.cached_tokens,
+                    "cost_usd": round(stats.cost_usd, 6),
+                }
+            return {"prompts": prompts}
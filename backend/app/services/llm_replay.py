@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, AsyncIterator
+from app.services.gemini import ContextCachingUnsupported
+
+
+def request_key(model: str, contents: Any, config: Any) -> str:
+    """
+    Stable hash of a generate_content request: model, prompt and the response shape.
+    """
+    mime = getattr(config, "response_mime_type", None) or ""
+    tools = "search" if getattr(config, "tools", None) else ""
+    digest = hashlib.sha256()
+    for part in (model, mime, tools, contents if isinstance(contents, str) else json.dumps(contents, default=str)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LatencyModel:
+    """
+    Synthetic latency distribution parsed from a spec string:
+    "none", "fixed:<s>", "uniform:<min>:<max>" or "lognormal:<median>:<sigma>".
+    """
+
+    def __init__(self, spec: str = "none") -> None:
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ("none", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma)
+        return 0.0
+
+
+class RecordingStore:
+    """
+    Append-only JSONL file of {"key", "model", "text"} records, loaded into memory.
+    The last record for a key wins.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.records: dict[str, str] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record["key"]] = record["text"]
+
+    def get(self, key: str) -> str | None:
+        return self.records.get(key)
+
+    def add(self, key: str, model: str, text: str) -> None:
+        with self._lock:
+            self.records[key] = text
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "model": model, "text": text}) + "\n")
+
+    async def add_async(self, key: str, model: str, text: str) -> None:
+        # The file append would otherwise block the event loop
+        await asyncio.to_thread(self.add, key, model, text)
+
+
+def _response(text: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(content=text, grounding_metadata=None)] if text else [],
+        usage_metadata=None,
+    )
+
+
+class _ReplayModels:
+    def __init__(self, backend: "ReplayClient") -> None:
+        self.backend = backend
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        text, delay = self.backend.lookup(model, contents, config)
+        time.sleep(delay)
+        return _response(text)
+
+
+class _AsyncReplayModels:
+    def __init__(self, backend: "ReplayClient") -> None:
+        self.backend = backend
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        text, delay = self.backend.lookup(model, contents, config)
+        await asyncio.sleep(delay)
+        return _response(text)
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[SimpleNamespace]:
+        text, delay = self.backend.lookup(model, contents, config)
+        chunk_size = self.backend.stream_chunk_chars
+
+        async def chunks():
+            # Time to first byte gets half the sampled latency, the remaining chunks share the rest
+            n = max(1, math.ceil(len(text) / chunk_size))
+            await asyncio.sleep(delay / 2)
+            for i in range(n):
+                if i:
+                    await asyncio.sleep(delay / 2 / n)
+                yield _response(text[i * chunk_size:(i + 1) * chunk_size])
+
+        return chunks()
+
+
+class _UnsupportedCaches:
+    async def create(self, *args, **kwargs):
+        # Recorded prompts must match replayed ones, so GeminiClient sends static prefixes inline
+        raise ContextCachingUnsupported("Context caching is not available on the record/replay backends")
+
+
+class ReplayClient:
+    """
+    Offline stand-in for genai.Client that answers from recorded responses.
+
+    Responses are looked up by request hash. Each answer is delayed by a sample from
+    `latency`, seeded per (key, occurrence) so a replayed run is reproducible regardless
+    of scheduling order. Unknown requests raise LookupError, or get `miss_text` when set.
+    """
+
+    def __init__(self, store: RecordingStore, latency: LatencyModel | None = None, seed: int = 0, miss_text: str | None = None, stream_chunk_chars: int = 256) -> None:
+        self.store = store
+        self.latency = latency or LatencyModel()
+        self.seed = seed
+        self.miss_text = miss_text
+        self.stream_chunk_chars = stream_chunk_chars
+        self.models = _ReplayModels(self)
+        self.aio = SimpleNamespace(models=_AsyncReplayModels(self), caches=_UnsupportedCaches())
+        self.caches = _UnsupportedCaches()
+        self._occurrences: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, model: str, contents: Any, config: Any) -> tuple[str, float]:
+        key = request_key(model, contents, config)
+        with self._lock:
+            occurrence = self._occurrences.get(key, 0)
+            self._occurrences[key] = occurrence + 1
+            text = self.store.get(key)
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if text is None:
+            if self.miss_text is None:
+                raise LookupError(f"No recorded response for request {key[:12]} ({model})")
+            text = self.miss_text
+        rng = random.Random(f"{self.seed}:{key}:{occurrence}")
+        return text, self.latency.sample(rng)
+
+
+class _RecordingModels:
+    def __init__(self, inner: Any, store: RecordingStore) -> None:
+        self.inner = inner
+        self.store = store
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> Any:
+        response = self.inner.generate_content(model=model, contents=contents, config=config)
+        self.store.add(request_key(model, contents, config), model, response.text or "")
+        return response
+
+
+class _AsyncRecordingModels:
+    def __init__(self, inner: Any, store: RecordingStore) -> None:
+        self.inner = inner
+        self.store = store
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> Any:
+        response = await self.inner.generate_content(model=model, contents=contents, config=config)
+        await self.store.add_async(request_key(model, contents, config), model, response.text or "")
+        return response
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[Any]:
+        stream = await self.inner.generate_content_stream(model=model, contents=contents, config=config)
+
+        async def chunks():
+            parts = []
+            async for chunk in stream:
+                parts.append(chunk.text or "")
+                yield chunk
+            await self.store.add_async(request_key(model, contents, config), model, "".join(parts))
+
+        return chunks()
+
+
+class RecordingClient:
+    """
+    Wraps a real genai.Client and appends every response to a RecordingStore for later replay.
+    Context caching is disabled so recorded prompts match what the replay backend will see.
+    """
+
+    def __init__(self, inner: Any, store: RecordingStore) -> None:
+        self.inner = inner
+        self.models = _RecordingModels(inner.models, store)
+        self.aio = SimpleNamespace(models=_AsyncRecordingModels(inner.aio.models, store), caches=_UnsupportedCaches())
+        self.caches = _UnsupportedCaches()
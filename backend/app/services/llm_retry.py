@@ -0,0 +1,126 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+from google.genai import errors as genai_errors
+
+from app.config import LLMCallPolicy
+
+T = TypeVar("T")
+
+# HTTP statuses worth another attempt: timeouts, rate limiting and transient server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies, used to pick the hedging delay.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.samples: deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def p95(self) -> float | None:
+        return self.percentile(0.95)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code in RETRYABLE_STATUS
+    return False
+
+
+def backoff_delay(policy: LLMCallPolicy, attempt: int) -> float:
+    # Full jitter: spread retries uniformly so synchronized failures don't retry in lockstep
+    cap = min(policy.backoff_max_seconds, policy.backoff_base_seconds * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+async def _hedged(attempt: Callable[[], Awaitable[T]], hedge_after: float) -> T:
+    """
+    Starts `attempt`; if it has not finished after `hedge_after` seconds, starts a second
+    copy and returns whichever succeeds first, cancelling the other.
+    """
+    tasks = {asyncio.ensure_future(attempt())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.add(asyncio.ensure_future(attempt()))
+        error: BaseException | None = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_policy(
+    attempt: Callable[[], Awaitable[T]],
+    policy: LLMCallPolicy,
+    hedge_after: float | None = None,
+) -> T:
+    """
+    Runs `attempt` under `policy`: each try is bounded by the attempt timeout, retryable
+    failures back off with jitter, and nothing runs past the overall deadline. When
+    `hedge_after` is set a duplicate request is raced against slow attempts.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.deadline_seconds
+    retries = 0
+    async with asyncio.timeout_at(deadline):
+        while True:
+            timeout = min(policy.attempt_timeout_seconds, deadline - loop.time())
+            try:
+                if hedge_after is not None and hedge_after < timeout:
+                    return await asyncio.wait_for(_hedged(attempt, hedge_after), timeout)
+                return await asyncio.wait_for(attempt(), timeout)
+            except Exception as e:
+                if retries >= policy.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(policy, retries)
+                if loop.time() + delay >= deadline:
+                    raise
+                retries += 1
+                print(f"DEBUG: Retrying LLM call ({retries}/{policy.max_retries}) in {delay:.2f}s after: {e}")
+                await asyncio.sleep(delay)
+
+
+def call_with_policy_sync(attempt: Callable[[], T], policy: LLMCallPolicy) -> T:
+    """
+    Blocking variant of `call_with_policy`: retries and the overall deadline apply between
+    attempts, but an individual blocking call cannot be interrupted or hedged.
+    """
+    deadline = time.monotonic() + policy.deadline_seconds
+    retries = 0
+    while True:
+        try:
+            return attempt()
+        except Exception as e:
+            if retries >= policy.max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(policy, retries)
+            if time.monotonic() + delay >= deadline:
+                raise
+            retries += 1
+            print(f"DEBUG: Retrying LLM call ({retries}/{policy.max_retries}) in {delay:.2f}s after: {e}")
+            time.sleep(delay)
@@ -0,0 +1,197 @@
+import asyncio
+import json
+from typing import Any
+from app.services.result_replay import ResultReplayBuffer
+
+try:
+    import msgpack
+except ImportError:  # Optional compact binary encoding; JSON is used without it
+    msgpack = None
+
+
+def compact_results(results: dict[str, Any]) -> dict[str, Any]:
+    """
+    A pipeline_result payload without its empty lists.
+    """
+    return {key: value for key, value in results.items() if value}
+
+
+class OutboundChannel:
+    """
+    Per-connection outbound queue for websocket frames.
+
+    Frames sent within one tick are coalesced: pipeline_result frames of a lecture
+    are merged into a single delta frame carrying only non-empty result lists, and
+    consecutive simulation_progress deltas for the same simulation are concatenated.
+    Replayed and merged results go out first, then the remaining frames in order (progress for a
+    simulation is only applied once the client has its pending entry). Frames are
+    encoded as compact JSON text, or as msgpack binary frames if the client asked for
+    it and msgpack is installed; permessage-deflate is negotiated by the server.
+
+    With a `replay` buffer, every result delta is recorded under its lecture's next
+    sequence number first, even once the connection is gone, and frames carry the
+    `epoch` and highest `seq` they contain; `resume` sends a reconnecting client what
+    it missed.
+
+    `send_json` keeps the WebSocket signature so pipeline code can use either. Once a
+    send fails the channel is closed and further sends raise.
+    """
+
+    def __init__(self, websocket, tick_seconds: float = 0.05, encoding: str = "json", replay: ResultReplayBuffer | None = None) -> None:
+        self.websocket = websocket
+        self.replay = replay
+        # Sequence numbers already queued on this connection, per lecture (only those
+        # the replay buffer can still hold matter)
+        self._queued_seqs: dict[str, set[int]] = {}
+        self.tick_seconds = tick_seconds
+        self.encoding = "msgpack" if encoding == "msgpack" and msgpack is not None else "json"
+        self.closed = False
+        self._replays: list[dict] = []
+        self._results: dict[str, dict] = {}
+        self._frames: list[dict] = []
+        self._progress: dict[tuple, dict] = {}
+        self._flush_task: asyncio.Task | None = None
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+
+    async def send_json(self, frame: dict) -> None:
+        if frame.get("type") == "pipeline_result":
+            # Recorded before the closed check: a resuming client gets it later
+            results = compact_results(frame.get("results") or {})
+            if not results:
+                return
+            stamp = self._record(frame.get("lecture_id"), results)
+            if self.closed:
+                raise RuntimeError("Websocket connection is closed")
+            self.frames_in += 1
+            self._add_result(frame, results, stamp)
+        elif self.closed:
+            raise RuntimeError("Websocket connection is closed")
+        elif frame.get("type") == "simulation_progress":
+            self.frames_in += 1
+            self._add_progress(frame)
+        else:
+            self.frames_in += 1
+            self._frames.append(frame)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def _record(self, lecture_id: str, results: dict) -> dict:
+        if self.replay is None:
+            return {}
+        results = {key: [dict(item) if isinstance(item, dict) else item for item in items] for key, items in results.items()}
+        epoch, seq = self.replay.record(lecture_id, results)
+        queued = self._queued_seqs.setdefault(lecture_id, set())
+        queued.add(seq)
+        if len(queued) > self.replay.max_frames:
+            queued.difference_update([s for s in queued if s <= seq - self.replay.max_frames])
+        return {"epoch": epoch, "seq": seq}
+
+    def _add_result(self, frame: dict, results: dict, stamp: dict) -> None:
+        lecture_id = frame.get("lecture_id")
+        pending = self._results.get(lecture_id)
+        if pending is None:
+            pending = self._results[lecture_id] = {**frame, "results": {}}
+        pending.update(stamp)
+        for key, items in results.items():
+            # Frames are encoded at flush time; copy so later edits by the sender don't leak in
+            pending["results"].setdefault(key, []).extend(dict(item) if isinstance(item, dict) else item for item in items)
+
+    def _add_progress(self, frame: dict) -> None:
+        key = (frame.get("lecture_id"), frame.get("concept_id"))
+        pending = self._progress.get(key)
+        if pending is not None and pending["offset"] + len(pending["delta"]) == frame.get("offset"):
+            pending["delta"] += frame.get("delta", "")
+            return
+        pending = self._progress[key] = dict(frame)
+        self._frames.append(pending)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.tick_seconds)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        frames = self._replays + list(self._results.values()) + self._frames
+        self._replays = []
+        self._results = {}
+        self._frames = []
+        self._progress = {}
+        for frame in frames:
+            if self.closed:
+                return
+            try:
+                await self._send(frame)
+            except Exception as e:
+                self.closed = True
+                print(f"Could not send websocket frame (client likely disconnected): {e}")
+
+    async def _send(self, frame: dict) -> None:
+        if self.encoding == "msgpack":
+            data = msgpack.packb(frame, use_bin_type=True)
+            await self.websocket.send_bytes(data)
+        else:
+            data = json.dumps(frame, separators=(",", ":"))
+            await self.websocket.send_text(data)
+        self.frames_out += 1
+        self.bytes_out += len(data)
+
+    async def resume(self, lecture_id: str, epoch: str | None, resume_from: int) -> None:
+        """
+        Queues one frame with every result of the lecture recorded after `resume_from`,
+        or a resume_gap frame if they are not all available any more.
+        """
+        missed = self.replay.since(lecture_id, epoch, resume_from) if self.replay else None
+        if missed is None:
+            await self.send_json({"type": "resume_gap", "lecture_id": lecture_id})
+            return
+        epoch, deltas = missed
+        # Anything already queued on this connection is delivered by the normal path
+        queued = self._queued_seqs.get(lecture_id, ())
+        deltas = [(seq, results) for seq, results in deltas if seq not in queued]
+        if not deltas:
+            return
+        merged: dict[str, list] = {}
+        for _, results in deltas:
+            for key, items in results.items():
+                merged.setdefault(key, []).extend(items)
+        # Claim only the seqs up to the first one left to this connection's own frames,
+        # so a client cut off before those arrive resumes from the right place
+        replayed = {seq for seq, _ in deltas}
+        covered = resume_from
+        while covered + 1 in replayed:
+            covered += 1
+        print(f"DEBUG: Replaying {len(deltas)} results for lecture {lecture_id} after seq {resume_from}")
+        self.frames_in += 1
+        self._replays.append({
+            "type": "pipeline_result",
+            "lecture_id": lecture_id,
+            "epoch": epoch,
+            "seq": covered,
+            "replayed": True,
+            "results": merged,
+        })
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def close(self) -> None:
+        """
+        Drops anything still queued; the connection is gone.
+        """
+        self.closed = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._replays = []
+        self._results = {}
+        self._frames = []
+        self._progress = {}
+
+    def stats(self) -> dict:
+        return {
+            "encoding": self.encoding,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "bytes_out": self.bytes_out,
+        }
@@ -1,47 +1,46 @@
 import json
 import time
-from typing import Any
-from app.services.gemini import GeminiClient
+from typing import Any, Awaitable, Callable
+from app.services.gemini import GeminiClient, parse_json_from_text
+from app.services.json_stream import JsonArrayStreamParser
 from app.services.youtube import YouTubeClient
 from app.services.simulation import SimulationService
+from app.services.prompts import prompts
 from app.schemas import Concept, VideoResult
-from pathlib import Path
-
-PROMPT_DIR = Path(__file__).parent.parent / "prompts"
-
-def load_prompt(name: str) -> str:
-    path = PROMPT_DIR / f"{name}.md"
-    return path.read_text(encoding="utf-8")
 
 class PipelineService:
-    def __init__(self, gemini_client: GeminiClient, youtube_client: YouTubeClient, simulation_service: SimulationService):
+    def __init__(self, gemini_client: GeminiClient, youtube_client: YouTubeClient, simulation_service: SimulationService, streaming: bool = False):
         self.gemini = gemini_client
         self.youtube = youtube_client
         self.simulation = simulation_service
+        # Stream the decision and act on each action as soon as it is complete
+        self.streaming = streaming
 
-    async def process_chunk(self, text: str, previous_context: str, lecture_id: str, existing_concepts: dict[str, str] = None) -> dict[str, Any]:
-        prompt_template = load_prompt("pipeline_decision")
-        
+    async def process_chunk(
+        self,
+        text: str,
+        previous_context: str,
+        lecture_id: str,
+        existing_concepts: dict[str, str] = None,
+        on_partial: Callable[[dict[str, Any]], Awaitable[None]] | None = None,
+    ) -> dict[str, Any]:
+        """
+        Runs the pipeline decision for a transcript chunk and returns the resulting
+        concepts and pending work. If `on_partial` is given it is awaited with the items
+        each action added (e.g. {"concepts": [...]}) as soon as that action is parsed,
+        so callers can start work before the whole decision has been generated.
+        """
         context_concepts = ", ".join(existing_concepts.keys()) if existing_concepts else "None"
         if not context_concepts:
             context_concepts = "None"
         
-        prompt = (
-            prompt_template.replace("{{previous_context}}", previous_context)
-            .replace("{{transcript_chunk}}", text)
-            .replace("{{existing_concepts}}", context_concepts)
+        prompt = prompts.render(
+            "pipeline_decision",
+            previous_context=previous_context,
+            transcript_chunk=text,
+            existing_concepts=context_concepts
         )
 
-        try:
-            # Async call to Gemini
-            data = await self.gemini.generate_json_async(prompt)
-            print(f"DEBUG: Pipeline raw output: {json.dumps(data)}")
-            print(f"DEBUG: Pipeline received actions: {[a.get('type') for a in (data or {}).get('actions', [])]}")
-        except Exception as e:
-            print(f"Pipeline Gemini Error: {e}")
-            return {"error": str(e)}
-
-        actions = (data or {}).get("actions", [])
         results = {
             "concepts": [],
             "videos": [],
@@ -51,122 +50,189 @@ class PipelineService:
             "reference_texts": []
         }
 
-        for action in actions:
-            a_type = action.get("type")
-            payload = action.get("payload", {})
-
-            if a_type == "EXTRACT_CONCEPT":
-                keyword = payload.get("keyword")
-                definition = payload.get("definition")
-                if keyword:
-                    # Basic determination of STEM vs not (simplified)
-                    stem = True 
-                    unique_id = f"concept_{lecture_id}_{int(time.time()*1000)}_{len(results['concepts'])}"
-                    results["concepts"].append({
-                        "id": unique_id,
-                        "keyword": keyword,
-                        "definition": definition,
-                        "stem_concept": stem
-                    })
-
-            elif a_type == "SEARCH_REFERENCE":
-                query = payload.get("query")
-                context_concept = payload.get("context_concept")
-                if query:
-                    # Try to find the matching concept ID from this same chunk processing or existing concepts
-                    matching_concept = next((c for c in results["concepts"] if c["keyword"] == context_concept), None)
-                    if matching_concept:
-                        context_id = matching_concept["id"]
-                    elif existing_concepts and context_concept in existing_concepts:
-                        context_id = existing_concepts[context_concept]
-                    else:
-                        context_id = f"ref_{int(time.time()*1000)}"
-                    
-                    # Store request for background processing (Video)
-                    results.setdefault("video_requests", []).append({
-                        "query": query,
-                        "context_concept": context_concept,
-                        "context_concept_id": context_id
-                    })
-                    
-                    # Store request for background processing (Text)
-                    results.setdefault("text_reference_requests", []).append({
-                        "query": query,
-                        "context_concept": context_concept,
-                        "context_concept_id": context_id
-                    })
-
-            elif a_type == "GENERATE_SIMULATION":
-                concept = payload.get("concept")
-                desc = payload.get("description")
-                if concept:
-                    # Try to find the matching concept ID from this same chunk processing
-                    matching_concept = next((c for c in results["concepts"] if c["keyword"].lower() == concept.lower()), None)
-                    
-                    # If it's a new concept in this chunk, use its generated ID.
-                    # If it's an existing concept from previous chunks, use its known ID.
-                    # Otherwise, generate a deterministic-ish ID based on keyword.
-                    if matching_concept:
-                        concept_id = matching_concept["id"]
-                    elif existing_concepts and concept in existing_concepts:
-                        concept_id = existing_concepts[concept]
-                    else:
-                        # Fallback to a keyword-based ID that the frontend can use to link
-                        slug = concept.lower().replace(" ", "_")
-                        concept_id = f"sim_link_{slug}"
-
-                    results["simulations"].append({
-                        "concept": concept,
-                        "concept_id": concept_id,
-                        "description": desc,
-                        "status": "pending",
-                        "code": None
-                    })
-
-            elif a_type == "CREATE_FLASHCARD":
-                concept = payload.get("concept")
-                topic = payload.get("topic")
+        async def apply(action: dict):
+            partial = self._apply_action(action, results, lecture_id, existing_concepts)
+            if partial and on_partial:
+                await on_partial(partial)
+
+        try:
+            if self.streaming:
+                actions = await self._stream_actions(prompt, apply)
+            else:
+                # Async call to Gemini
+                data = await self.gemini.generate_json_async(prompt, prompt_name="pipeline_decision")
+                print(f"DEBUG: Pipeline raw output: {json.dumps(data)}")
+                actions = data.get("actions", []) if isinstance(data, dict) else []
+                for action in actions:
+                    await apply(action)
+            print(f"DEBUG: Pipeline received actions: {[a.get('type') for a in actions]}")
+        except Exception as e:
+            print(f"Pipeline Gemini Error: {e}")
+            return {"error": str(e)}
+
+        self._apply_fallbacks(results)
+        return results
+
+    async def _stream_actions(self, prompt: str, apply: Callable[[dict], Awaitable[None]]) -> list[dict]:
+        parser = JsonArrayStreamParser("actions")
+        actions: list[dict] = []
+        try:
+            async for delta in self.gemini.stream_text_async(prompt, prompt_name="pipeline_decision", json_mode=True):
+                for action in parser.feed(delta):
+                    if isinstance(action, dict):
+                        actions.append(action)
+                        await apply(action)
+        except Exception as e:
+            if actions:
+                # Keep what already arrived rather than redoing work that was dispatched
+                print(f"Pipeline stream interrupted after {len(actions)} actions: {e}")
+                return actions
+            print(f"Pipeline stream failed, retrying without streaming: {e}")
+            data = await self.gemini.generate_json_async(prompt, prompt_name="pipeline_decision")
+            parser.buffer = json.dumps(data) if data is not None else ""
+
+        if not actions:
+            # Unexpected shape (or the non-streaming fallback): parse the full response the old way
+            data = parse_json_from_text(parser.buffer)
+            for action in (data.get("actions", []) if isinstance(data, dict) else []):
+                if isinstance(action, dict):
+                    actions.append(action)
+                    await apply(action)
+        return actions
+
+    def _apply_action(self, action: dict, results: dict[str, Any], lecture_id: str, existing_concepts: dict[str, str] | None) -> dict[str, Any] | None:
+        """
+        Records one pipeline action in `results` and returns the items it added.
+        """
+        a_type = action.get("type")
+        payload = action.get("payload", {})
+
+        if a_type == "EXTRACT_CONCEPT":
+            keyword = payload.get("keyword")
+            definition = payload.get("definition")
+            if keyword:
+                # Basic determination of STEM vs not (simplified)
+                stem = True 
+                unique_id = f"concept_{lecture_id}_{int(time.time()*1000)}_{len(results['concepts'])}"
+                concept_obj = {
+                    "id": unique_id,
+                    "keyword": keyword,
+                    "definition": definition,
+                    "stem_concept": stem
+                }
+                results["concepts"].append(concept_obj)
+                return {"concepts": [concept_obj]}
+
+        elif a_type == "SEARCH_REFERENCE":
+            query = payload.get("query")
+            context_concept = payload.get("context_concept")
+            if query:
+                # Try to find the matching concept ID from this same chunk processing or existing concepts
+                matching_concept = next((c for c in results["concepts"] if c["keyword"] == context_concept), None)
+                if matching_concept:
+                    context_id = matching_concept["id"]
+                elif existing_concepts and context_concept in existing_concepts:
+                    context_id = existing_concepts[context_concept]
+                else:
+                    context_id = f"ref_{int(time.time()*1000)}"
+                
+                # Store request for background processing (Video)
+                video_request = {
+                    "query": query,
+                    "context_concept": context_concept,
+                    "context_concept_id": context_id
+                }
+                results.setdefault("video_requests", []).append(video_request)
+                
+                # Store request for background processing (Text)
+                text_request = {
+                    "query": query,
+                    "context_concept": context_concept,
+                    "context_concept_id": context_id
+                }
+                results.setdefault("text_reference_requests", []).append(text_request)
+                return {"video_requests": [video_request], "text_reference_requests": [text_request]}
+
+        elif a_type == "GENERATE_SIMULATION":
+            concept = payload.get("concept")
+            desc = payload.get("description")
+            if concept:
+                # Try to find the matching concept ID from this same chunk processing
+                matching_concept = next((c for c in results["concepts"] if c["keyword"].lower() == concept.lower()), None)
+                
+                # If it's a new concept in this chunk, use its generated ID.
+                # If it's an existing concept from previous chunks, use its known ID.
+                # Otherwise, generate a deterministic-ish ID based on keyword.
+                if matching_concept:
+                    concept_id = matching_concept["id"]
+                elif existing_concepts and concept in existing_concepts:
+                    concept_id = existing_concepts[concept]
+                else:
+                    # Fallback to a keyword-based ID that the frontend can use to link
+                    slug = concept.lower().replace(" ", "_")
+                    concept_id = f"sim_link_{slug}"
+
+                sim = {
+                    "concept": concept,
+                    "concept_id": concept_id,
+                    "description": desc,
+                    "status": "pending",
+                    "code": None
+                }
+                results["simulations"].append(sim)
+                return {"simulations": [sim]}
+
+        elif a_type == "CREATE_FLASHCARD":
+            concept = payload.get("concept")
+            topic = payload.get("topic")
+            if concept:
+                # Try to link to concept
+                concept_id = None
+                matching_concept = next((c for c in results["concepts"] if c["keyword"].lower() == concept.lower()), None)
+                if matching_concept:
+                    concept_id = matching_concept["id"]
+                elif existing_concepts and concept in existing_concepts:
+                    concept_id = existing_concepts[concept]
+                
+                flashcard_id = f"fc_{int(time.time()*1000)}_{len(results['flashcards'])}"
+                flashcard = {
+                    "id": flashcard_id,
+                    "concept": concept,
+                    "topic": topic,
+                    "concept_id": concept_id,
+                    "status": "pending",
+                    "front": None,
+                    "back": None
+                }
+                results["flashcards"].append(flashcard)
+                return {"flashcards": [flashcard]}
+
+        elif a_type == "GENERATE_QUIZ":
+            topic = payload.get("topic")
+            concept = payload.get("concept")
+            if topic:
+                concept_id = None
                 if concept:
-                    # Try to link to concept
-                    concept_id = None
                     matching_concept = next((c for c in results["concepts"] if c["keyword"].lower() == concept.lower()), None)
                     if matching_concept:
                         concept_id = matching_concept["id"]
                     elif existing_concepts and concept in existing_concepts:
                         concept_id = existing_concepts[concept]
-                    
-                    flashcard_id = f"fc_{int(time.time()*1000)}_{len(results['flashcards'])}"
-                    results["flashcards"].append({
-                        "id": flashcard_id,
-                        "concept": concept,
-                        "topic": topic,
-                        "concept_id": concept_id,
-                        "status": "pending",
-                        "front": None,
-                        "back": None
-                    })
-
-            elif a_type == "GENERATE_QUIZ":
-                topic = payload.get("topic")
-                concept = payload.get("concept")
-                if topic:
-                    concept_id = None
-                    if concept:
-                        matching_concept = next((c for c in results["concepts"] if c["keyword"].lower() == concept.lower()), None)
-                        if matching_concept:
-                            concept_id = matching_concept["id"]
-                        elif existing_concepts and concept in existing_concepts:
-                            concept_id = existing_concepts[concept]
-
-                    quiz_id = f"quiz_{int(time.time()*1000)}_{len(results['quizzes'])}"
-                    results["quizzes"].append({
-                        "id": quiz_id,
-                        "topic": topic,
-                        "concept_id": concept_id,
-                        "status": "pending",
-                        "questions": []
-                    })
 
+                quiz_id = f"quiz_{int(time.time()*1000)}_{len(results['quizzes'])}"
+                quiz = {
+                    "id": quiz_id,
+                    "topic": topic,
+                    "concept_id": concept_id,
+                    "status": "pending",
+                    "questions": []
+                }
+                results["quizzes"].append(quiz)
+                return {"quizzes": [quiz]}
+
+        return None
+
+    def _apply_fallbacks(self, results: dict[str, Any]) -> None:
         # Fallback: Ensure every concept extracted has a corresponding simulation (now also pending) and video search
         extracted_keywords = [c["keyword"] for c in results["concepts"]]
         simulated_keywords = [s["concept"] for s in results["simulations"]]
@@ -213,5 +279,3 @@ class PipelineService:
                     "front": None,
                     "back": None
                 })
-
-        return results
@@ -0,0 +1,83 @@
+import re
+import threading
+from pathlib import Path
+from app.config import settings
+
+PROMPT_DIR = Path(__file__).parent.parent / "prompts"
+PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+
+class PromptTemplate:
+    """
+    A prompt file split once into literal text and {{placeholder}} fields.
+    Rendering is a single pass, so substituted values are never re-scanned for placeholders.
+    """
+
+    def __init__(self, name: str, text: str, mtime: float = 0.0) -> None:
+        self.name = name
+        self.text = text
+        self.mtime = mtime
+        pieces = PLACEHOLDER.split(text)
+        self._literals = pieces[0::2]
+        self._fields = pieces[1::2]
+        self.fields = frozenset(self._fields)
+
+    def render(self, **values) -> str:
+        out = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            value = values.get(field)
+            # Unknown placeholders are left as-is, like the old str.replace chains did
+            out.append("{{" + field + "}}" if value is None else str(value))
+            out.append(literal)
+        return "".join(out)
+
+
+class PromptRegistry:
+    """
+    Loads and compiles the prompt templates under app/prompts once.
+
+    With `hot_reload` a template is recompiled when its file changes on disk.
+    Prompts registered as static prefixes (e.g. system_animation) may be uploaded to the
+    provider's context cache by GeminiClient instead of being re-sent with every call.
+    """
+
+    def __init__(self, prompt_dir: Path = PROMPT_DIR, hot_reload: bool = False) -> None:
+        self.prompt_dir = prompt_dir
+        self.hot_reload = hot_reload
+        self.static_prefixes: set[str] = set()
+        self._templates: dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name: str) -> PromptTemplate:
+        path = self.prompt_dir / f"{name}.md"
+        mtime = path.stat().st_mtime
+        template = PromptTemplate(name, path.read_text(encoding="utf-8"), mtime)
+        with self._lock:
+            self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        template = self._templates.get(name)
+        if template is None:
+            return self._load(name)
+        if self.hot_reload and (self.prompt_dir / f"{name}.md").stat().st_mtime != template.mtime:
+            print(f"DEBUG: Reloading prompt '{name}'")
+            return self._load(name)
+        return template
+
+    def text(self, name: str) -> str:
+        return self.get(name).text
+
+    def render(self, name: str, **values) -> str:
+        return self.get(name).render(**values)
+
+    def reload(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+    def register_static_prefix(self, name: str) -> None:
+        self.get(name)
+        self.static_prefixes.add(name)
+
+
+prompts = PromptRegistry(hot_reload=settings.prompt_hot_reload)
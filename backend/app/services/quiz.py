@@ -1,40 +1,36 @@
+import asyncio
 import json
-from pathlib import Path
 from pydantic import BaseModel
 from app.services.gemini import GeminiClient
+from app.services.prompts import prompts
 from app.schemas import Question, Flashcard
 
-PROMPT_DIR = Path(__file__).parent.parent / "prompts"
-
-def load_prompt(name: str) -> str:
-    path = PROMPT_DIR / f"{name}.md"
-    return path.read_text(encoding="utf-8")
-
 class QuizResponse(BaseModel):
     questions: list[Question]
 
 class FlashcardResponse(BaseModel):
     flashcards: list[Flashcard]
 
+class BatchFlashcard(BaseModel):
+    id: str
+    front: str
+    back: str
+
+class FlashcardBatchResponse(BaseModel):
+    flashcards: list[BatchFlashcard]
+
 class QuizService:
     def __init__(self, gemini_client: GeminiClient):
         self.gemini = gemini_client
-        self.quiz_prompt = load_prompt("quiz_generation")
-        self.flashcard_prompt = load_prompt("flashcard_generation")
 
     async def generate_quiz(self, topic: str, context: str, num_questions: int = 3) -> dict:
         """
         Generates a JSON quiz for the given topic.
         """
-        prompt = (
-            self.quiz_prompt
-            .replace("{{topic}}", topic)
-            .replace("{{context}}", context)
-            .replace("{{num_questions}}", str(num_questions))
-        )
+        prompt = prompts.render("quiz_generation", topic=topic, context=context, num_questions=num_questions)
         
         try:
-            data = await self.gemini.generate_json_async(prompt, schema=QuizResponse)
+            data = await self.gemini.generate_json_async(prompt, schema=QuizResponse, prompt_name="quiz_generation")
             return data
         except Exception as e:
             print(f"Quiz Generation Error: {e}")
@@ -44,16 +40,57 @@ class QuizService:
         """
         Generates flashcards for a specific concept.
         """
-        prompt = (
-            self.flashcard_prompt
-            .replace("{{concept}}", concept)
-            .replace("{{context}}", context)
-            .replace("{{count}}", str(count))
-        )
+        prompt = prompts.render("flashcard_generation", concept=concept, context=context, count=count)
         
         try:
-            data = await self.gemini.generate_json_async(prompt, schema=FlashcardResponse)
+            data = await self.gemini.generate_json_async(prompt, schema=FlashcardResponse, prompt_name="flashcard_generation")
             return data.get("flashcards", []) if isinstance(data, dict) else []
         except Exception as e:
             print(f"Flashcard Generation Error: {e}")
             return []
+
+    async def generate_flashcards_batch(self, requests: list[dict], context: str) -> dict[str, dict]:
+        """
+        Generates one flashcard per request in a single structured-output call.
+        Returns the cards keyed by request id; requests the batch missed are
+        generated individually so every id still gets a card when possible.
+        """
+        if not requests:
+            return {}
+
+        cards_spec = "\n".join(
+            json.dumps({
+                "id": r["id"],
+                "concept": r.get("concept") or r.get("topic"),
+                "topic": r.get("topic") or r.get("concept")
+            })
+            for r in requests
+        )
+        prompt = prompts.render("flashcard_batch_generation", cards=cards_spec, context=context)
+
+        cards: dict[str, dict] = {}
+        try:
+            data = await self.gemini.generate_json_async(prompt, schema=FlashcardBatchResponse, prompt_name="flashcard_batch_generation")
+            generated = data.get("flashcards", []) if isinstance(data, dict) else []
+            request_ids = {r["id"] for r in requests}
+            for card in generated:
+                if isinstance(card, dict) and card.get("id") in request_ids:
+                    cards[card["id"]] = card
+            # The model sometimes rewrites ids; fall back to positional matching when counts line up
+            if not cards and len(generated) == len(requests):
+                cards = {r["id"]: card for r, card in zip(requests, generated) if isinstance(card, dict)}
+        except Exception as e:
+            print(f"Flashcard Batch Generation Error: {e}")
+
+        missing = [r for r in requests if r["id"] not in cards]
+        if missing:
+            print(f"DEBUG: Flashcard batch missed {len(missing)} of {len(requests)} cards, generating individually")
+            singles = await asyncio.gather(*[
+                self.generate_flashcards(concept=r.get("concept") or r.get("topic"), context=context, count=1)
+                for r in missing
+            ])
+            for r, generated in zip(missing, singles):
+                if generated:
+                    cards[r["id"]] = generated[0]
+
+        return cards
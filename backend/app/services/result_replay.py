@@ -0,0 +1,77 @@
+import uuid
+from collections import OrderedDict, deque
+
+
+class ResultReplayBuffer:
+    """
+    Sequence-numbered log of the pipeline results sent for each lecture, so a client
+    that reconnects can ask for only what it missed.
+
+    Every recorded result delta gets the lecture's next sequence number. A lecture's
+    log has an epoch that changes whenever the log starts over (process restart,
+    eviction), so a client holding numbers from an older log is told it has a gap
+    instead of silently missing results. Each lecture keeps its last `max_frames`
+    deltas; only the most recently used `max_lectures` lectures are kept.
+    """
+
+    def __init__(self, max_frames: int = 500, max_lectures: int = 256) -> None:
+        self.max_frames = max_frames
+        self.max_lectures = max_lectures
+        self._lectures: OrderedDict[str, dict] = OrderedDict()
+        self.replayed = 0
+        self.gaps = 0
+
+    def _lecture(self, lecture_id: str) -> dict:
+        lecture = self._lectures.get(lecture_id)
+        if lecture is None:
+            lecture = self._lectures[lecture_id] = {
+                "epoch": uuid.uuid4().hex[:12],
+                "next": 1,
+                "frames": deque(maxlen=self.max_frames),
+            }
+            while len(self._lectures) > self.max_lectures:
+                self._lectures.popitem(last=False)
+        else:
+            self._lectures.move_to_end(lecture_id)
+        return lecture
+
+    def record(self, lecture_id: str, results: dict) -> tuple[str, int]:
+        """
+        Logs one result delta and returns its (epoch, seq).
+        """
+        lecture = self._lecture(lecture_id)
+        seq = lecture["next"]
+        lecture["next"] += 1
+        lecture["frames"].append((seq, results))
+        return lecture["epoch"], seq
+
+    def since(self, lecture_id: str, epoch: str | None, seq: int) -> tuple[str, list[tuple[int, dict]]] | None:
+        """
+        The (epoch, deltas) recorded after `seq`, or None if some of them are no longer
+        available and the client has to reload the lecture instead.
+        """
+        lecture = self._lectures.get(lecture_id)
+        if lecture is None:
+            if seq > 0:
+                self.gaps += 1
+                return None
+            return "", []
+        if seq > 0 and epoch != lecture["epoch"]:
+            self.gaps += 1
+            return None
+        frames = lecture["frames"]
+        oldest = frames[0][0] if frames else lecture["next"]
+        if seq + 1 < oldest:
+            self.gaps += 1
+            return None
+        missed = [(s, results) for s, results in frames if s > seq]
+        self.replayed += len(missed)
+        return lecture["epoch"], missed
+
+    def stats(self) -> dict:
+        return {
+            "lectures": len(self._lectures),
+            "frames": sum(len(lecture["frames"]) for lecture in self._lectures.values()),
+            "replayed": self.replayed,
+            "gaps": self.gaps,
+        }
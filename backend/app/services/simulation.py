@@ -1,28 +1,190 @@
+import asyncio
 import re
-from pathlib import Path
+import time
+from typing import Awaitable, Callable
+from pydantic import BaseModel
 from app.services.gemini import GeminiClient
+from app.services.prompts import prompts
+from app.services.simulation_artifacts import SimulationArtifactStore
+from app.services.simulation_html import postprocess_simulation_html
+from app.services.simulation_index import SimulationCacheIndex
+from app.services.singleflight import SingleFlight
 
-PROMPT_DIR = Path(__file__).parent.parent / "prompts"
+# Prefix of the HTML comment returned instead of a simulation when generation fails
+GENERATION_ERROR_PREFIX = "<!-- Error generating simulation"
 
-def load_prompt(name: str) -> str:
-    path = PROMPT_DIR / f"{name}.md"
-    return path.read_text(encoding="utf-8")
+def is_generation_error(code: str | None) -> bool:
+    """
+    True for anything generate_simulation returns instead of a usable document.
+    """
+    return not code or code.startswith(GENERATION_ERROR_PREFIX)
+
+def normalize_concept(concept: str) -> str:
+    """
+    Canonical form of a concept name used for dedupe keys ("Breadth-First  Search" -> "breadth first search").
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", concept.lower()).split())
+
+def extract_html(response_text: str) -> str:
+    """
+    Pulls the HTML document out of a complete model response.
+    """
+    match = re.search(r"```html\s*(.*?)```", response_text, re.DOTALL | re.IGNORECASE)
+    if match:
+        return match.group(1).strip()
+
+    match_generic = re.search(r"```\s*(.*?)```", response_text, re.DOTALL)
+    if match_generic:
+        return match_generic.group(1).strip()
+
+    if response_text.strip().startswith("<"):
+        return response_text.strip()
+
+    return response_text
+
+def extract_partial_html(partial_text: str) -> str:
+    """
+    Best-effort view of the HTML produced so far in a still-streaming response.
+    Returns "" until the code block has started. Successive calls on a growing
+    buffer return growing prefixes of the same document.
+    """
+    fence = re.search(r"```(?:html)?[ \t]*\n", partial_text, re.IGNORECASE)
+    if fence:
+        body = partial_text[fence.end():]
+        end = body.find("```")
+        if end != -1:
+            return body[:end]
+        # Hold back a possibly half-received closing fence
+        return body.rstrip("`")
+    stripped = partial_text.lstrip()
+    return stripped if stripped.startswith("<") else ""
+
+class SimulationConcept(BaseModel):
+    concept: str | None = None
+    description: str | None = None
 
 class SimulationService:
-    def __init__(self, gemini_client: GeminiClient):
+    def __init__(
+        self,
+        gemini_client: GeminiClient,
+        match_threshold: float = 0.75,
+        concept_client: GeminiClient | None = None,
+        artifacts: SimulationArtifactStore | None = None,
+        max_entries: int = 0,
+        max_bytes: int = 0,
+        eviction_policy: str = "lfu",
+        postprocess: bool = True,
+        runtime_url: str | None = None,
+    ):
         self.gemini = gemini_client
-        self.system_prompt = load_prompt("system_animation")
-        self.user_template = load_prompt("simulation_user")
-        self.chunk_template = load_prompt("simulation_from_chunk")
+        self.artifacts = artifacts or SimulationArtifactStore()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction_policy = eviction_policy
+        self.postprocess = postprocess
+        self.runtime_url = runtime_url
+        self._background: set[asyncio.Task] = set()
+        # Concept identification is a short JSON answer and can use a faster model
+        self.concept_gemini = concept_client or gemini_client
+        self.index = SimulationCacheIndex(normalize_concept, threshold=match_threshold)
+        # The large, static system prompt can live in the provider's context cache
+        prompts.register_static_prefix("system_animation")
+        self.inflight = SingleFlight()
+        self.artifacts_collected = 0
+
+    async def load_cache_index(self, db) -> None:
+        """
+        Loads every cached simulation into the in-memory index. Run once at startup.
+        """
+        if db is None:
+            return
+        try:
+            count = await asyncio.to_thread(self._load_cache_index, db)
+            print(f"DEBUG: Loaded {count} cached simulations into the index")
+        except Exception as e:
+            print(f"Error loading simulation cache index: {e}")
+
+    def _load_cache_index(self, db) -> int:
+        docs = []
+        projection = {"_id": 0, "concept": 1, "description": 1, "code": 1, "code_hash": 1,
+                      "size": 1, "liked": 1, "hits": 1, "last_hit_at": 1, "cached_at": 1}
+        migrated = 0
+        for doc in db.simulation_cache.find({}, projection):
+            if not doc.get("code_hash") and doc.get("code"):
+                # Entries cached before the artifact store: move the HTML out once, and only
+                # drop the inline copy after the artifact is stored
+                try:
+                    digest = self.artifacts.put(doc["code"])
+                except Exception as e:
+                    print(f"Error moving cached simulation '{doc['concept']}' to the artifact store: {e}")
+                    continue
+                doc["code_hash"] = digest
+                doc["size"] = len(doc["code"].encode("utf-8"))
+                db.simulation_cache.update_one(
+                    {"concept": doc["concept"], "code_hash": {"$exists": False}},
+                    {"$set": {"code_hash": doc["code_hash"], "size": doc["size"]}, "$unset": {"code": ""}},
+                )
+                migrated += 1
+            docs.append(doc)
+        if migrated:
+            print(f"DEBUG: Moved {migrated} inline cached simulations to the artifact store")
+        self.index.load(docs)
+        return len(self.index)
+
+    async def _resolve_code(self, entry: dict | None) -> dict | None:
+        """
+        Fills in the HTML of a cache entry from the artifact store; entries whose artifact is gone are misses.
+        """
+        if not entry:
+            return None
+        code = entry.get("code")
+        if code is None and entry.get("code_hash"):
+            code = await self.artifacts.get_async(entry["code_hash"])
+        if not code:
+            return None
+        return {
+            "concept": entry.get("concept"),
+            "description": entry.get("description"),
+            "code": code
+        }
 
     async def get_cached_simulation(self, db, concept: str) -> dict | None:
         """
-        Tries to find a similar simulation in the cache using Atlas Search (Lucene).
-        MongoDB Atlas handles the text search natively without needing external embeddings.
+        Tries to find a similar simulation in the cache.
+        Served from the in-memory index once it is loaded; before that (or if loading
+        failed) falls back to Atlas Search off the event loop.
         """
         if db is None:
             return None
-            
+        if self.index.loaded:
+            entry = self.index.lookup(concept)
+            if entry:
+                self.index.record_hit(entry["key"])
+        else:
+            entry = await asyncio.to_thread(self._search_cache, db, concept)
+        resolved = await self._resolve_code(entry)
+        if resolved:
+            self._in_background(asyncio.to_thread(
+                db.simulation_cache.update_one,
+                {"concept": resolved["concept"]},
+                {"$inc": {"hits": 1}, "$set": {"last_hit_at": time.time()}},
+            ))
+        return resolved
+
+    def _in_background(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error updating simulation cache stats: {task.exception()}")
+
+    def _search_cache(self, db, concept: str) -> dict | None:
+        """
+        Atlas Search (Lucene) lookup with an anchored case-insensitive regex fallback.
+        """
         try:
             # Native MongoDB Atlas Search (Lucene-based)
             # More cautious: maxEdits: 1 allows for minor typos only
@@ -47,151 +209,182 @@ class SimulationService:
             
             results = list(db.simulation_cache.aggregate(pipeline))
             if results:
-                res = results[0]
-                # Optional: We could add a score threshold check here if needed
-                return {
-                    "concept": res.get("concept"),
-                    "description": res.get("description"),
-                    "code": res.get("code")
-                }
-            else:
-                # Try strict regex fallback if Atlas Search index didn't match
-                # Anchored match (^ and $) for caution
-                res = db.simulation_cache.find_one({"concept": {"$regex": f"^{re.escape(concept)}$", "$options": "i"}})
-                if res:
-                    return {
-                        "concept": res.get("concept"),
-                        "description": res.get("description"),
-                        "code": res.get("code")
-                    }
-        except Exception:
-            # Fallback to strict exact match
+                return results[0]
+        except Exception as e:
+            print(f"Atlas Search unavailable for simulation cache: {e}")
+
+        try:
+            # Anchored match (^ and $) for caution
             res = db.simulation_cache.find_one({"concept": {"$regex": f"^{re.escape(concept)}$", "$options": "i"}})
-            if res:
-                return {
-                    "concept": res.get("concept"),
-                    "description": res.get("description"),
-                    "code": res.get("code")
-                }
-            
-        return None
+        except Exception as e:
+            print(f"Error reading simulation cache: {e}")
+            return None
+        return res
 
-    async def cache_simulation(self, db, concept: str, description: str, code: str):
+    async def cache_simulation(self, db, concept: str, description: str, code: str, liked: bool = False):
         """
-        Caches a simulation. MongoDB Atlas Vector Search index will automatically
-        generate the embedding for the document based on its configuration.
+        Caches a simulation: the HTML goes to the artifact store, the concept entry
+        (pointing at it by hash) to MongoDB and the in-memory index.
+        Liked entries are pinned and never evicted.
         """
         if db is None:
             return
 
         try:
-            db.simulation_cache.update_one(
+            previous = self.index.get(normalize_concept(concept))
+            digest = await self.artifacts.put_async(code)
+            size = len(code.encode("utf-8"))
+            now = time.time()
+            fields = {
+                "concept": concept,
+                "concept_key": normalize_concept(concept),
+                "description": description,
+                "code_hash": digest,
+                "size": size,
+                "cached_at": now
+            }
+            if liked:
+                fields["liked"] = True
+            await asyncio.to_thread(
+                db.simulation_cache.update_one,
                 {"concept": concept},
                 {
-                    "$set": {
-                        "concept": concept,
-                        "description": description,
-                        "code": code,
-                        "cached_at": __import__("time").time()
-                    }
+                    "$set": fields,
+                    "$setOnInsert": {"hits": 0} if liked else {"hits": 0, "liked": False},
+                    "$unset": {"code": ""}
                 },
                 upsert=True
             )
+            self.index.add(concept, description, digest, size=size, liked=liked, cached_at=now)
             print(f"DEBUG: Cached simulation for '{concept}'")
+            if previous and previous["code_hash"] != digest:
+                await asyncio.to_thread(self._collect_artifact, db, previous["code_hash"])
+            await self._evict(db, keep=normalize_concept(concept))
         except Exception as e:
             print(f"Error caching simulation: {e}")
 
-    async def generate_simulation(self, db, concept: str, description: str, context: str) -> str:
+    async def _evict(self, db, keep: str | None = None) -> None:
+        """
+        Drops unliked entries until the cache fits max_entries / max_bytes, along with
+        any artifact that neither the cache nor a lecture simulation still references.
+        """
+        victims = self.index.eviction_candidates(self.max_entries, self.max_bytes, self.eviction_policy, keep=keep)
+        for victim in victims:
+            self.index.remove(victim["key"])
+            self.index.evictions += 1
+            await asyncio.to_thread(
+                db.simulation_cache.delete_many,
+                {"$or": [{"concept": victim["concept"]}, {"concept_key": victim["key"]}], "liked": {"$ne": True}},
+            )
+            print(f"DEBUG: Evicted cached simulation '{victim['concept']}' ({victim['hits']} hits, {victim['size']} bytes)")
+            await asyncio.to_thread(self._collect_artifact, db, victim["code_hash"])
+
+    @staticmethod
+    def _artifact_referenced(db, digest: str) -> bool:
+        return (
+            db.simulation_cache.find_one({"code_hash": digest}, {"_id": 1}) is not None
+            or db.simulations.find_one({"code_hash": digest}, {"_id": 1}) is not None
+        )
+
+    def _collect_artifact(self, db, digest: str) -> None:
+        """
+        Deletes an artifact once no cache entry or lecture simulation references it.
+        """
+        try:
+            if self._artifact_referenced(db, digest):
+                return
+            code = self.artifacts.get(digest)
+            self.artifacts.delete(digest)
+            if code is not None and self._artifact_referenced(db, digest):
+                # Referenced again while it was being deleted: put it back
+                self.artifacts.put(code)
+                return
+            self.artifacts_collected += 1
+            print(f"DEBUG: Deleted unreferenced simulation artifact {digest[:12]}")
+        except Exception as e:
+            print(f"Error collecting simulation artifact {digest[:12]}: {e}")
+
+    def cache_stats(self) -> dict:
+        return {
+            **self.index.stats(),
+            "index_loaded": self.index.loaded,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "eviction_policy": self.eviction_policy,
+            "artifacts_collected": self.artifacts_collected,
+        }
+
+    async def generate_simulation(
+        self,
+        db,
+        concept: str,
+        description: str,
+        context: str,
+        on_progress: Callable[[str], Awaitable[None]] | None = None,
+    ) -> str:
         """
         Generates a self-contained HTML/ThreeJS simulation.
         Checks global cache first (invisible to caller).
+        Concurrent requests for the same (normalized) concept share a single generation.
+        If `on_progress` is given the response is streamed and the callback receives the
+        partial HTML generated so far (only the caller that starts the generation streams).
         """
+        key = normalize_concept(concept) or concept
+        return await self.inflight.do(key, self._generate_simulation, db, concept, description, context, on_progress)
+
+    async def _generate_simulation(self, db, concept: str, description: str, context: str, on_progress=None) -> str:
         # INVISIBLE CACHE CHECK
         cached = await self.get_cached_simulation(db, concept)
         if cached:
             return cached["code"]
 
-        user_prompt = (
-            self.user_template
-            .replace("{{concept}}", concept)
-            .replace("{{description}}", description)
-            .replace("{{context}}", context)
-        )
-        
-        # Prepend system prompt
-        full_prompt = f"""{self.system_prompt}
-
----
-
-{user_prompt}"""
+        user_prompt = prompts.render("simulation_user", concept=concept, description=description, context=context)
         
         try:
-            response_text = await self.gemini.generate_text_async(full_prompt)
+            if on_progress:
+                response_text = await self._stream_simulation(user_prompt, on_progress)
+            else:
+                response_text = await self.gemini.generate_text_async(user_prompt, prompt_name="simulation", static_prefix="system_animation")
             print(f"DEBUG: Simulation raw response length: {len(response_text)}")
         except Exception as e:
             print(f"Simulation Generation Error: {e}")
-            return f"<!-- Error generating simulation: {str(e)} -->"
+            return f"{GENERATION_ERROR_PREFIX}: {str(e)} -->"
         
         # Clean up response (extract code block)
-        match = re.search(r"```html\s*(.*?)```", response_text, re.DOTALL | re.IGNORECASE)
-        if match:
-            return match.group(1).strip()
-        
-        match_generic = re.search(r"```\s*(.*?)```", response_text, re.DOTALL)
-        if match_generic:
-            return match_generic.group(1).strip()
-            
-        if response_text.strip().startswith("<"):
-            return response_text.strip()
-            
-        return response_text 
+        html = extract_html(response_text)
+        if not html.startswith("<"):
+            # No document in the answer (refusal, empty or truncated response)
+            print(f"Simulation Generation Error: no HTML in response for '{concept}'")
+            return f"{GENERATION_ERROR_PREFIX}: model response contained no HTML -->"
+        if self.postprocess:
+            try:
+                processed = postprocess_simulation_html(html, self.runtime_url)
+                print(f"DEBUG: Simulation HTML post-processed {len(html)} -> {len(processed)} chars")
+                html = processed
+            except Exception as e:
+                print(f"Simulation post-processing failed, keeping raw HTML: {e}")
+        return html
+
+    async def _stream_simulation(self, prompt: str, on_progress: Callable[[str], Awaitable[None]]) -> str:
+        buffer = ""
+        async for delta in self.gemini.stream_text_async(prompt, prompt_name="simulation", static_prefix="system_animation"):
+            buffer += delta
+            partial = extract_partial_html(buffer)
+            if partial:
+                await on_progress(partial)
+        return buffer
 
-    async def generate_simulation_from_chunk(self, db, chunk_text: str, context: str) -> dict | None:
+    async def identify_concept(self, chunk_text: str, context: str) -> SimulationConcept | None:
         """
-        Generates a simulation directly from a chunk of text.
-        Checks cache if a concept is identified.
+        Cheap first phase of chunk simulation: names the concept to visualize without generating code.
         """
-        prompt = (
-            self.chunk_template
-            .replace("{{transcript_chunk}}", chunk_text)
-            .replace("{{context}}", context)
-        )
-        
+        prompt = prompts.render("simulation_concept", transcript_chunk=chunk_text, context=context)
         try:
-            response_text = await self.gemini.generate_text_async(prompt)
+            data = await self.concept_gemini.generate_json_async(prompt, schema=SimulationConcept, prompt_name="simulation_concept")
+            identified = SimulationConcept.model_validate(data or {})
         except Exception as e:
-            print(f"Chunk Simulation Generation Error: {e}")
+            print(f"Chunk Concept Identification Error: {e}")
             return None
-
-        try:
-            concept_match = re.search(r"CONCEPT:\s*(.*?)(?:\n|$)", response_text, re.IGNORECASE)
-            desc_match = re.search(r"DESCRIPTION:\s*(.*?)(?:\n|$)", response_text, re.IGNORECASE)
-            
-            concept = concept_match.group(1).strip() if concept_match else "Auto-Generated Concept"
-            
-            # INVISIBLE CACHE CHECK
-            cached = await self.get_cached_simulation(db, concept)
-            if cached:
-                return cached
-
-            code_match = re.search(r"CODE_START\s*(.*?)\s*CODE_END", response_text, re.DOTALL)
-            if not code_match:
-                 match_html = re.search(r"```html\s*(.*?)```", response_text, re.DOTALL | re.IGNORECASE)
-                 if match_html:
-                     code = match_html.group(1).strip()
-                 else:
-                     return None
-            else:
-                code = code_match.group(1).strip()
-
-            description = desc_match.group(1).strip() if desc_match else "Simulation generated from transcript."
-            
-            return {
-                "concept": concept,
-                "description": description,
-                "code": code
-            }
-
-        except Exception as e:
-            print(f"Error parsing chunk simulation response: {e}")
+        if not identified.concept or not identified.concept.strip():
             return None
+        return identified
@@ -0,0 +1,109 @@
+import asyncio
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+class SimulationArtifactStore:
+    """
+    Content-addressed store for generated simulation HTML.
+
+    Each distinct body is gzipped once and saved under its sha256 in the
+    `simulation_artifacts` collection (when a database is available) and in a bounded
+    in-memory LRU, so simulations, the simulation cache and websocket frames only need
+    to carry the hash. Bodies are immutable, which lets the HTTP endpoint serve them
+    with long-lived cache headers. Owners of the references delete bodies nothing
+    points at any more (see SimulationService).
+    """
+
+    def __init__(self, collection=None, max_memory_bytes: int = 32 * 1024 * 1024) -> None:
+        self.collection = collection
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def asset_url(digest: str) -> str:
+        return f"/simulations/{digest}"
+
+    def _remember(self, digest: str, body: bytes) -> None:
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return
+            self._memory[digest] = body
+            self._memory_bytes += len(body)
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _recall(self, digest: str) -> bytes | None:
+        with self._lock:
+            body = self._memory.get(digest)
+            if body is not None:
+                self._memory.move_to_end(digest)
+            return body
+
+    def put(self, code: str) -> str:
+        """
+        Stores `code` if it is new and returns its hash. Raises if the database write
+        fails, so callers never reference a hash with no body behind it.
+        """
+        digest = code_hash(code)
+        if self._recall(digest) is not None:
+            return digest
+        body = gzip.compress(code.encode("utf-8"), mtime=0)
+        if self.collection is not None:
+            self.collection.update_one(
+                {"_id": digest},
+                {"$setOnInsert": {"body": body, "size": len(code), "compressed_size": len(body), "created_at": time.time()}},
+                upsert=True,
+            )
+        self._remember(digest, body)
+        return digest
+
+    def delete(self, digest: str) -> None:
+        with self._lock:
+            body = self._memory.pop(digest, None)
+            if body is not None:
+                self._memory_bytes -= len(body)
+        if self.collection is not None:
+            self.collection.delete_one({"_id": digest})
+
+    def get_compressed(self, digest: str) -> bytes | None:
+        body = self._recall(digest)
+        if body is not None or self.collection is None:
+            return body
+        doc = self.collection.find_one({"_id": digest}, {"body": 1})
+        if not doc:
+            return None
+        body = bytes(doc["body"])
+        self._remember(digest, body)
+        return body
+
+    def get(self, digest: str) -> str | None:
+        body = self.get_compressed(digest)
+        return gzip.decompress(body).decode("utf-8") if body is not None else None
+
+    async def put_async(self, code: str) -> str:
+        digest = code_hash(code)
+        if self._recall(digest) is not None:
+            return digest
+        return await asyncio.to_thread(self.put, code)
+
+    async def get_compressed_async(self, digest: str) -> bytes | None:
+        body = self._recall(digest)
+        if body is not None:
+            return body
+        return await asyncio.to_thread(self.get_compressed, digest)
+
+    async def get_async(self, digest: str) -> str | None:
+        body = await self.get_compressed_async(digest)
+        return gzip.decompress(body).decode("utf-8") if body is not None else None
@@ -0,0 +1,139 @@
+import hashlib
+import re
+from pathlib import Path
+
+STATIC_DIR = Path(__file__).parent.parent / "static"
+RUNTIME_CSS_PATH = STATIC_DIR / "simulation-runtime.css"
+RUNTIME_CSS = RUNTIME_CSS_PATH.read_text(encoding="utf-8")
+# Versioned file name so the stylesheet can be served with immutable cache headers
+RUNTIME_CSS_NAME = f"simulation-runtime.{hashlib.sha256(RUNTIME_CSS.encode('utf-8')).hexdigest()[:12]}.css"
+# Every published version, by name: stored simulations keep linking the one they were processed against
+RUNTIME_CSS_VERSIONS_DIR = STATIC_DIR / "versions"
+RUNTIME_CSS_VERSION = re.compile(r"simulation-runtime\.[0-9a-f]{12}\.css")
+if not (RUNTIME_CSS_VERSIONS_DIR / RUNTIME_CSS_NAME).is_file():
+    print(f"DEBUG: simulation-runtime.css has no snapshot; add it as static/versions/{RUNTIME_CSS_NAME} "
+          "so simulations linking this version keep their styles after the next edit")
+
+RAW_BLOCK = re.compile(r"(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)", re.DOTALL | re.IGNORECASE)
+COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+SCRIPT_SRC = re.compile(r"""<script\b([^>]*?)\bsrc\s*=\s*["']([^"']+)["']([^>]*)>\s*</script\s*>""", re.IGNORECASE)
+UNPKG = re.compile(r"https?://unpkg\.com/((?:@[\w.-]+/)?[\w.-]+@\d[\w.-]*/[^\s\"'?#]+)")
+CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+HEAD_OPEN = re.compile(r"<head\b[^>]*>", re.IGNORECASE)
+
+# Resets the runtime stylesheet already applies, per selector
+RUNTIME_RESETS = {
+    "html": {"margin:0", "padding:0", "width:100%", "height:100%", "overflow:hidden"},
+    "body": {"margin:0", "padding:0", "width:100%", "height:100%", "overflow:hidden"},
+    "canvas": {"display:block"},
+    "*": {"box-sizing:border-box"},
+}
+
+
+def runtime_css(name: str) -> str | None:
+    """
+    The runtime stylesheet published under `name`, current or earlier.
+    """
+    if name == RUNTIME_CSS_NAME:
+        return RUNTIME_CSS
+    path = RUNTIME_CSS_VERSIONS_DIR / name
+    if not RUNTIME_CSS_VERSION.fullmatch(name) or not path.is_file():
+        return None
+    return path.read_text(encoding="utf-8")
+
+
+def canonical_url(url: str) -> str:
+    """
+    One spelling per library URL, so identical libraries share the browser cache across simulations.
+    """
+    url = url.strip()
+    if url.startswith("//"):
+        url = "https:" + url
+    elif url.startswith("http://"):
+        url = "https://" + url[len("http://"):]
+    # Version-pinned unpkg files are served identically by jsDelivr's npm mirror
+    return UNPKG.sub(r"https://cdn.jsdelivr.net/npm/\1", url)
+
+
+def dedupe_script_tags(html: str) -> str:
+    seen: set[str] = set()
+
+    def replace(match: re.Match) -> str:
+        src = canonical_url(match.group(2))
+        if src in seen:
+            return ""
+        seen.add(src)
+        return f'<script{match.group(1)}src="{src}"{match.group(3)}></script>'
+
+    html = SCRIPT_SRC.sub(replace, html)
+    # Import maps and module imports reference the same CDNs
+    return UNPKG.sub(r"https://cdn.jsdelivr.net/npm/\1", html)
+
+
+def _declarations(body: str) -> list[str]:
+    return [d.strip() for d in body.split(";") if d.strip()]
+
+
+def strip_runtime_resets(css: str) -> str:
+    """
+    Drops declarations from html/body/canvas/* rules that the runtime stylesheet already provides.
+    """
+    def replace(match: re.Match) -> str:
+        selectors = [s.strip() for s in match.group(1).split(",")]
+        if not all(s in RUNTIME_RESETS for s in selectors):
+            return match.group(0)
+        provided = set.intersection(*(RUNTIME_RESETS[s] for s in selectors))
+        kept = [d for d in _declarations(match.group(2)) if re.sub(r"\s+", "", d).lower() not in provided]
+        if not kept:
+            return ""
+        return f"{match.group(1)}{{{';'.join(kept)}}}"
+
+    return CSS_RULE.sub(replace, css)
+
+
+def minify_css(css: str) -> str:
+    css = CSS_COMMENT.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", css)
+    return re.sub(r":\s+", ":", css).replace(";}", "}").strip()
+
+
+def minify_markup(html: str) -> str:
+    html = COMMENT.sub("", html)
+    return "\n".join(re.sub(r"[ \t]+", " ", line.strip()) for line in html.splitlines() if line.strip())
+
+
+def link_runtime(html: str, runtime_url: str) -> str:
+    tag = f'<link rel="stylesheet" href="{runtime_url}">'
+    match = HEAD_OPEN.search(html)
+    if match:
+        return html[:match.end()] + tag + html[match.end():]
+    return tag + html
+
+
+def postprocess_simulation_html(html: str, runtime_url: str | None = None) -> str:
+    """
+    Shrinks generated simulation HTML: canonicalizes and dedupes library <script src>
+    tags, links the shared runtime stylesheet in place of the resets it covers, and
+    minifies markup and styles. <script>, <pre> and <textarea> contents are kept
+    verbatim: without a JS tokenizer, line-based rewriting can change string literals.
+    """
+    html = dedupe_script_tags(html)
+    out = []
+    last = 0
+    for match in RAW_BLOCK.finditer(html):
+        out.append(minify_markup(html[last:match.start()]))
+        open_tag, tag, body, close_tag = match.group(1), match.group(2).lower(), match.group(3), match.group(4)
+        if tag == "style":
+            body = minify_css(strip_runtime_resets(CSS_COMMENT.sub("", body)) if runtime_url else body)
+            if not body:
+                last = match.end()
+                continue
+        out.append(f"{open_tag}{body}{close_tag}")
+        last = match.end()
+    out.append(minify_markup(html[last:]))
+    html = "\n".join(part for part in out if part)
+    if runtime_url:
+        html = link_runtime(html, runtime_url)
+    return html
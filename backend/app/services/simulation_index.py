@@ -0,0 +1,194 @@
+import threading
+import time
+from typing import Iterable
+
+EVICTION_POLICIES = ("lfu", "lru")
+
+
+def trigrams(text: str) -> frozenset[str]:
+    """
+    Character trigrams of an already normalized concept, padded so short words still match.
+    """
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class SimulationCacheIndex:
+    """
+    In-memory lookup over the simulation_cache collection. Entries hold the hash of the
+    simulation HTML in the artifact store, not the HTML itself, plus the bookkeeping
+    used for eviction: size in bytes, hit count, last hit time and whether a user liked it.
+
+    Concepts are matched first on their normalized form, then fuzzily by trigram Jaccard
+    similarity against candidates sharing at least one trigram. Matches scoring below
+    `threshold` are treated as misses.
+    """
+
+    def __init__(self, normalize, threshold: float = 0.75) -> None:
+        self.normalize = normalize
+        self.threshold = threshold
+        self.loaded = False
+        self._entries: dict[str, dict] = {}
+        self._grams: dict[str, frozenset[str]] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, docs: Iterable[dict]) -> None:
+        for doc in docs:
+            if doc.get("concept") and doc.get("code_hash"):
+                self.add(
+                    doc["concept"],
+                    doc.get("description"),
+                    doc["code_hash"],
+                    size=doc.get("size") or 0,
+                    liked=bool(doc.get("liked")),
+                    hits=doc.get("hits") or 0,
+                    last_hit_at=doc.get("last_hit_at"),
+                    cached_at=doc.get("cached_at"),
+                )
+        self.loaded = True
+
+    def add(
+        self,
+        concept: str,
+        description: str | None,
+        code_hash: str,
+        size: int = 0,
+        liked: bool = False,
+        hits: int = 0,
+        last_hit_at: float | None = None,
+        cached_at: float | None = None,
+    ) -> None:
+        key = self.normalize(concept)
+        if not key:
+            return
+        grams = trigrams(key)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self.total_bytes -= previous["size"]
+                # Re-caching a concept keeps its history and never un-likes it
+                hits = max(hits, previous["hits"])
+                last_hit_at = last_hit_at or previous["last_hit_at"]
+                liked = liked or previous["liked"]
+            self._entries[key] = {
+                "key": key,
+                "concept": concept,
+                "description": description,
+                "code_hash": code_hash,
+                "size": size,
+                "liked": liked,
+                "hits": hits,
+                "last_hit_at": last_hit_at,
+                "cached_at": cached_at or time.time(),
+            }
+            self.total_bytes += size
+            if key not in self._grams:
+                self._grams[key] = grams
+                for gram in grams:
+                    self._postings.setdefault(gram, set()).add(key)
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self.total_bytes -= entry["size"]
+            for gram in self._grams.pop(key, ()):
+                keys = self._postings.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._postings[gram]
+
+    def record_hit(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["hits"] += 1
+                entry["last_hit_at"] = time.time()
+
+    def lookup(self, concept: str) -> dict | None:
+        key = self.normalize(concept)
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.exact_hits += 1
+                return dict(entry)
+
+            grams = trigrams(key)
+            candidates: set[str] = set()
+            for gram in grams:
+                candidates.update(self._postings.get(gram, ()))
+            best_key, best_score = None, 0.0
+            for candidate in candidates:
+                other = self._grams[candidate]
+                score = len(grams & other) / len(grams | other)
+                if score > best_score:
+                    best_key, best_score = candidate, score
+            if best_key is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self.fuzzy_hits += 1
+            print(f"DEBUG: Simulation cache fuzzy match '{concept}' -> '{self._entries[best_key]['concept']}' ({best_score:.2f})")
+            return dict(self._entries[best_key])
+
+    def eviction_candidates(self, max_entries: int, max_bytes: int, policy: str = "lfu", keep: str | None = None) -> list[dict]:
+        """
+        Entries to drop so the index fits `max_entries` / `max_bytes` (0 = unbounded).
+        Liked entries and `keep` (the entry just added, which has no hits yet) are never
+        chosen. "lfu" evicts the fewest hits first (oldest use breaks ties); "lru" evicts
+        the least recently used.
+        """
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        with self._lock:
+            over_entries = len(self._entries) - max_entries if max_entries else 0
+            over_bytes = self.total_bytes - max_bytes if max_bytes else 0
+            if over_entries <= 0 and over_bytes <= 0:
+                return []
+
+            def last_used(entry: dict) -> float:
+                return entry["last_hit_at"] or entry["cached_at"]
+
+            if policy == "lfu":
+                order = lambda entry: (entry["hits"], last_used(entry))  # noqa: E731
+            else:
+                order = last_used
+            victims = []
+            for entry in sorted((e for e in self._entries.values() if not e["liked"] and e["key"] != keep), key=order):
+                if over_entries <= 0 and over_bytes <= 0:
+                    break
+                victims.append(dict(entry))
+                over_entries -= 1
+                over_bytes -= entry["size"]
+            return victims
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.fuzzy_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "liked_entries": sum(1 for e in self._entries.values() if e["liked"]),
+                "total_bytes": self.total_bytes,
+                "exact_hits": self.exact_hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.exact_hits + self.fuzzy_hits) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from app.services.simulation import SimulationService, is_generation_error, normalize_concept
+
+
+class SimulationPrefetcher:
+    """
+    Warms the simulation cache when a lecture is created.
+
+    Concepts simulated in earlier lectures of the same class, and of related classes
+    (same professor or same course name), are ranked by frequency with exponential
+    recency decay. The top `max_concepts` that are not already cached are generated
+    one at a time in the background, pausing while live traffic saturates the model.
+    """
+
+    def __init__(
+        self,
+        simulation_service: SimulationService,
+        max_concepts: int = 5,
+        half_life_days: float = 14.0,
+        related_weight: float = 0.5,
+        history_limit: int = 500,
+    ) -> None:
+        self.simulation = simulation_service
+        self.max_concepts = max_concepts
+        self.half_life_seconds = half_life_days * 24 * 60 * 60
+        self.related_weight = related_weight
+        self.history_limit = history_limit
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.generated = 0
+        self.skipped_cached = 0
+        self.failed = 0
+
+    def rank_concepts(self, db, class_doc: dict, exclude_lecture_id: str | None = None) -> list[dict]:
+        """
+        Past simulation concepts for a class, best candidates first.
+        """
+        class_id = class_doc["id"]
+        related_filters = [{field: class_doc[field]} for field in ("professor", "name") if class_doc.get(field)]
+        weights = {class_id: 1.0}
+        if related_filters:
+            for related in db.classes.find({"id": {"$ne": class_id}, "$or": related_filters}, {"id": 1}):
+                weights[related["id"]] = self.related_weight
+
+        lecture_weights = {
+            lecture["id"]: weights[lecture["class_id"]]
+            for lecture in db.lectures.find({"class_id": {"$in": list(weights)}}, {"id": 1, "class_id": 1})
+            if lecture["id"] != exclude_lecture_id
+        }
+        if not lecture_weights:
+            return []
+
+        now = time.time()
+        ranked: dict[str, dict] = {}
+        sims = (
+            db.simulations.find(
+                {"lecture_id": {"$in": list(lecture_weights)}},
+                {"concept": 1, "description": 1, "lecture_id": 1, "timestamp": 1},
+            )
+            .sort("timestamp", -1)
+            .limit(self.history_limit)
+        )
+        for sim in sims:
+            key = normalize_concept(sim.get("concept") or "")
+            if not key:
+                continue
+            age = max(0.0, now - (sim.get("timestamp") or now))
+            score = lecture_weights[sim["lecture_id"]] * 0.5 ** (age / self.half_life_seconds)
+            entry = ranked.setdefault(key, {"concept": sim["concept"], "description": sim.get("description"), "score": 0.0})
+            entry["score"] += score
+        return sorted(ranked.values(), key=lambda e: e["score"], reverse=True)
+
+    def schedule(self, db, class_doc: dict, lecture_id: str) -> None:
+        """
+        Starts prefetching for a class unless a prefetch for it is already running.
+        """
+        if db is None or self.max_concepts <= 0:
+            return
+        class_id = class_doc["id"]
+        running = self._tasks.get(class_id)
+        if running is not None and not running.done():
+            return
+        task = asyncio.create_task(self._prefetch(db, class_doc, lecture_id))
+        self._tasks[class_id] = task
+        task.add_done_callback(lambda t: self._tasks.pop(class_id, None) if self._tasks.get(class_id) is t else None)
+
+    async def _wait_for_capacity(self) -> None:
+        gemini = self.simulation.gemini
+        while gemini.gateway.is_saturated(gemini.model):
+            await asyncio.sleep(1.0)
+
+    async def _prefetch(self, db, class_doc: dict, lecture_id: str) -> None:
+        try:
+            candidates = await asyncio.to_thread(self.rank_concepts, db, class_doc, lecture_id)
+        except Exception as e:
+            print(f"Error ranking prefetch concepts for class {class_doc.get('id')}: {e}")
+            return
+
+        generated = 0
+        for candidate in candidates:
+            if generated >= self.max_concepts:
+                break
+            concept = candidate["concept"]
+            if await self.simulation.get_cached_simulation(db, concept):
+                self.skipped_cached += 1
+                continue
+            await self._wait_for_capacity()
+            description = candidate.get("description") or f"Interactive simulation of {concept}"
+            print(f"DEBUG: Prefetching simulation for '{concept}' (score {candidate['score']:.2f})")
+            code = await self.simulation.generate_simulation(
+                db,
+                concept,
+                description,
+                context=f"Recurring concept in {class_doc.get('name', 'this class')}",
+            )
+            generated += 1
+            if is_generation_error(code):
+                # Nothing is cached; the concept is tried again on the next lecture
+                self.failed += 1
+                continue
+            await self.simulation.cache_simulation(db, concept, description, code)
+            self.generated += 1
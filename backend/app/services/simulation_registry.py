@@ -0,0 +1,99 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from app.services.simulation import normalize_concept
+
+
+class LectureSimulationRegistry:
+    """
+    One simulation per (lecture, normalized concept).
+
+    The first request for a concept in a lecture runs its generation; later requests
+    from any path (chunk simulations, pipeline actions, mandatory fallbacks) wait for
+    that job, or get its result straight away once it is ready. Failed generations are
+    forgotten so the concept can be retried. Only the most recent `max_lectures`
+    lectures are kept in memory; ready simulations of older ones are reloaded from the
+    database with `load`.
+    """
+
+    def __init__(self, max_lectures: int = 256) -> None:
+        self.max_lectures = max_lectures
+        self._lectures: OrderedDict[str, dict[str, dict]] = OrderedDict()
+        self._loaded: set[str] = set()
+        self.generated = 0
+        self.reused = 0
+
+    def _entries(self, lecture_id: str) -> dict[str, dict]:
+        entries = self._lectures.get(lecture_id)
+        if entries is None:
+            entries = self._lectures[lecture_id] = {}
+            while len(self._lectures) > self.max_lectures:
+                evicted, _ = self._lectures.popitem(last=False)
+                self._loaded.discard(evicted)
+        else:
+            self._lectures.move_to_end(lecture_id)
+        return entries
+
+    def is_loaded(self, lecture_id: str) -> bool:
+        return lecture_id in self._loaded
+
+    def load(self, lecture_id: str, docs: list[dict]) -> None:
+        """
+        Registers simulations already stored as ready for a lecture.
+        """
+        entries = self._entries(lecture_id)
+        for doc in docs:
+            key = normalize_concept(doc.get("concept") or "")
+            if key and key not in entries and (doc.get("code_hash") or doc.get("code")):
+                result = {k: doc[k] for k in ("concept", "description", "code_hash", "asset_url", "code") if doc.get(k)}
+                entries[key] = {"future": None, "result": result}
+        self._loaded.add(lecture_id)
+
+    def get(self, lecture_id: str, concept: str) -> dict | None:
+        """
+        The ready simulation for a concept in a lecture, if there is one.
+        """
+        entry = self._lectures.get(lecture_id, {}).get(normalize_concept(concept))
+        return entry["result"] if entry else None
+
+    def has(self, lecture_id: str, concept: str) -> bool:
+        return normalize_concept(concept) in self._lectures.get(lecture_id, {})
+
+    async def run(self, lecture_id: str, concept: str, generate: Callable[[], Awaitable[dict | None]]) -> tuple[dict | None, bool]:
+        """
+        Returns (result, owner). `generate` is only called if the lecture has no job for
+        the concept yet; `owner` is True for that caller. A None result means failure.
+        """
+        key = normalize_concept(concept) or concept
+        entries = self._entries(lecture_id)
+        entry = entries.get(key)
+        if entry is not None:
+            self.reused += 1
+            if entry["result"] is not None:
+                return entry["result"], False
+            return await asyncio.shield(entry["future"]), False
+
+        future = asyncio.ensure_future(generate())
+        entry = entries[key] = {"future": future, "result": None}
+
+        def finished(f: asyncio.Future) -> None:
+            result = None if f.cancelled() or f.exception() is not None else f.result()
+            if result is None:
+                if entries.get(key) is entry:
+                    del entries[key]
+            else:
+                entry["result"] = result
+
+        future.add_done_callback(finished)
+        result = await asyncio.shield(future)
+        if result is not None:
+            self.generated += 1
+        return result, True
+
+    def stats(self) -> dict:
+        return {
+            "lectures": len(self._lectures),
+            "simulations": sum(len(entries) for entries in self._lectures.values()),
+            "generated": self.generated,
+            "reused": self.reused,
+        }
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+from app.services.simulation import SimulationService, is_generation_error, normalize_concept
+
+# Where concept names and descriptions live in collections that can seed a warm job
+QUERY_FIELDS = {
+    "concepts": ("keyword", "definition"),
+    "simulations": ("concept", "description"),
+}
+
+
+def concept_entries(items: list) -> list[dict]:
+    """
+    Normalizes a list of concept names or {"concept", "description"} dicts, dropping duplicates.
+    """
+    entries: dict[str, dict] = {}
+    for item in items:
+        if isinstance(item, str):
+            item = {"concept": item}
+        concept = (item.get("concept") or "").strip()
+        key = normalize_concept(concept)
+        if key and key not in entries:
+            entries[key] = {"concept": concept, "description": item.get("description")}
+    return list(entries.values())
+
+
+def load_concepts_file(path: str | Path) -> list[dict]:
+    """
+    Reads a JSON list (names or {"concept", "description"} objects) or a plain text file with one concept per line.
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    if Path(path).suffix == ".json":
+        return concept_entries(json.loads(text))
+    return concept_entries([line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")])
+
+
+def concepts_from_query(db, collection: str, query: dict | None = None, limit: int = 0) -> list[dict]:
+    if collection not in QUERY_FIELDS:
+        raise ValueError(f"Unsupported collection for warming: {collection}")
+    name_field, description_field = QUERY_FIELDS[collection]
+    cursor = db[collection].find(query or {}, {name_field: 1, description_field: 1}).limit(limit)
+    return concept_entries([{"concept": doc.get(name_field), "description": doc.get(description_field)} for doc in cursor])
+
+
+class RateLimiter:
+    """
+    Spaces out call starts to at most `per_minute` per minute.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class SimulationWarmJob:
+    """
+    Generates and caches simulations for a list of concepts with a bounded worker pool.
+
+    Finished concepts are checkpointed in the simulation_warm_jobs collection under
+    `job_id` (by default a hash of the concept list), so re-running the same list after
+    a restart skips them. Failed concepts are recorded but retried on the next run.
+    """
+
+    def __init__(
+        self,
+        simulation_service: SimulationService,
+        db,
+        concepts: list[dict],
+        job_id: str | None = None,
+        workers: int = 4,
+        rate_per_minute: float = 20.0,
+    ) -> None:
+        self.simulation = simulation_service
+        self.db = db
+        self.concepts = concepts
+        self.job_id = job_id or hashlib.sha256(
+            "\n".join(sorted(normalize_concept(c["concept"]) for c in concepts)).encode("utf-8")
+        ).hexdigest()[:16]
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate_per_minute)
+        self.status = "pending"
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.resumed = 0
+        self.generated = 0
+        self.skipped_cached = 0
+        self.failed: list[str] = []
+        self.in_progress: set[str] = set()
+
+    def _load_checkpoint(self) -> set[str]:
+        doc = self.db.simulation_warm_jobs.find_one({"_id": self.job_id}, {"done": 1})
+        return set(doc.get("done", [])) if doc else set()
+
+    def _checkpoint(self, key: str, ok: bool) -> None:
+        update = {"$set": {"status": self.status, "total": len(self.concepts), "updated_at": time.time()}}
+        if ok:
+            update["$addToSet"] = {"done": key}
+            update["$pull"] = {"failed": key}
+        else:
+            update["$addToSet"] = {"failed": key}
+        self.db.simulation_warm_jobs.update_one({"_id": self.job_id}, update, upsert=True)
+
+    def progress(self) -> dict:
+        completed = self.resumed + self.generated + self.skipped_cached
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        processed = self.generated + self.skipped_cached + len(self.failed)
+        remaining = len(self.concepts) - completed - len(self.failed)
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total": len(self.concepts),
+            "completed": completed,
+            "resumed": self.resumed,
+            "generated": self.generated,
+            "skipped_cached": self.skipped_cached,
+            "failed": list(self.failed),
+            "in_progress": sorted(self.in_progress),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(elapsed / processed * remaining, 1) if processed and self.status == "running" else None,
+        }
+
+    async def _warm(self, entry: dict) -> bool:
+        concept = entry["concept"]
+        if await self.simulation.get_cached_simulation(self.db, concept):
+            self.skipped_cached += 1
+            return True
+        await self.limiter.wait()
+        description = entry.get("description") or f"Interactive simulation of {concept}"
+        code = await self.simulation.generate_simulation(
+            self.db, concept, description, context=f"Cache warming job {self.job_id}"
+        )
+        if is_generation_error(code):
+            return False
+        await self.simulation.cache_simulation(self.db, concept, description, code)
+        self.generated += 1
+        return True
+
+    async def run(self, on_progress: Callable[[dict], Awaitable[None] | None] | None = None) -> dict:
+        self.status = "running"
+        self.started_at = time.time()
+        done = await asyncio.to_thread(self._load_checkpoint)
+        queue: asyncio.Queue[dict] = asyncio.Queue()
+        for entry in self.concepts:
+            if normalize_concept(entry["concept"]) in done:
+                self.resumed += 1
+            else:
+                queue.put_nowait(entry)
+        print(f"DEBUG: Warm job {self.job_id}: {queue.qsize()} to go, {self.resumed} already done")
+
+        async def worker():
+            while not queue.empty():
+                entry = queue.get_nowait()
+                key = normalize_concept(entry["concept"])
+                self.in_progress.add(entry["concept"])
+                try:
+                    ok = await self._warm(entry)
+                except Exception as e:
+                    print(f"Error warming simulation for '{entry['concept']}': {e}")
+                    ok = False
+                finally:
+                    self.in_progress.discard(entry["concept"])
+                if not ok:
+                    self.failed.append(entry["concept"])
+                try:
+                    await asyncio.to_thread(self._checkpoint, key, ok)
+                except Exception as e:
+                    print(f"Error checkpointing warm job {self.job_id}: {e}")
+                if on_progress:
+                    result = on_progress(self.progress())
+                    if asyncio.iscoroutine(result):
+                        await result
+
+        try:
+            await asyncio.gather(*[worker() for _ in range(self.workers)])
+            self.status = "completed" if not self.failed else "completed_with_errors"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        finally:
+            self.finished_at = time.time()
+            try:
+                await asyncio.to_thread(
+                    self.db.simulation_warm_jobs.update_one,
+                    {"_id": self.job_id},
+                    {"$set": {"status": self.status, "total": len(self.concepts), "updated_at": self.finished_at}},
+                    True,
+                )
+            except Exception as e:
+                print(f"Error checkpointing warm job {self.job_id}: {e}")
+        return self.progress()
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+
+    The first caller for a key starts the work; everyone who asks for the same key while
+    it is still running awaits that same future instead of starting another call. The
+    entry is dropped as soon as the work finishes, so later calls run fresh (and are
+    expected to hit whatever cache the work populated). If every waiter is cancelled
+    before the work finishes, the work is cancelled too.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Future] = {}
+        self._waiters: dict[asyncio.Future, int] = {}
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = future
+            future.add_done_callback(lambda f, k=key: self._forget(k, f))
+        else:
+            self.coalesced += 1
+        # Shield so one waiter being cancelled does not cancel the shared call for the others
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters[future] == 1 and not future.done():
+                # Last one out: nobody is left to use the result
+                self.abandoned += 1
+                future.cancel()
+            raise
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Mark the exception as retrieved even if every waiter has gone away
+            future.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
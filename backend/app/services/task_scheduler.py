@@ -0,0 +1,236 @@
+import asyncio
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable, Hashable
+
+PRIORITIES = {"critical": 0, "high": 1, "normal": 2, "low": 3}
+OVERFLOW_POLICIES = ("reject", "drop_lowest")
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "owner", "name", "keep_on_close", "fn", "args", "kwargs", "future")
+
+    def __init__(self, priority: int, seq: int, owner: Hashable | None, name: str, keep_on_close: bool, fn, args, kwargs) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.owner = owner
+        self.name = name
+        self.keep_on_close = keep_on_close
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class BackgroundScheduler:
+    """
+    Runs fire-and-forget background work with bounded concurrency and queueing.
+
+    Jobs start in priority order (critical, high, normal, low; FIFO within a class)
+    while the global cap, the per-owner cap (an owner is typically one websocket
+    connection) and the optional per-priority cap allow. The last `reserved_per_owner`
+    of an owner's slots only take critical and high jobs, so a connection's long
+    low-priority work can never hold every slot its transcript work needs. When the global or per-owner
+    queue is full, the job's priority class decides what happens: "reject" drops the
+    new job, "drop_lowest" evicts the newest queued job of a strictly lower priority
+    (or rejects if there is none). Every started task is referenced until it finishes
+    and its exception, if any, is logged.
+
+    `close_owner` ends an owner's work when its connection goes away: queued and running
+    jobs are cancelled, except those submitted with `keep_on_close` (work whose result
+    is persisted rather than only sent to the client).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        max_per_owner: int = 16,
+        max_queue: int = 512,
+        max_queue_per_owner: int = 128,
+        reserved_per_owner: int = 0,
+        priority_limits: dict[str, int] | None = None,
+        overflow: dict[str, str] | None = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_per_owner = max_per_owner
+        self.max_queue = max_queue
+        self.max_queue_per_owner = max_queue_per_owner
+        self.reserved_per_owner = max(0, min(reserved_per_owner, max_per_owner - 1))
+        self.priority_limits = {PRIORITIES[p]: n for p, n in (priority_limits or {}).items()}
+        self.overflow = {PRIORITIES[p]: policy for p, policy in (overflow or {}).items()}
+        for policy in self.overflow.values():
+            if policy not in OVERFLOW_POLICIES:
+                raise ValueError(f"Unknown overflow policy: {policy}")
+        self._queue: list[_Job] = []
+        self._seq = itertools.count()
+        self._running: dict[asyncio.Task, _Job] = {}
+        self._running_by_owner: dict[Hashable, int] = {}
+        self._running_by_priority: dict[int, int] = {}
+        self._queued_by_owner: dict[Hashable, int] = {}
+        self._closed_owners: set[Hashable] = set()
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.cancelled = 0
+
+    def submit(
+        self,
+        fn: Callable[..., Awaitable[Any]],
+        *args,
+        priority: str = "normal",
+        owner: Hashable | None = None,
+        name: str | None = None,
+        keep_on_close: bool = False,
+        **kwargs,
+    ) -> asyncio.Future | None:
+        """
+        Queues `fn(*args, **kwargs)`. Returns a future for its result, or None if the
+        job was rejected because the queue is full or its owner has been closed.
+        """
+        level = PRIORITIES[priority]
+        job = _Job(level, next(self._seq), owner, name or getattr(fn, "__name__", "task"), keep_on_close, fn, args, kwargs)
+        if owner in self._closed_owners and not keep_on_close:
+            return None
+        if not self._admit(job):
+            self.dropped += 1
+            print(f"DEBUG: Scheduler queue full, rejected {priority} task {job.name}")
+            return None
+        heapq.heappush(self._queue, job)
+        self._count(self._queued_by_owner, owner, 1)
+        self._pump()
+        return job.future
+
+    def _queue_full(self, owner: Hashable | None) -> bool:
+        if len(self._queue) >= self.max_queue:
+            return True
+        return owner is not None and self._queued_by_owner.get(owner, 0) >= self.max_queue_per_owner
+
+    def _admit(self, job: _Job) -> bool:
+        if not self._queue_full(job.owner):
+            return True
+        if self.overflow.get(job.priority, "reject") != "drop_lowest":
+            return False
+        # Per-owner overflow only evicts that owner's jobs
+        global_full = len(self._queue) >= self.max_queue
+        candidates = [
+            queued for queued in self._queue
+            if queued.priority > job.priority and (global_full or queued.owner == job.owner)
+        ]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda queued: (queued.priority, queued.seq))
+        self._remove_queued(victim)
+        victim.future.cancel()
+        self.dropped += 1
+        print(f"DEBUG: Scheduler queue full, dropped queued task {victim.name} for {job.name}")
+        return not self._queue_full(job.owner)
+
+    def close_owner(self, owner: Hashable) -> int:
+        """
+        Cancels the owner's queued and running jobs (except `keep_on_close` ones) and
+        rejects its new ones while any of its kept jobs are still running. Returns the
+        number of jobs cancelled.
+        """
+        cancelled = 0
+        for job in [queued for queued in self._queue if queued.owner == owner and not queued.keep_on_close]:
+            self._remove_queued(job)
+            job.future.cancel()
+            cancelled += 1
+        for task, job in list(self._running.items()):
+            if job.owner == owner and not job.keep_on_close:
+                task.cancel()
+                cancelled += 1
+        self.cancelled += cancelled
+        if owner in self._running_by_owner or owner in self._queued_by_owner:
+            self._closed_owners.add(owner)
+        return cancelled
+
+    def _release_owner(self, owner: Hashable | None) -> None:
+        if owner not in self._running_by_owner and owner not in self._queued_by_owner:
+            self._closed_owners.discard(owner)
+
+    def _remove_queued(self, job: _Job) -> None:
+        self._queue.remove(job)
+        heapq.heapify(self._queue)
+        self._count(self._queued_by_owner, job.owner, -1)
+
+    @staticmethod
+    def _count(counts: dict, key, delta: int) -> None:
+        if key is None:
+            return
+        value = counts.get(key, 0) + delta
+        if value:
+            counts[key] = value
+        else:
+            counts.pop(key, None)
+
+    def _can_start(self, job: _Job) -> bool:
+        if job.owner is not None:
+            owner_limit = self.max_per_owner
+            if job.priority > PRIORITIES["high"]:
+                owner_limit -= self.reserved_per_owner
+            if self._running_by_owner.get(job.owner, 0) >= owner_limit:
+                return False
+        limit = self.priority_limits.get(job.priority)
+        return limit is None or self._running_by_priority.get(job.priority, 0) < limit
+
+    def _pump(self) -> None:
+        blocked = []
+        while self._queue and len(self._running) < self.max_concurrency:
+            job = heapq.heappop(self._queue)
+            if job.future.cancelled():
+                self._count(self._queued_by_owner, job.owner, -1)
+                continue
+            if not self._can_start(job):
+                blocked.append(job)
+                continue
+            self._count(self._queued_by_owner, job.owner, -1)
+            self._start(job)
+        for job in blocked:
+            heapq.heappush(self._queue, job)
+
+    def _start(self, job: _Job) -> None:
+        task = asyncio.create_task(job.fn(*job.args, **job.kwargs), name=job.name)
+        self._running[task] = job
+        self._count(self._running_by_owner, job.owner, 1)
+        self._running_by_priority[job.priority] = self._running_by_priority.get(job.priority, 0) + 1
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        job = self._running.pop(task)
+        self._count(self._running_by_owner, job.owner, -1)
+        self._running_by_priority[job.priority] -= 1
+        self._release_owner(job.owner)
+        if task.cancelled():
+            job.future.cancel()
+        elif task.exception() is not None:
+            self.failed += 1
+            print(f"Error in background task {job.name}: {task.exception()}")
+            if not job.future.done():
+                job.future.set_exception(task.exception())
+                # Nobody is required to await the job future; don't warn about it
+                job.future.exception()
+        else:
+            self.completed += 1
+            if not job.future.done():
+                job.future.set_result(task.result())
+        self._pump()
+
+    def stats(self) -> dict:
+        names = {level: name for name, level in PRIORITIES.items()}
+        queued: dict[str, int] = {}
+        for job in self._queue:
+            queued[names[job.priority]] = queued.get(names[job.priority], 0) + 1
+        return {
+            "running": len(self._running),
+            "running_by_priority": {names[p]: n for p, n in self._running_by_priority.items() if n},
+            "queued": queued,
+            "owners": len(set(self._running_by_owner) | set(self._queued_by_owner)),
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "cancelled": self.cancelled,
+        }
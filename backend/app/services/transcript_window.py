@@ -0,0 +1,97 @@
+import asyncio
+from typing import Awaitable, Callable
+
+SENTENCE_END = (".", "?", "!", "…")
+
+
+def merge_commits(messages: list[dict]) -> dict:
+    """
+    One transcript_commit covering several. It takes the chunk_id of the newest commit
+    with text (results attach to the latest transcript line, not an empty final marker)
+    and lists every merged id under chunk_ids.
+    """
+    if len(messages) == 1:
+        return messages[0]
+    latest = next((m for m in reversed(messages) if m.get("text", "").strip()), messages[-1])
+    return {
+        **messages[-1],
+        "chunk_id": latest.get("chunk_id"),
+        "chunk_ids": [m.get("chunk_id") for m in messages],
+        "text": " ".join(m.get("text", "").strip() for m in messages if m.get("text", "").strip()),
+        "previous_context": messages[0].get("previous_context", ""),
+        "is_final": any(m.get("is_final") for m in messages),
+    }
+
+
+class TranscriptWindow:
+    """
+    Merges a connection's small transcript commits into larger windows before they go
+    through the pipeline.
+
+    Commits are buffered per lecture. A window is flushed once it holds `min_chars` and
+    ends on a sentence boundary, once it reaches `max_chars`, on a final commit, or when
+    its oldest commit has waited `max_latency_seconds`. `min_chars` of 0 disables merging.
+    """
+
+    def __init__(
+        self,
+        on_flush: Callable[[dict], Awaitable[None]],
+        min_chars: int = 160,
+        max_chars: int = 1200,
+        max_latency_seconds: float = 3.0,
+    ) -> None:
+        self.on_flush = on_flush
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.max_latency_seconds = max_latency_seconds
+        self._windows: dict[str, dict] = {}
+        self.commits = 0
+        self.flushes = 0
+
+    async def add(self, message: dict) -> None:
+        self.commits += 1
+        if self.min_chars <= 0:
+            self.flushes += 1
+            await self.on_flush(message)
+            return
+        lecture_id = message.get("lecture_id", "default_lecture")
+        window = self._windows.get(lecture_id)
+        if window is None:
+            window = self._windows[lecture_id] = {"messages": [], "chars": 0, "timer": None}
+            window["timer"] = asyncio.create_task(self._flush_later(lecture_id, window))
+        text = message.get("text", "").strip()
+        window["messages"].append(message)
+        window["chars"] += len(text)
+        if (
+            message.get("is_final")
+            or window["chars"] >= self.max_chars
+            or (window["chars"] >= self.min_chars and text.endswith(SENTENCE_END))
+        ):
+            await self.flush(lecture_id)
+
+    async def _flush_later(self, lecture_id: str, window: dict) -> None:
+        await asyncio.sleep(self.max_latency_seconds)
+        if self._windows.get(lecture_id) is window:
+            window["timer"] = None
+            await self.flush(lecture_id)
+
+    async def flush(self, lecture_id: str) -> None:
+        window = self._windows.pop(lecture_id, None)
+        if window is None:
+            return
+        if window["timer"] is not None:
+            window["timer"].cancel()
+        self.flushes += 1
+        await self.on_flush(merge_commits(window["messages"]))
+
+    def close(self) -> list[dict]:
+        """
+        Stops all timers and returns the merged commits that were still buffered.
+        """
+        pending = []
+        for window in self._windows.values():
+            if window["timer"] is not None:
+                window["timer"].cancel()
+            pending.append(merge_commits(window["messages"]))
+        self._windows.clear()
+        return pending
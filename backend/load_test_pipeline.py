@@ -0,0 +1,100 @@
+"""
+Offline load test for the websocket transcript pipeline.
+
+Drives process_transcript_message for several concurrent lectures against the replay
+LLM backend, so the whole fan-out (pipeline decision, simulations, flashcards, quizzes,
+reference searches) runs without network access or API cost.
+
+Record a session first by running the server with llm_backend=record, then e.g.:
+
+    llm_replay_latency=lognormal:1.5:0.5 python load_test_pipeline.py transcript.txt --lectures 10
+
+Requests that were never recorded fail like a provider error unless llm_replay_miss_text is set.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# Add backend to path so we can import app
+sys.path.append(str(Path(__file__).parent))
+
+os.environ.setdefault("llm_backend", "replay")
+os.environ.setdefault("vector_db_url", "")
+
+from app import main  # noqa: E402
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = Counter()
+        self.bytes_sent = 0
+
+    async def send_text(self, data):
+        self.frames[main.json.loads(data).get("type")] += 1
+        self.bytes_sent += len(data)
+
+
+class OfflineYouTube:
+    def search(self, query, limit=5):
+        return [{"title": f"Video about {query}", "url": f"https://example.com/{abs(hash(query))}/{i}"} for i in range(limit)]
+
+
+async def run_lecture(lecture_id: str, chunks: list[str], websocket: "main.OutboundChannel", interval: float):
+    for i, text in enumerate(chunks):
+        await main.process_transcript_message(websocket, {
+            "type": "transcript_commit",
+            "lecture_id": lecture_id,
+            "chunk_id": f"{lecture_id}_chunk_{i}",
+            "text": text,
+            "is_final": i == len(chunks) - 1,
+        })
+        await asyncio.sleep(interval)
+
+
+async def run(args):
+    main.youtube_client = OfflineYouTube()
+    chunks = [line.strip() for line in Path(args.transcript).read_text(encoding="utf-8").splitlines() if line.strip()]
+    socket = FakeWebSocket()
+    # Same outbound path as a real connection, so frame counts reflect coalescing
+    websocket = main.OutboundChannel(socket, tick_seconds=main.settings.ws_coalesce_seconds)
+
+    started = time.monotonic()
+    baseline = asyncio.all_tasks()
+    await asyncio.gather(*[
+        run_lecture(f"load_lecture_{n}", chunks, websocket, args.interval)
+        for n in range(args.lectures)
+    ])
+    # Wait for the background work spawned by the pipeline to drain
+    while True:
+        pending = asyncio.all_tasks() - baseline - {asyncio.current_task()}
+        if pending:
+            await asyncio.wait(pending)
+        elif main.background_scheduler.stats()["queued"]:
+            await asyncio.sleep(0)
+        else:
+            break
+    elapsed = time.monotonic() - started
+
+    print(f"--- {args.lectures} lectures x {len(chunks)} chunks in {elapsed:.2f}s ---")
+    print(f"Chunks/s: {args.lectures * len(chunks) / elapsed:.2f}")
+    print(f"Frames sent: {dict(socket.frames)} ({socket.bytes_sent} bytes, {websocket.frames_in} before coalescing)")
+    print(f"Background tasks: {main.background_scheduler.stats()}")
+    backend = main.llm_backend_client
+    if isinstance(backend, main.ReplayClient):
+        print(f"Replay hits: {backend.hits}, misses: {backend.misses}")
+    for prompt_name, models in main.llm_metrics.snapshot()["prompts"].items():
+        for model, stats in models.items():
+            latency = stats["latency_seconds"]
+            print(f"{prompt_name:28} {model:26} calls={stats['calls']:5} p50={latency['p50']} p95={latency['p95']} outcomes={stats['outcomes']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("transcript", help="Text file with one transcript commit per line")
+    parser.add_argument("--lectures", type=int, default=5, help="Concurrent lectures to simulate")
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds between commits within a lecture")
+    asyncio.run(run(parser.parse_args()))
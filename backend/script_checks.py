@@ -0,0 +1,21 @@
+import sys
+
+failures = []
+
+
+def check(ok: bool, message: str):
+    """
+    Prints a ✅/❌ line for one expectation of a test script and remembers failures.
+    """
+    print(f"{'✅' if ok else '❌'} {message}")
+    if not ok:
+        failures.append(message)
+
+
+def finish():
+    """
+    Ends a test script with exit status 1 if any check failed.
+    """
+    if failures:
+        print(f"\n{len(failures)} check(s) failed")
+        sys.exit(1)
@@ -0,0 +1,147 @@
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add backend to path so we can import app
+sys.path.append(str(Path(__file__).parent))
+# The Gemini client is never called here, but the app needs a key to start
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from fastapi.testclient import TestClient
+
+from app import main as app_main
+from app.services.auth import create_access_token
+from app.services.task_scheduler import BackgroundScheduler
+from script_checks import check, finish
+
+
+class FakeCursor(list):
+    def sort(self, field, direction):
+        return FakeCursor(sorted(self, key=lambda doc: doc.get(field) or 0, reverse=direction < 0))
+
+    def limit(self, n):
+        return FakeCursor(self[:n] if n else self)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query=None, projection=None):
+        query = query or {}
+        return FakeCursor(dict(doc) for doc in self.docs if all(doc.get(k) == v for k, v in query.items()))
+
+    def find_one(self, query=None, projection=None):
+        return next(iter(self.find(query)), None)
+
+    def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    def insert_many(self, docs):
+        self.docs.extend(dict(doc) for doc in docs)
+
+    def update_one(self, query, update, upsert=False):
+        pass
+
+
+class SlowTranscripts(FakeCollection):
+    """
+    Holds the insert of one chunk until the test lets it through.
+    """
+
+    def __init__(self, slow_chunk_id: str):
+        super().__init__()
+        self.slow_chunk_id = slow_chunk_id
+        self.entered = threading.Event()
+        self.proceed = threading.Event()
+
+    def insert_one(self, doc):
+        if doc.get("chunk_id") == self.slow_chunk_id:
+            self.entered.set()
+            self.proceed.wait(5)
+        super().insert_one(doc)
+
+
+class FakeDB:
+    def __init__(self, transcripts: FakeCollection):
+        self.transcripts = transcripts
+        self.lectures = FakeCollection()
+        self.concepts = FakeCollection()
+        self.simulations = FakeCollection()
+
+
+class FakePipeline:
+    """
+    Stands in for PipelineService: one new concept per chunk, no LLM call.
+    """
+
+    async def process_chunk(self, text, previous_context, lecture_id, existing_concepts, on_partial=None):
+        keyword = text.split()[0]
+        return {
+            "concepts": [{"id": f"c_{keyword}", "keyword": keyword, "definition": text, "stem_concept": True}],
+            "simulations": [],
+            "quizzes": [],
+            "flashcards": [],
+            "video_requests": [],
+            "text_reference_requests": [],
+        }
+
+
+class ClosingScheduler(BackgroundScheduler):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.owner_closed = threading.Event()
+
+    def close_owner(self, owner):
+        cancelled = super().close_owner(owner)
+        self.owner_closed.set()
+        return cancelled
+
+
+def commit(chunk_id: str, text: str) -> dict:
+    return {"type": "transcript_commit", "lecture_id": "lecture_disconnect", "chunk_id": chunk_id, "text": text}
+
+
+def test_disconnect_keeps_queued_and_waiting_chunks():
+    print("--- Disconnect while chunks are persisting, waiting their turn and queued ---")
+    transcripts = SlowTranscripts("chunk_a")
+    # Two running chunks per connection: A persists, B waits for A's transcript turn, C is queued
+    scheduler = ClosingScheduler(max_concurrency=64, max_per_owner=2)
+    app_main.settings.transcript_window_min_chars = 0
+    app_main.pipeline_service = FakePipeline()
+    app_main.background_scheduler = scheduler
+
+    with TestClient(app_main.app) as client:
+        app_main.db = FakeDB(transcripts)
+        token = create_access_token({"sub": "user_disconnect"})
+        with client.websocket_connect(f"/ws/client_disconnect?token={token}") as websocket:
+            websocket.send_text(json.dumps(commit("chunk_a", "alpha opens the lecture")))
+            check(transcripts.entered.wait(5), "chunk A reaches persist_transcript")
+            websocket.send_text(json.dumps(commit("chunk_b", "beta follows")))
+            websocket.send_text(json.dumps(commit("chunk_c", "gamma closes")))
+            time.sleep(0.2)
+            check(scheduler.stats()["queued"] == {"critical": 1}, "chunk C is queued behind A and B")
+        check(scheduler.owner_closed.wait(5), "the disconnect closes the connection's work")
+
+        transcripts.proceed.set()
+        deadline = time.monotonic() + 5
+        while len(transcripts.docs) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        stored = [doc["chunk_id"] for doc in transcripts.docs]
+        check(stored == ["chunk_a", "chunk_b", "chunk_c"], f"every chunk's text is stored, in order (got {stored})")
+        concepts = sorted(doc["keyword"] for doc in app_main.db.concepts.docs)
+        check(concepts == ["alpha", "beta", "gamma"], f"every chunk's concepts are stored (got {concepts})")
+        check(scheduler.stats()["cancelled"] == 0, "no transcript job is cancelled")
+
+
+def main():
+    test_disconnect_keeps_queued_and_waiting_chunks()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,7 @@ from app.services.pipeline import PipelineService
 
 # Mock classes
 class MockGemini:
-    async def generate_json_async(self, prompt):
+    async def generate_json_async(self, prompt, schema=None, prompt_name=None):
         return {
             "actions": [
                 {
@@ -0,0 +1,92 @@
+import json
+import sys
+from pathlib import Path
+
+# Add backend to path so we can import app
+sys.path.append(str(Path(__file__).parent))
+
+from app.services.json_stream import JsonArrayStreamParser
+from script_checks import check, finish
+
+ACTIONS = [
+    {"type": "concept", "name": "Dijkstra's \"shortest\" path", "note": "uses a {priority} queue [heap]"},
+    {"type": "quiz", "question": "Escaped \\\\ backslash and \\n newline?", "options": ["a]", "{b"]},
+    {"type": "search", "query": "unicode é and \\u00e9 escapes"},
+]
+RESPONSE = "```json\n" + json.dumps({"actions": ACTIONS}, indent=2) + "\n```"
+
+
+def parse(pieces: list[str], key: str = "actions") -> tuple[list, JsonArrayStreamParser]:
+    parser = JsonArrayStreamParser(key)
+    elements = []
+    for piece in pieces:
+        elements.extend(parser.feed(piece))
+    return elements, parser
+
+
+def split_at(text: str, *offsets: int) -> list[str]:
+    bounds = [0, *offsets, len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def test_every_split_point():
+    print("--- Response split in two at every offset ---")
+    bad = [
+        offset for offset in range(1, len(RESPONSE))
+        if parse(split_at(RESPONSE, offset))[0] != ACTIONS
+    ]
+    check(not bad, f"every two-piece split yields all elements (failed at {bad[:5]})")
+
+
+def test_split_mid_string():
+    print("--- Split inside a string containing brackets and quotes ---")
+    for needle in ('{priority', '[heap', ']"', '{b"', '\\"shortest'):
+        offset = RESPONSE.index(needle) + 1
+        elements, _ = parse(split_at(RESPONSE, offset))
+        check(elements == ACTIONS, f"split after {needle[:1]!r} in {needle!r}")
+
+
+def test_split_mid_escape():
+    print("--- Split between a backslash and the character it escapes ---")
+    offsets = [i + 1 for i, ch in enumerate(RESPONSE) if ch == "\\"]
+    check(len(offsets) >= 4, "the response contains escapes to split")
+    for offset in offsets:
+        elements, _ = parse(split_at(RESPONSE, offset))
+        if elements != ACTIONS:
+            check(False, f"split after the backslash at {offset}: {RESPONSE[offset - 5:offset + 5]!r}")
+            return
+    check(True, "every split right after a backslash yields all elements")
+
+
+def test_one_character_at_a_time():
+    print("--- Response fed one character at a time ---")
+    parser = JsonArrayStreamParser("actions")
+    seen_at = []
+    for i, ch in enumerate(RESPONSE):
+        for element in parser.feed(ch):
+            seen_at.append((i, element))
+    check([element for _, element in seen_at] == ACTIONS, "all elements arrive in order")
+    check(all(RESPONSE[i] == "}" for i, _ in seen_at), "each element is emitted on its closing brace")
+    check(parser.done, "the parser stops at the end of the array")
+    check(parser.feed('{"extra": 1}') == [], "text after the array is ignored")
+
+
+def test_bare_array():
+    print("--- Bare top-level array split mid-string ---")
+    text = json.dumps(ACTIONS)
+    offset = text.index("backslash") + 3
+    elements, parser = parse(split_at(text, offset, offset + 1))
+    check(elements == ACTIONS and parser.done, "a bare array is parsed across the split")
+
+
+def main():
+    test_every_split_point()
+    test_split_mid_string()
+    test_split_mid_escape()
+    test_one_character_at_a_time()
+    test_bare_array()
+    finish()
+
+
+if __name__ == "__main__":
+    main()
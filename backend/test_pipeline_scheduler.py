@@ -0,0 +1,101 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add backend to path so we can import app
+sys.path.append(str(Path(__file__).parent))
+
+from app.services.task_scheduler import BackgroundScheduler
+from script_checks import check, finish
+
+
+async def test_critical_starts_while_low_saturates_owner():
+    print("--- Critical work while one connection's simulations fill its slots ---")
+    scheduler = BackgroundScheduler(max_concurrency=64, max_per_owner=4, reserved_per_owner=1)
+    release = asyncio.Event()
+
+    async def simulation():
+        await release.wait()
+
+    async def transcript():
+        return time.monotonic()
+
+    for _ in range(6):
+        scheduler.submit(simulation, priority="low", owner="ws1")
+    await asyncio.sleep(0)
+    check(scheduler.stats()["running_by_priority"] == {"low": 3}, "low work stops short of the reserved slot")
+
+    submitted_at = time.monotonic()
+    try:
+        started_at = await asyncio.wait_for(scheduler.submit(transcript, priority="critical", owner="ws1"), 1.0)
+    except TimeoutError:
+        started_at = None
+    check(started_at is not None and started_at - submitted_at < 0.1, "critical work starts without waiting for the simulations")
+
+    release.set()
+    await asyncio.sleep(0.01)
+    check(scheduler.stats()["completed"] == 7, "the queued simulations still run afterwards")
+
+async def test_priority_order():
+    print("--- Queued jobs start by priority, FIFO within a priority ---")
+    scheduler = BackgroundScheduler(max_concurrency=1)
+    started = []
+    gate = asyncio.Event()
+
+    async def blocker():
+        await gate.wait()
+
+    async def job(label):
+        started.append(label)
+
+    scheduler.submit(blocker, priority="low")
+    await asyncio.sleep(0)
+    futures = [
+        scheduler.submit(job, "low-1", priority="low"),
+        scheduler.submit(job, "normal", priority="normal"),
+        scheduler.submit(job, "low-2", priority="low"),
+        scheduler.submit(job, "critical", priority="critical"),
+        scheduler.submit(job, "high", priority="high"),
+    ]
+    gate.set()
+    await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+    check(started == ["critical", "high", "normal", "low-1", "low-2"], f"start order follows priority (got {started})")
+
+
+async def test_close_owner_cancels_but_keeps_persisted_work():
+    print("--- Closing a connection cancels its work except keep_on_close jobs ---")
+    scheduler = BackgroundScheduler(max_concurrency=64, max_per_owner=2)
+    gate = asyncio.Event()
+
+    async def work():
+        await gate.wait()
+        return "done"
+
+    running = scheduler.submit(work, priority="low", owner="ws1")
+    kept = scheduler.submit(work, priority="critical", owner="ws1", keep_on_close=True)
+    queued = scheduler.submit(work, priority="low", owner="ws1")
+    other = scheduler.submit(work, priority="low", owner="ws2")
+    await asyncio.sleep(0)
+
+    cancelled = scheduler.close_owner("ws1")
+    check(cancelled == 2, f"the running and the queued job are cancelled (got {cancelled})")
+    check(scheduler.submit(work, owner="ws1") is None, "new work for the closed connection is rejected")
+
+    gate.set()
+    await asyncio.sleep(0.01)
+    check(running.cancelled() and queued.cancelled(), "their futures are cancelled")
+    check(kept.done() and not kept.cancelled() and kept.result() == "done", "the keep_on_close job finishes")
+    check(other.done() and other.result() == "done", "another connection's work is untouched")
+    check(scheduler.stats()["owners"] == 0, "no owner is left behind")
+
+
+async def main():
+    await test_critical_starts_while_low_saturates_owner()
+    await test_priority_order()
+    await test_close_owner_cancels_but_keeps_persisted_work()
+    finish()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Add backend to path so we can import app
+sys.path.append(str(Path(__file__).parent))
+
+from app.services.lecture_sequencer import LectureSequencer
+from script_checks import check, finish
+
+STAGES = ("transcript", "commit")
+
+
+async def chunk(sequencer: LectureSequencer, ticket: int, llm_delay: float, applied: list):
+    try:
+        # The "LLM call" runs outside the stage; only the commit is ordered
+        await asyncio.sleep(llm_delay)
+        await sequencer.wait_turn("l1", ticket, "commit")
+        applied.append(ticket)
+        sequencer.release("l1", ticket, "commit")
+    finally:
+        sequencer.leave("l1", ticket)
+
+
+async def test_out_of_order_completion():
+    print("--- Chunks whose LLM calls finish out of order ---")
+    sequencer = LectureSequencer(STAGES)
+    applied = []
+    tickets = [sequencer.enter("l1") for _ in range(4)]
+    check(tickets == [0, 1, 2, 3], "tickets are handed out in arrival order")
+    check(sequencer.is_turn("l1", 0, "commit") and not sequencer.is_turn("l1", 1, "commit"), "only the first ticket holds the turn")
+
+    # Latest chunk finishes first, the first chunk last
+    delays = [0.04, 0.03, 0.02, 0.01]
+    await asyncio.gather(*(chunk(sequencer, ticket, delay, applied) for ticket, delay in zip(tickets, delays)))
+    check(applied == [0, 1, 2, 3], f"commits are applied in arrival order (got {applied})")
+    check(sequencer.stats() == {"lectures": 0, "chunks_in_flight": 0}, "the finished lecture is forgotten")
+
+
+async def test_cancelled_ticket_unblocks_successor():
+    print("--- A cancelled chunk does not block the next one ---")
+    sequencer = LectureSequencer(STAGES)
+    applied = []
+    first = sequencer.enter("l1")
+    second = sequencer.enter("l1")
+
+    stuck = asyncio.create_task(chunk(sequencer, first, 10.0, applied))
+    successor = asyncio.create_task(chunk(sequencer, second, 0.0, applied))
+    await asyncio.sleep(0.01)
+    check(not successor.done(), "the second chunk waits for the first one's turn")
+
+    stuck.cancel()
+    try:
+        await asyncio.wait_for(successor, 1.0)
+    except TimeoutError:
+        pass
+    check(successor.done() and applied == [second], "the second chunk commits once the first is cancelled")
+    check(sequencer.stats()["chunks_in_flight"] == 0, "no chunk is left in flight")
+
+
+async def test_leave_while_waiting():
+    print("--- A chunk cancelled while waiting for its turn ---")
+    sequencer = LectureSequencer(STAGES)
+    applied = []
+    tickets = [sequencer.enter("l1") for _ in range(3)]
+    release_first = asyncio.Event()
+
+    async def slow_first():
+        try:
+            await sequencer.wait_turn("l1", tickets[0], "commit")
+            await release_first.wait()
+            applied.append(tickets[0])
+            sequencer.release("l1", tickets[0], "commit")
+        finally:
+            sequencer.leave("l1", tickets[0])
+
+    first = asyncio.create_task(slow_first())
+    waiting = asyncio.create_task(chunk(sequencer, tickets[1], 0.0, applied))
+    last = asyncio.create_task(chunk(sequencer, tickets[2], 0.0, applied))
+    await asyncio.sleep(0.01)
+    waiting.cancel()
+    await asyncio.sleep(0.01)
+    check(not last.done(), "the last chunk still waits for the first")
+
+    release_first.set()
+    await asyncio.wait_for(asyncio.gather(first, last), 1.0)
+    check(applied == [tickets[0], tickets[2]], f"the cancelled waiter's turn is skipped (got {applied})")
+    check(sequencer.stats()["lectures"] == 0, "the lecture is forgotten")
+
+
+async def main():
+    await test_out_of_order_completion()
+    await test_cancelled_ticket_unblocks_successor()
+    await test_leave_while_waiting()
+    finish()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add backend to path so we can import app
+sys.path.append(str(Path(__file__).parent))
+
+from app.config import LLMCallPolicy
+from app.services.gemini import GeminiClient
+from app.services.simulation import SimulationService
+from app.services.simulation_artifacts import SimulationArtifactStore, code_hash
+from app.services.simulation_prefetch import SimulationPrefetcher
+from app.services.simulation_warmer import SimulationWarmJob
+from script_checks import check, finish
+
+
+class FailingModels:
+    """
+    Stands in for client.aio.models: every request times out, like an overloaded provider.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content(self, **kwargs):
+        self.calls += 1
+        raise TimeoutError("slow provider")
+
+
+class FakeGateway:
+    def __init__(self, models):
+        self.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+
+    def is_saturated(self, model: str) -> bool:
+        return False
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        yield 0.0
+
+
+class FakeCollection:
+    def __init__(self, docs=None):
+        self.docs = list(docs or [])
+        self.writes = []
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([doc for doc in self.docs if matches(doc, query or {})])
+
+    def find_one(self, query=None, projection=None):
+        return next(iter(self.find(query)), None)
+
+    def update_one(self, query, update, upsert=False):
+        self.writes.append((query, update))
+
+    def delete_many(self, query):
+        self.writes.append((query, None))
+
+
+class FailingArtifacts(FakeCollection):
+    """
+    A simulation_artifacts collection whose writes fail, like a primary stepping down.
+    """
+
+    def update_one(self, query, update, upsert=False):
+        raise ConnectionError("write failed")
+
+
+class FakeCursor(list):
+    def sort(self, field, direction):
+        return FakeCursor(sorted(self, key=lambda doc: doc.get(field) or 0, reverse=direction < 0))
+
+    def limit(self, n):
+        return FakeCursor(self[:n] if n else self)
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, cond in query.items():
+        if field == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict) and "$in" in cond:
+            if doc.get(field) not in cond["$in"]:
+                return False
+        elif isinstance(cond, dict) and "$ne" in cond:
+            if doc.get(field) == cond["$ne"]:
+                return False
+        elif doc.get(field) != cond:
+            return False
+    return True
+
+
+class FakeDB:
+    def __init__(self, **collections):
+        self.collections = collections
+
+    def __getattr__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+def failing_service():
+    models = FailingModels()
+    gemini = GeminiClient(
+        api_key="test",
+        model="test-model",
+        gateway=FakeGateway(models),
+        default_policy=LLMCallPolicy(deadline_seconds=5, attempt_timeout_seconds=1, max_retries=0),
+    )
+    service = SimulationService(gemini, runtime_url="http://127.0.0.1:8000/static/runtime.css")
+    # An empty, loaded index keeps cache lookups in memory
+    service.index.load([])
+    return service, models
+
+
+async def test_warm_job_does_not_cache_failures():
+    print("--- Warm job with a failing model ---")
+    service, models = failing_service()
+    db = FakeDB()
+    job = SimulationWarmJob(service, db, [{"concept": "Breadth-First Search"}], workers=1, rate_per_minute=0)
+    progress = await job.run()
+
+    check(models.calls == 1, "the model was called")
+    check(progress["failed"] == ["Breadth-First Search"], "the concept is reported as failed")
+    check(progress["generated"] == 0, "nothing is counted as generated")
+    check(not db.simulation_cache.writes, "nothing is written to simulation_cache")
+    check(len(service.index) == 0, "nothing is added to the cache index")
+
+
+async def test_prefetch_does_not_cache_failures():
+    print("--- Prefetch with a failing model ---")
+    service, models = failing_service()
+    db = FakeDB(
+        classes=FakeCollection([{"id": "c1", "name": "Algorithms"}]),
+        lectures=FakeCollection([{"id": "l1", "class_id": "c1"}, {"id": "l2", "class_id": "c1"}]),
+        simulations=FakeCollection([
+            {"concept": "Breadth-First Search", "description": "Graph traversal", "lecture_id": "l1", "timestamp": 1},
+        ]),
+    )
+    prefetcher = SimulationPrefetcher(service, max_concepts=5)
+    prefetcher.schedule(db, {"id": "c1", "name": "Algorithms"}, "l2")
+    await asyncio.gather(*prefetcher._tasks.values())
+
+    check(models.calls == 1, "the model was called")
+    check(prefetcher.failed == 1 and prefetcher.generated == 0, "the prefetch is counted as failed")
+    check(not db.simulation_cache.writes, "nothing is written to simulation_cache")
+    check(len(service.index) == 0, "nothing is added to the cache index")
+    check(await service.get_cached_simulation(db, "Breadth-First Search") is None, "a later lecture gets a cache miss")
+
+
+async def test_failed_artifact_write_keeps_inline_code():
+    print("--- Artifact store whose writes fail ---")
+    service, _ = failing_service()
+    service.artifacts = SimulationArtifactStore(FailingArtifacts())
+    html = "<!DOCTYPE html><html><body>BFS</body></html>"
+    db = FakeDB(simulation_cache=FakeCollection([{"concept": "Breadth-First Search", "code": html}]))
+
+    loaded = service._load_cache_index(db)
+    check(not db.simulation_cache.writes, "the inline HTML of an old cache entry is not unset")
+    check(loaded == 0, "the entry is left out of the index until it can be moved")
+
+    await service.cache_simulation(db, "Depth-First Search", "Graph traversal", html)
+    check(not db.simulation_cache.writes, "a new entry is not cached without its artifact")
+    check(service.artifacts.get(code_hash(html)) is None, "the unstored artifact is not served from memory")
+    check(len(service.index) == 0, "nothing is added to the cache index")
+
+
+async def main():
+    await test_warm_job_does_not_cache_failures()
+    await test_prefetch_does_not_cache_failures()
+    await test_failed_artifact_write_keeps_inline_code()
+    finish()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Pre-populates simulation_cache for a list of concepts, e.g. a whole syllabus overnight.
+
+    python warm_simulation_cache.py syllabus.txt --workers 4 --rate 20
+    python warm_simulation_cache.py --collection concepts --filter '{"lecture_id": "lecture_123"}'
+
+Concept files are plain text (one concept per line, # for comments) or a JSON list of
+names / {"concept", "description"} objects. Progress is checkpointed in MongoDB, so
+re-running the same command after an interruption resumes where it stopped.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Add backend to path so we can import app
+sys.path.append(str(Path(__file__).parent))
+
+from app import main  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.services.simulation_warmer import SimulationWarmJob, concepts_from_query, load_concepts_file  # noqa: E402
+
+
+def report(progress: dict):
+    eta = f", eta {progress['eta_seconds']:.0f}s" if progress["eta_seconds"] is not None else ""
+    print(
+        f"[{progress['completed']}/{progress['total']}] generated={progress['generated']} "
+        f"cached={progress['skipped_cached']} failed={len(progress['failed'])}{eta}"
+    )
+
+
+async def run(args):
+    if main.db is None:
+        print("ERROR: mongo_connection_string not found in settings.")
+        return 1
+
+    if args.concepts_file:
+        concepts = load_concepts_file(args.concepts_file)
+    else:
+        concepts = concepts_from_query(main.db, args.collection, json.loads(args.filter), args.limit)
+    if not concepts:
+        print("No concepts to warm.")
+        return 1
+
+    await main.simulation_service.load_cache_index(main.db)
+    job = SimulationWarmJob(
+        main.simulation_service,
+        main.db,
+        concepts,
+        job_id=args.job_id,
+        workers=args.workers,
+        rate_per_minute=args.rate,
+    )
+    print(f"--- Warm job {job.job_id}: {len(concepts)} concepts ---")
+    result = await job.run(on_progress=report)
+    print(f"--- {result['status']} in {result['elapsed_seconds']}s ---")
+    for concept in result["failed"]:
+        print(f"FAILED: {concept}")
+    return 0 if not result["failed"] else 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("concepts_file", nargs="?", help="Text or JSON file with concepts to warm")
+    parser.add_argument("--collection", default="concepts", help="Collection to read concepts from when no file is given (concepts or simulations)")
+    parser.add_argument("--filter", default="{}", help="MongoDB filter (JSON) for --collection")
+    parser.add_argument("--limit", type=int, default=0, help="Maximum documents to read from --collection")
+    parser.add_argument("--job-id", help="Checkpoint name; defaults to a hash of the concept list")
+    parser.add_argument("--workers", type=int, default=settings.simulation_warm_workers)
+    parser.add_argument("--rate", type=float, default=settings.simulation_warm_rate_per_minute, help="Maximum generations started per minute")
+    sys.exit(asyncio.run(run(parser.parse_args())))
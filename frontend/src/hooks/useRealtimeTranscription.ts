@@ -97,6 +97,26 @@ export function useRealtimeTranscription(lectureId: string | null): UseRealtimeT
 
     const concepts = useMemo(() => Array.from(conceptsMap.values()), [conceptsMap]);
 
+    // Simulations arrive as a content hash + asset_url; fetch the HTML once per hash
+    const requestedSimulationCodeRef = useRef<Set<string>>(new Set());
+    useEffect(() => {
+        const baseUrl = (process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000").replace(/\/$/, "");
+        simulations.forEach((sim) => {
+            if (sim.code || !sim.asset_url || !sim.code_hash) return;
+            if (requestedSimulationCodeRef.current.has(sim.code_hash)) return;
+            requestedSimulationCodeRef.current.add(sim.code_hash);
+            fetch(`${baseUrl}${sim.asset_url}`)
+                .then(res => res.ok ? res.text() : Promise.reject(new Error(`HTTP ${res.status}`)))
+                .then(code => {
+                    setSimulations(prev => prev.map(s => s.code_hash === sim.code_hash && !s.code ? { ...s, code } : s));
+                })
+                .catch(err => {
+                    requestedSimulationCodeRef.current.delete(sim.code_hash);
+                    console.error("Failed to load simulation code:", err);
+                });
+        });
+    }, [simulations]);
+
     const setConcepts = useCallback((val: any[] | ((prev: any[]) => any[])) => {
         setConceptsMap(prevMap => {
             const prevArray = Array.from(prevMap.values());
@@ -114,6 +134,8 @@ export function useRealtimeTranscription(lectureId: string | null): UseRealtimeT
 
     const socketRef = useRef<WebSocket | null>(null);
     const backendSocketRef = useRef<WebSocket | null>(null);
+    // Last result sequence number seen per lecture, sent back as resume_from after a reconnect
+    const resultSeqRef = useRef<Record<string, { epoch: string; seq: number }>>({});
     const transcriptsRef = useRef<TranscriptionItem[]>([]);
     const lastCommittedTextRef = useRef<string | null>(null);
     const audioContextRef = useRef<AudioContext | null>(null);
@@ -171,16 +193,51 @@ export function useRealtimeTranscription(lectureId: string | null): UseRealtimeT
 
             backendSocket.onopen = () => {
                 console.log("✅ Connected to Backend WebSocket at 127.0.0.1:8000");
+                // Ask for whatever was produced while we were disconnected
+                Object.entries(resultSeqRef.current).forEach(([resumeLectureId, { epoch, seq }]) => {
+                    backendSocket.send(JSON.stringify({
+                        type: "resume",
+                        lecture_id: resumeLectureId,
+                        epoch,
+                        resume_from: seq
+                    }));
+                });
             };
 
             backendSocket.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
+                    if (data.type === "simulation_progress") {
+                        // Partial HTML streamed while a simulation is being generated
+                        setSimulations(prev => prev.map(s => {
+                            if (s.concept_id !== data.concept_id || s.status === "ready") return s;
+                            const partial: string = s.partial_code || "";
+                            if (partial.length !== data.offset) return s;
+                            return { ...s, partial_code: partial + data.delta };
+                        }));
+                        return;
+                    }
+                    if (data.type === "resume_gap") {
+                        // Missed results are gone from the server's buffer; they are still in the lecture details
+                        console.warn("Could not resume results for lecture", data.lecture_id);
+                        delete resultSeqRef.current[data.lecture_id];
+                        return;
+                    }
                     if (data.type === "pipeline_result") {
+                        if (typeof data.seq === "number") {
+                            const last = resultSeqRef.current[data.lecture_id];
+                            if (!last || last.epoch !== data.epoch || data.seq > last.seq) {
+                                resultSeqRef.current[data.lecture_id] = { epoch: data.epoch, seq: data.seq };
+                            }
+                        }
                         const results = data.results;
                         console.log("Pipeline Results received:", results);
                         if (results.concepts) {
-                            setConcepts(prev => [...prev, ...results.concepts]);
+                            // Replayed results may repeat concepts this client already has
+                            setConcepts(prev => [
+                                ...prev,
+                                ...results.concepts.filter((c: any) => !prev.some(p => p.id === c.id)),
+                            ]);
                         }
                         if (results.videos) {
                             setVideos(prev => {